@@ -0,0 +1,101 @@
+"""
+Copyright 2023 Benjamen R. Meyer
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Compare two sets of benchmark results generated by `run.sh`
+
+    python benchmarks/compare.py <baseline results> <new results>
+
+Each argument may either be a single results file or a directory of
+results files, in which case files with the same name are compared.
+"""
+import argparse
+import json
+import os
+import os.path
+import sys
+
+
+def load_results(location):
+    if os.path.isdir(location):
+        results = {}
+        for filename in sorted(os.listdir(location)):
+            if filename.endswith('.json'):
+                with open(os.path.join(location, filename), "rt") as json_input:
+                    results[filename[:-len('.json')]] = json.load(json_input)
+        return results
+
+    with open(location, "rt") as json_input:
+        return {
+            os.path.basename(location): json.load(json_input),
+        }
+
+
+def compare(baseline, candidate, threshold):
+    regressions = 0
+    for scenario, candidate_result in candidate.items():
+        baseline_result = baseline.get(scenario)
+        if baseline_result is None and len(baseline) == 1 and len(candidate) == 1:
+            baseline_result = list(baseline.values())[0]
+        if baseline_result is None:
+            print(f"{scenario}: no baseline")
+            continue
+        if baseline_result.get("version") != candidate_result.get("version"):
+            print(f"{scenario}: results versions differ; not comparing")
+            continue
+        if baseline_result.get("corpus") != candidate_result.get("corpus"):
+            print(f"{scenario}: ** WARNING ** corpus parameters differ")
+
+        print(f"{scenario}:")
+        for phase, candidate_phase in candidate_result["phases"].items():
+            baseline_phase = baseline_result["phases"].get(phase)
+            if baseline_phase is None or baseline_phase["seconds"] <= 0:
+                print(f"    {phase:<28} {candidate_phase['seconds']:>10.3f}s (new)")
+                continue
+            change = (
+                (candidate_phase["seconds"] - baseline_phase["seconds"]) /
+                baseline_phase["seconds"]
+            ) * 100.0
+            marker = ""
+            if change > threshold:
+                marker = " ** REGRESSION **"
+                regressions = regressions + 1
+            print(f"    {phase:<28} {baseline_phase['seconds']:>10.3f}s -> {candidate_phase['seconds']:>10.3f}s ({change:+.1f}%){marker}")
+    return regressions
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(
+        description="Compare TBDedup benchmark results"
+    )
+    argument_parser.add_argument('baseline', type=str)
+    argument_parser.add_argument('candidate', type=str)
+    argument_parser.add_argument(
+        '--threshold',
+        default=10.0,
+        type=float,
+        help='Percentage slow down of a phase that counts as a regression',
+    )
+    arguments = argument_parser.parse_args()
+
+    regressions = compare(
+        load_results(arguments.baseline),
+        load_results(arguments.candidate),
+        arguments.threshold,
+    )
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
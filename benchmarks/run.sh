@@ -0,0 +1,35 @@
+#!/bin/bash
+#
+# Run the standard benchmark scenarios and store the results by commit
+# so regressions can be compared across commits using compare.py
+#
+#   benchmarks/run.sh [results directory]
+#
+
+BENCH_DIR="$(cd "$(dirname "${0}")" && pwd)"
+RESULTS_BASE="${1:-${BENCH_DIR}/results}"
+REVISION="$(git -C "${BENCH_DIR}" rev-parse --short HEAD 2>/dev/null || echo "unknown")"
+RESULTS_DIR="${RESULTS_BASE}/${REVISION}"
+
+mkdir -p "${RESULTS_DIR}"
+
+function run_scenario()
+    {
+    local SCENARIO_NAME="${1}"
+    shift
+    printf "Running scenario ${SCENARIO_NAME}\n"
+    tb-dedup --log-config "${BENCH_DIR}/logging.ini" bench \
+        --output "${RESULTS_DIR}/${SCENARIO_NAME}.json" \
+        "${@}"
+    }
+
+# many small plain-text messages
+run_scenario small_messages --messages 50000 --files 20 --duplicate-ratio 0.25 --attachment-ratio 0.0
+# fewer messages carrying large attachments
+run_scenario large_attachments --messages 2000 --files 4 --duplicate-ratio 0.25 --attachment-ratio 0.8 --attachment-size 1048576
+# heavily duplicated data set, such as an Inbox copied into itself
+run_scenario heavy_duplicates --messages 20000 --files 20 --duplicate-ratio 0.9 --attachment-ratio 0.1
+# Content-Length based MBOX files
+run_scenario mboxcl2 --messages 20000 --files 10 --duplicate-ratio 0.25 --attachment-ratio 0.1 --mbox-format mboxcl2
+
+printf "Results stored in ${RESULTS_DIR}\n"
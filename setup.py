@@ -25,6 +25,8 @@ REQUIRES = [
     'PyQt5',
 ]
 EXTRA_REQUIRES = {
+    # finds the records of memory mapped files up front
+    'numpy': ['numpy'],
 }
 
 setup(
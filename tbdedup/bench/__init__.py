@@ -0,0 +1,210 @@
+"""
+Copyright 2023 Benjamen R. Meyer
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import datetime
+import logging
+import os
+import os.path
+import platform
+import tempfile
+import time as pytime
+
+from tbdedup import (
+    db,
+    dedup,
+    mbox,
+)
+from tbdedup.utils import (
+    json,
+)
+
+from . import corpus
+
+LOG = logging.getLogger(__name__)
+
+# format of the results file; bump when the layout changes so results
+# from different layouts are not compared
+results_version = 1
+
+phase_detect = "detect_mbox_type"
+phase_detect_sampled = "detect_mbox_type_sampled"
+phase_parse = "buildSummary"
+phase_hash = "hashing"
+phase_ingest = "db_ingest"
+phase_output = "output_writing"
+
+
+class Benchmark(object):
+    """
+    Time each stage of the deduplication separately over a corpus
+    """
+
+    def __init__(self, generator, use_disk_data_for_hash=False):
+        self.generator = generator
+        self.use_disk_data_for_hash = use_disk_data_for_hash
+        self.phases = {}
+
+    def __json__(self):
+        return {
+            "version": results_version,
+            "timestamp": datetime.datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "use_disk_data_for_hash": self.use_disk_data_for_hash,
+            "corpus": self.generator,
+            "phases": self.phases,
+        }
+
+    def record_phase(self, name, seconds, byte_count, message_count):
+        self.phases[name] = {
+            "seconds": seconds,
+            "bytes": byte_count,
+            "messages": message_count,
+            "mb_per_second": (
+                (byte_count / (1024 * 1024)) / seconds
+                if seconds > 0
+                else 0.0
+            ),
+            "messages_per_second": (
+                message_count / seconds
+                if seconds > 0
+                else 0.0
+            ),
+        }
+        LOG.info(f'[Bench] {name}: {seconds:0.03f} seconds')
+
+    def time_phase(self, name, fn, byte_count, message_count):
+        start = pytime.perf_counter()
+        result = fn()
+        self.record_phase(
+            name,
+            pytime.perf_counter() - start,
+            byte_count,
+            message_count,
+        )
+        return result
+
+    def run(self, work_directory):
+        mboxfiles = self.generator.generate(work_directory)
+        byte_count = self.generator.byte_count
+        message_count = self.generator.message_count
+
+        def detect():
+            for filename in mboxfiles:
+                mbox.Mailbox.detect_mbox_type(filename)
+
+        def detect_sampled():
+            for filename in mboxfiles:
+                mbox.Mailbox.detect_mbox_type_sampled(filename)
+
+        def parse():
+            return [
+                (filename, msg)
+                for filename in mboxfiles
+                for msg in mbox.Mailbox(None, filename).buildSummary()
+            ]
+
+        def hashing(messages):
+            return [
+                (
+                    filename,
+                    msg,
+                    msg.getHash(diskHash=False),
+                    msg.getMessageIDHeaderHash(),
+                    msg.getHash(diskHash=True),
+                )
+                for filename, msg in messages
+            ]
+
+        def ingest(storage, hashed_messages):
+            for filename, msg, msg_hash, msg_id_hash, disk_hash in hashed_messages:
+                storage.add_message(
+                    msg_hash,
+                    msg.getMsgId(),
+                    filename,
+                    msg.getMessageIDHeader(),
+                    msg_id_hash,
+                    msg.start_offset,
+                    msg.end_offset,
+                    disk_hash,
+                )
+
+        self.time_phase(phase_detect, detect, byte_count, message_count)
+        self.time_phase(phase_detect_sampled, detect_sampled, byte_count, message_count)
+        messages = self.time_phase(phase_parse, parse, byte_count, message_count)
+        hashed_messages = self.time_phase(
+            phase_hash,
+            lambda: hashing(messages),
+            byte_count,
+            message_count,
+        )
+
+        storage = db.MessageDatabase(
+            os.path.join(work_directory, "bench.sqlite")
+        )
+        try:
+            self.time_phase(
+                phase_ingest,
+                lambda: ingest(storage, hashed_messages),
+                byte_count,
+                message_count,
+            )
+            output_filename = os.path.join(work_directory, "bench_deduplicated.mbox")
+            unique_count = storage.get_unique_message_count(
+                use_disk=self.use_disk_data_for_hash
+            )
+            start = pytime.perf_counter()
+            dedup.writeUniqueMessages(
+                storage,
+                output_filename,
+                self.use_disk_data_for_hash,
+            )
+            # the output size is only known once it is written
+            self.record_phase(
+                phase_output,
+                pytime.perf_counter() - start,
+                os.path.getsize(output_filename),
+                unique_count,
+            )
+        finally:
+            storage.close()
+
+        return self.phases
+
+
+async def asyncBench(options):
+    generator = corpus.CorpusGenerator(
+        options.messages,
+        file_count=options.files,
+        duplicate_ratio=options.duplicate_ratio,
+        attachment_ratio=options.attachment_ratio,
+        attachment_size=options.attachment_size,
+        mbox_format=options.mbox_format,
+        seed=options.seed,
+    )
+    benchmark = Benchmark(
+        generator,
+        use_disk_data_for_hash=dedup.source_option_to_boolean(
+            options.msg_hash_source
+        ),
+    )
+
+    if options.work_directory is not None:
+        os.makedirs(options.work_directory, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=options.work_directory) as work_directory:
+        benchmark.run(work_directory)
+
+    json.dump_to_file(options.output, benchmark)
+    LOG.info(f'Benchmark results written to {options.output}')
@@ -0,0 +1,217 @@
+"""
+Copyright 2023 Benjamen R. Meyer
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import base64
+import datetime
+import logging
+import os
+import os.path
+import random
+
+LOG = logging.getLogger(__name__)
+
+mbox_format_o = 'mboxo'
+mbox_format_cl2 = 'mboxcl2'
+# only the formats the parser accepts; MBOXRD and MBOXCL prefix the
+# MBOX FROM line which `Mailbox.buildSummary` rejects
+mbox_format_choices = [
+    mbox_format_o,
+    mbox_format_cl2,
+]
+
+# line length used for base64 encoded attachments
+attachment_line_length = 76
+
+
+class CorpusGenerator(object):
+    """
+    Generate a synthetic set of MBOX files for benchmarking
+
+    The layout of each message follows `tests.base.EmailGenerator` so the
+    benchmark exercises the same parser paths as the tests.
+
+    :param message_count: total number of messages across all files,
+        including duplicates
+    :param file_count: number of MBOX files to spread the messages across
+    :param duplicate_ratio: fraction (0.0 - 1.0) of the messages that are
+        copies of another message in the corpus
+    :param attachment_ratio: fraction (0.0 - 1.0) of the unique messages
+        that carry a base64 encoded attachment
+    :param attachment_size: size in bytes of each attachment before encoding
+    :param mbox_format: one of `mbox_format_choices`
+    :param seed: seed for the random number generator so runs are repeatable
+    """
+
+    DAY_OF_WEEK = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+    MONTH_OF_YEAR = [
+        "Jan", "Feb", "Mar", "Apr", "May", "Jun",
+        "Jul", "Aug", "Sep", "Oct", "Nov", "Dec",
+    ]
+
+    def __init__(
+        self,
+        message_count, file_count=1,
+        duplicate_ratio=0.0,
+        attachment_ratio=0.0, attachment_size=65536,
+        mbox_format=mbox_format_o,
+        seed=0,
+    ):
+        self.message_count = message_count
+        self.file_count = max(file_count, 1)
+        self.duplicate_ratio = min(max(duplicate_ratio, 0.0), 1.0)
+        self.attachment_ratio = min(max(attachment_ratio, 0.0), 1.0)
+        self.attachment_size = attachment_size
+        self.mbox_format = mbox_format
+        self.random = random.Random(seed)
+
+        self.files = []
+        self.byte_count = 0
+        self.unique_count = 0
+
+    def __json__(self):
+        return {
+            "message_count": self.message_count,
+            "file_count": self.file_count,
+            "duplicate_ratio": self.duplicate_ratio,
+            "attachment_ratio": self.attachment_ratio,
+            "attachment_size": self.attachment_size,
+            "mbox_format": self.mbox_format,
+            "unique_count": self.unique_count,
+            "byte_count": self.byte_count,
+        }
+
+    def from_line(self, index):
+        dt = datetime.datetime(2020, 1, 1) + datetime.timedelta(minutes=index)
+        dow = self.DAY_OF_WEEK[dt.weekday()]
+        moy = self.MONTH_OF_YEAR[dt.month - 1]
+        return f"From - {dow} {moy} {dt.day:02} {dt.hour:02}:{dt.minute:02}:{dt.second:02} {dt.year:04}"
+
+    def address(self):
+        account = ''.join(self.random.choices("abcdefghijklmnopqrstuvwxyz0123456789", k=12))
+        server = ''.join(self.random.choices("abcdefghijklmnopqrstuvwxyz", k=16))
+        return f"{account}@{server}.com"
+
+    def generate_message(self, index):
+        """
+        Generate the headers and body of a unique message
+
+        :param index: index of the unique message
+        :return: list of strings, one per line, without the MBOX FROM line
+        """
+        body = f"Test message number {index:030}"
+        headers = [
+            f"From: {self.address()}",
+            f"To: {self.address()}",
+            f"Subject: Sent {index:030}",
+            f"Date: {datetime.datetime(2020, 1, 1) + datetime.timedelta(minutes=index)}",
+            f"Message-ID: <{index:030}@tbdedup.bench>",
+            "X-Mozilla-Status: 0001",
+            "X-Mozilla-Status2: 00000000",
+        ]
+        has_attachment = self.random.random() < self.attachment_ratio
+        if has_attachment:
+            boundary = f"=========boundary-{index:040}===="
+            attachment = base64.b64encode(
+                self.random.randbytes(self.attachment_size)
+            ).decode('ascii')
+            body_lines = [
+                f"--{boundary}",
+                "Content-Type: text/plain; charset=us-ascii",
+                "",
+                body,
+                f"--{boundary}",
+                "Content-Type: application/octet-stream",
+                "Content-Transfer-Encoding: base64",
+                "",
+            ]
+            body_lines.extend(
+                attachment[offset:offset + attachment_line_length]
+                for offset in range(0, len(attachment), attachment_line_length)
+            )
+            body_lines.append(f"--{boundary}--")
+            headers.append(f"Content-Type: multipart/mixed; boundary=\"{boundary}\"")
+        else:
+            body_lines = [body]
+
+        if self.mbox_format == mbox_format_cl2:
+            content_length = sum(len(line) + 1 for line in body_lines)
+            headers.append(f"Content-Length: {content_length}")
+
+        return headers + [""] + body_lines
+
+    def generate(self, directory):
+        """
+        Write the corpus to the directory
+
+        :param directory: existing directory to write the MBOX files into
+        :return: list of the MBOX filenames generated
+        """
+        duplicate_count = int(self.message_count * self.duplicate_ratio)
+        self.unique_count = self.message_count - duplicate_count
+        if self.unique_count == 0 and self.message_count > 0:
+            self.unique_count = 1
+            duplicate_count = self.message_count - 1
+
+        unique_messages = [
+            self.generate_message(index)
+            for index in range(self.unique_count)
+        ]
+        # every unique message once, then the duplicates drawn from them,
+        # shuffled so duplicates are spread across the files
+        message_order = list(range(self.unique_count))
+        message_order.extend(
+            self.random.randrange(self.unique_count)
+            for _ in range(duplicate_count)
+        )
+        self.random.shuffle(message_order)
+
+        self.files = [
+            os.path.join(directory, f"bench_{file_index:04}")
+            for file_index in range(self.file_count)
+        ]
+        outputs = [
+            open(filename, "wt", newline='\n')
+            for filename in self.files
+        ]
+        try:
+            written = [0 for _ in outputs]
+            for position, message_index in enumerate(message_order):
+                file_index = position % len(outputs)
+                output = outputs[file_index]
+                if written[file_index] > 0:
+                    # blank line separating the messages
+                    output.write("\n")
+                output.write(self.from_line(position))
+                output.write("\n")
+                for line in unique_messages[message_index]:
+                    output.write(line)
+                    output.write("\n")
+                written[file_index] = written[file_index] + 1
+        finally:
+            for output in outputs:
+                output.close()
+
+        # files that received no messages are not MBOX files
+        for filename, count in zip(list(self.files), written):
+            if count == 0:
+                os.remove(filename)
+                self.files.remove(filename)
+
+        self.byte_count = sum(
+            os.path.getsize(filename)
+            for filename in self.files
+        )
+        LOG.info(f'Generated {self.message_count} messages ({self.unique_count} unique) in {len(self.files)} files totalling {self.byte_count} bytes')
+        return self.files
@@ -16,26 +16,47 @@ limitations under the License.
 import argparse
 import asyncio
 import logging
+import logging.config
 import sys
 
 #import asyncqt
 #import qasync
 
 from tbdedup import (
+    bench,
     combinatory,
     dedup,
     gui,
+    mbox,
 )
 from tbdedup.planner import (
     plan as planner_plan,
     walk as planner_walk,
 )
+from tbdedup.utils import (
+    metrics,
+    profiling,
+)
 
 LOG = logging.getLogger(__name__)
 
 
-async def asyncMain():
+def non_negative_int(value):
+    """
+    argparse type for counts where 0 turns the feature off
+    """
+    try:
+        result = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'invalid int value: {value!r}')
+    if result < 0:
+        raise argparse.ArgumentTypeError(f'must be 0 or more: {result}')
+    return result
+
+
+def get_argument_parser():
     message_hash_source_choices = ['disk', 'parsed']
+    log_level_choices = ['debug', 'info', 'warning', 'error']
 
     argument_parser = argparse.ArgumentParser(
         description="Thunderbird MBox Deduplicator"
@@ -47,6 +68,62 @@ async def asyncMain():
         help='Specify the log configuration data',
         metavar='Log config',
     )
+    argument_parser.add_argument(
+        '--log-level',
+        default='info',
+        type=str,
+        choices=log_level_choices,
+        required=False,
+        help='Level to log at when --log-config is not given',
+    )
+    argument_parser.add_argument(
+        '--trace-parser',
+        default=False,
+        action='store_true',
+        required=False,
+        help='Log every line handled by the MBOX parser; very verbose',
+    )
+    argument_parser.add_argument(
+        '--sniff-cache',
+        type=str,
+        required=False,
+        default=None,
+        help='File used to cache which files are MBOX files between runs',
+    )
+    argument_parser.add_argument(
+        '--metrics-file',
+        type=str,
+        required=False,
+        default=None,
+        help='File to write the run metrics to when the run completes',
+    )
+    argument_parser.add_argument(
+        '--metrics-format',
+        choices=metrics.metrics_format_choices,
+        default=metrics.metrics_format_json,
+        help='Format of the metrics file. `json` or the Prometheus text format',
+    )
+    argument_parser.add_argument(
+        '--profile',
+        choices=profiling.profile_choices,
+        default=None,
+        required=False,
+        help='Profile the run. `cpu` writes a cProfile .pstats file for each phase. `memory` reports the top allocators at each phase boundary using tracemalloc',
+    )
+    argument_parser.add_argument(
+        '--profile-output',
+        type=str,
+        default='.',
+        required=False,
+        help='Directory to write the profiling output to',
+    )
+    argument_parser.add_argument(
+        '--profile-frames',
+        type=int,
+        default=1,
+        required=False,
+        help='Number of stack frames tracemalloc records per allocation in `memory` mode; more frames cost more overhead',
+    )
     subparsers = argument_parser.add_subparsers(required=True)
 
     gui_parser = subparsers.add_parser('gui')
@@ -74,8 +151,162 @@ async def asyncMain():
         help='Specify which source to use for the hash. `disk` means using the raw message off the disk. `parsed` means using everything but the MBOX FROM line that identifies the message',
         default='parsed',
     )
+    dedup_parser.add_argument(
+        '--include-expunged',
+        default=False,
+        action='store_true',
+        required=False,
+        help='Also deduplicate messages whose X-Mozilla-Status is marked expunged; by default they are skipped as Thunderbird removes them when compacting the folder',
+    )
+    dedup_parser.add_argument(
+        '--use-msf',
+        default=False,
+        action='store_true',
+        required=False,
+        help=(
+            'With --strategy message-id, take the messages from the Thunderbird summary (.msf) of each MBOX file '
+            'instead of parsing it, when the summary is newer than the file and matches a sample of it'
+        ),
+    )
+    dedup_parser.add_argument(
+        '--read-ahead-mb',
+        type=int,
+        default=0,
+        required=False,
+        help='Read uncompressed MBOX files ahead in buffers of this many MB (for example 8 to 64) on a separate thread while they are parsed; 0 disables it',
+    )
+    dedup_parser.add_argument(
+        '--hash-threads',
+        type=non_negative_int,
+        default=0,
+        required=False,
+        help='Hash messages of 1 MB or more on this many threads while parsing continues; 0 hashes every message as it is parsed',
+    )
+    dedup_parser.add_argument(
+        '--mmap',
+        default=False,
+        action='store_true',
+        required=False,
+        help='Parse uncompressed MBOX files through a memory map; messages refer to the mapped file and are hashed from it instead of holding a copy of every line',
+    )
+    dedup_parser.add_argument(
+        '--strategy',
+        choices=dedup.strategy_choices,
+        default=dedup.strategy_content,
+        help=(
+            'How duplicates are found. `content` hashes every message. `message-id` groups messages by their '
+            'Message-ID header and only hashes messages sharing one or without one; messages with different '
+            'Message-IDs are never duplicates'
+        ),
+    )
+    dedup_parser.add_argument(
+        '--output-compression',
+        choices=dedup.output.output_compression_choices,
+        default=dedup.output.output_compression_none,
+        help='Compress the deduplicated output. Thunderbird can only use uncompressed output',
+    )
+    dedup_parser.add_argument(
+        '--shard-max-mb',
+        default=None,
+        type=int,
+        required=False,
+        help='Split the output into shards holding at most this many MB of MBOX data before compression',
+    )
+    dedup_parser.add_argument(
+        '--shard-max-messages',
+        default=None,
+        type=int,
+        required=False,
+        help='Split the output into shards holding at most this many messages',
+    )
+    dedup_parser.add_argument(
+        '--output-workers',
+        default=dedup.output.default_workers,
+        type=int,
+        required=False,
+        help='Number of shards written at the same time',
+    )
+    dedup_parser.add_argument(
+        '--part-store',
+        default=None,
+        type=str,
+        required=False,
+        help='Directory to store each unique MIME part in once; the output refers to the stored parts and can be rebuilt with `reassemble`',
+    )
+    dedup_parser.add_argument(
+        '--part-min-kb',
+        default=dedup.parts.default_min_part_size // 1024,
+        type=int,
+        required=False,
+        help='Smallest MIME part in KB moved into the part store',
+    )
+    dedup_parser.add_argument(
+        '--mode',
+        choices=dedup.mode_choices,
+        default=dedup.mode_copy,
+        help=(
+            '`copy` writes the unique messages to a new MBOX file. `expunge` marks the duplicates as expunged in '
+            'the X-Mozilla-Status header of the MBOX files themselves so Thunderbird removes them when '
+            'compacting; Thunderbird must not be running'
+        ),
+    )
+    dedup_parser.add_argument(
+        '--expunge-journal',
+        default=None,
+        type=str,
+        required=False,
+        help='JSON Lines file recording every change made by `--mode expunge`, used by `unexpunge`; defaults to a timestamped file in the current directory',
+    )
+    dedup_parser.add_argument(
+        '--dry-run',
+        default=False,
+        action='store_true',
+        required=False,
+        help='With `--mode expunge` only report what would be expunged',
+    )
     dedup_parser.set_defaults(func=dedup.asyncDedup)
 
+    unexpunge_parser = subparsers.add_parser('unexpunge')
+    unexpunge_parser.add_argument(
+        '--journal', '-j',
+        default=None,
+        type=str,
+        required=True,
+        help='Journal written by `dedup --mode expunge`',
+    )
+    unexpunge_parser.add_argument(
+        '--dry-run',
+        default=False,
+        action='store_true',
+        required=False,
+        help='Only report what would be restored',
+    )
+    unexpunge_parser.set_defaults(func=dedup.expunge.asyncUndo)
+
+    reassemble_parser = subparsers.add_parser('reassemble')
+    reassemble_parser.add_argument(
+        '--part-store',
+        default=None,
+        type=str,
+        required=True,
+        help='Part store the output was written with',
+    )
+    reassemble_parser.add_argument(
+        '--input', '-i',
+        default=None,
+        type=str,
+        required=True,
+        help='Deduplicated output written with a part store',
+    )
+    reassemble_parser.add_argument(
+        '--output', '-o',
+        default=None,
+        type=str,
+        required=True,
+        help='MBOX file to write with the parts put back',
+    )
+    reassemble_parser.set_defaults(func=dedup.parts.asyncReassemble)
+
     planner_parser = subparsers.add_parser('planner')
 
     planner_parser.add_argument(
@@ -154,9 +385,148 @@ async def asyncMain():
         required=False,
         help="Pattern to limit the files to if provided",
     )
+    combinatory_parser.add_argument(
+        '--json-format',
+        choices=combinatory.json_format_choices,
+        help=(
+            'Specify how the JSON reports are written. `pretty` is indented JSON. `compact` is JSON without any '
+            'whitespace. `lines` is compact JSON with the final operation report written as JSON Lines, one file '
+            'set per line'
+        ),
+        default=combinatory.json_format_pretty,
+    )
+    combinatory_parser.add_argument(
+        '--include-expunged',
+        default=False,
+        action='store_true',
+        required=False,
+        help='Also deduplicate messages whose X-Mozilla-Status is marked expunged; by default they are skipped as Thunderbird removes them when compacting the folder',
+    )
+    combinatory_parser.add_argument(
+        '--use-msf',
+        default=False,
+        action='store_true',
+        required=False,
+        help=(
+            'With --strategy message-id, take the messages from the Thunderbird summary (.msf) of each MBOX file '
+            'instead of parsing it, when the summary is newer than the file and matches a sample of it'
+        ),
+    )
+    combinatory_parser.add_argument(
+        '--read-ahead-mb',
+        type=int,
+        default=0,
+        required=False,
+        help='Read uncompressed MBOX files ahead in buffers of this many MB (for example 8 to 64) on a separate thread while they are parsed; 0 disables it',
+    )
+    combinatory_parser.add_argument(
+        '--hash-threads',
+        type=non_negative_int,
+        default=0,
+        required=False,
+        help='Hash messages of 1 MB or more on this many threads while parsing continues; 0 hashes every message as it is parsed',
+    )
+    combinatory_parser.add_argument(
+        '--mmap',
+        default=False,
+        action='store_true',
+        required=False,
+        help='Parse uncompressed MBOX files through a memory map; messages refer to the mapped file and are hashed from it instead of holding a copy of every line',
+    )
+    combinatory_parser.add_argument(
+        '--strategy',
+        choices=dedup.strategy_choices,
+        default=dedup.strategy_content,
+        help=(
+            'How duplicates are found. `content` hashes every message. `message-id` groups messages by their '
+            'Message-ID header and only hashes messages sharing one or without one; messages with different '
+            'Message-IDs are never duplicates'
+        ),
+    )
+    combinatory_parser.add_argument(
+        '--resume',
+        default=None,
+        type=str,
+        required=False,
+        help='Temporary directory of an interrupted run to continue; completed file sets are verified and kept',
+    )
     combinatory_parser.set_defaults(func=combinatory.asyncCombinatory)
 
-    arguments = argument_parser.parse_args()
+    bench_parser = subparsers.add_parser('bench')
+    bench_parser.add_argument(
+        '--messages', '-m',
+        default=10000,
+        type=int,
+        required=False,
+        help='Total number of messages to generate, including duplicates',
+    )
+    bench_parser.add_argument(
+        '--files', '-f',
+        default=10,
+        type=int,
+        required=False,
+        help='Number of MBOX files to spread the messages across',
+    )
+    bench_parser.add_argument(
+        '--duplicate-ratio',
+        default=0.25,
+        type=float,
+        required=False,
+        help='Fraction of the messages that are duplicates of another message',
+    )
+    bench_parser.add_argument(
+        '--attachment-ratio',
+        default=0.1,
+        type=float,
+        required=False,
+        help='Fraction of the unique messages that carry an attachment',
+    )
+    bench_parser.add_argument(
+        '--attachment-size',
+        default=65536,
+        type=int,
+        required=False,
+        help='Size in bytes of each attachment before it is base64 encoded',
+    )
+    bench_parser.add_argument(
+        '--mbox-format',
+        choices=bench.corpus.mbox_format_choices,
+        default=bench.corpus.mbox_format_o,
+        help='MBOX format of the generated files',
+    )
+    bench_parser.add_argument(
+        '--msg-hash-source',
+        choices=message_hash_source_choices,
+        help='Specify which source to use for the hash. `disk` means using the raw message off the disk. `parsed` means using everything but the MBOX FROM line that identifies the message',
+        default='parsed',
+    )
+    bench_parser.add_argument(
+        '--seed',
+        default=0,
+        type=int,
+        required=False,
+        help='Seed for the corpus generator so runs are repeatable',
+    )
+    bench_parser.add_argument(
+        '--work-directory',
+        default=None,
+        type=str,
+        required=False,
+        help='Directory to generate the corpus under; defaults to the system temporary directory',
+    )
+    bench_parser.add_argument(
+        '--output', '-o',
+        default='tbdedup_bench.json',
+        type=str,
+        required=False,
+        help='File to write the JSON results to',
+    )
+    bench_parser.set_defaults(func=bench.asyncBench)
+    return argument_parser
+
+
+async def asyncMain():
+    arguments = get_argument_parser().parse_args()
     # log config is optional
     if arguments.log_config is not None:
         logging.config.fileConfig(arguments.log_config)
@@ -174,13 +544,41 @@ async def asyncMain():
         log = logging.getLogger()
         log.addHandler(lh)
         log.addHandler(lf)
-        log.setLevel(logging.DEBUG)
+        log.setLevel(getattr(logging, arguments.log_level.upper()))
+
+    if arguments.trace_parser:
+        mbox.Mailbox.trace_enabled = True
+        logging.getLogger(mbox.mboxfile.__name__).setLevel(logging.DEBUG)
+
+    if arguments.sniff_cache is not None:
+        mbox.mboxsniff.DEFAULT_SNIFFER.load(arguments.sniff_cache)
+
+    if arguments.profile is not None:
+        profiling.start(
+            profiling.create(
+                arguments.profile,
+                arguments.profile_output,
+                frames=arguments.profile_frames,
+            )
+        )
 
     try:
         result = await arguments.func(arguments)
     except Exception:
         LOG.exception('Error during processing')
         result = -1
+    finally:
+        profiling.stop()
+
+    if arguments.sniff_cache is not None:
+        mbox.mboxsniff.DEFAULT_SNIFFER.save(arguments.sniff_cache)
+
+    if arguments.metrics_file is not None:
+        metrics.REGISTRY.set_gauge("exit_code", result if result is not None else 0)
+        metrics.REGISTRY.dump_to_file(
+            arguments.metrics_file,
+            arguments.metrics_format,
+        )
 
     if result is not None:
         return result
@@ -196,7 +594,7 @@ def main():
     else:
         print("Detected TUI Application. Using standard Python3 Asyncio Event Loop")
 
-    asyncio.run(asyncMain())
+    return asyncio.run(asyncMain())
 
 
 if __name__ == "__main__":
@@ -16,11 +16,15 @@ limitations under the License.
 import asyncio
 import copy
 import datetime
+import hashlib
 import logging
 import os
 import os.path
 import resource
+import shutil
+import signal
 import tempfile
+import threading
 
 from tbdedup import (
     db,
@@ -34,33 +38,69 @@ from tbdedup.planner import (
 )
 from tbdedup.utils import (
     json,
+    metrics,
+    progress,
     time,
 )
 
+from . import mover
+
 LOG = logging.getLogger(__name__)
 
+json_format_pretty = 'pretty'
+json_format_compact = 'compact'
+json_format_lines = 'lines'
+json_format_choices = [
+    json_format_pretty,
+    json_format_compact,
+    json_format_lines,
+]
+
+plan_output_name = "plan_output.json"
+checkpoint_name = "combinatory_checkpoint.json"
+
+# exit code for a run interrupted with SIGINT
+exit_interrupted = 130
+
+# read size used when hashing the output MBOX files
+digest_block_size = 1024 * 1024
+
+# number of output MBOX files moved at the same time
+move_concurrency = 4
 
-async def runDedup(output_directory, plan, dedup_task, counter_update=None):
+# appended to the name of the deduplicated MBOX files
+dedup_suffix = "_Dedup"
+
+
+def get_file_digest(filename):
+    hasher = hashlib.sha256()
+    with open(filename, "rb") as data_input:
+        for block in iter(lambda: data_input.read(digest_block_size), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+async def runDedup(output_directory, plan, dedup_task, counter_update=None, compact=False):
     try:
         output_file = await dedup_task
         if counter_update is not None:
             counter_update()
 
         plan.combinatory[planner_keys.plan_location][planner_keys.plan_mbox] = output_file
+        # recorded so a resumed run can verify the output is complete
+        plan.combinatory[planner_keys.plan_location][planner_keys.plan_mbox_size] = os.path.getsize(output_file)
+        plan.combinatory[planner_keys.plan_location][planner_keys.plan_mbox_hash] = get_file_digest(output_file)
 
-        plan_output_filename = os.path.join(
-            output_directory,
-            "plan_output.json",
-        )
-        plan.combinatory[planner_keys.plan_location][planner_keys.plan_output_plan] = plan_output_filename
-
-        json.dump_to_file(plan_output_filename, plan)
+        write_plan_output(output_directory, plan, compact=compact)
+        metrics.REGISTRY.increment(metrics.file_sets_processed)
 
         return (
             output_directory,
             plan,
             output_file,
         )
+    except progress.ErrCancelled:
+        raise
     except Exception:
         LOG.exception(f'Failed while carrying out plan for {output_directory}')
         return (
@@ -70,52 +110,195 @@ async def runDedup(output_directory, plan, dedup_task, counter_update=None):
         )
 
 
+def write_plan_output(output_directory, plan, compact=False):
+    plan_output_filename = os.path.join(
+        output_directory,
+        plan_output_name,
+    )
+    plan.combinatory[planner_keys.plan_location][planner_keys.plan_output_plan] = plan_output_filename
+
+    # the plan output marks the set as complete so only put it in
+    # place once it is fully written
+    json.dump_to_file(f"{plan_output_filename}.tmp", plan, compact=compact)
+    os.replace(f"{plan_output_filename}.tmp", plan_output_filename)
+
+
 def get_plan_output_directory(folder_pattern, temp_directory, root_file):
     path_loc = root_file.rfind(folder_pattern)
     path = root_file[path_loc:]
     final_path = path.replace("/", "_").replace(".sbd", "")
     return os.path.join(
         temp_directory,
-        f"{final_path}_Dedup"
+        f"{final_path}{dedup_suffix}"
+    )
+
+
+def load_completed_plan(output_directory, plan_files):
+    """
+    Load the results of a file set completed by an earlier run
+
+    :param output_directory: directory of the file set in the temporary
+        directory of the earlier run
+    :param plan_files: files currently in the file set
+    :return: the `combinatory` data of the completed plan or None if the
+        set was not completed, its files changed, or its output does not
+        match what was recorded
+    """
+    try:
+        mapping = json.load_from_file(
+            os.path.join(output_directory, "mapping.json")
+        )
+        plan_output = json.load_from_file(
+            os.path.join(output_directory, plan_output_name)
+        )
+    except (OSError, ValueError):
+        return None
+
+    mapped_files = sorted(mapping.get(planner_keys.plan_file_map, {}).values())
+    if mapped_files != sorted(os.path.abspath(filename) for filename in plan_files):
+        LOG.info(f'Files changed since {output_directory} was processed')
+        return None
+
+    plan_combinatory = plan_output.get("combinatory") or {}
+    plan_location = plan_combinatory.get(planner_keys.plan_location, {})
+    # once moved the output is only at its final location
+    output_file = plan_location.get(
+        planner_keys.plan_final_mbox,
+        plan_location.get(planner_keys.plan_mbox),
+    )
+    output_size = plan_location.get(planner_keys.plan_mbox_size)
+    output_hash = plan_location.get(planner_keys.plan_mbox_hash)
+    if output_file is None or output_size is None or output_hash is None:
+        return None
+    try:
+        if os.path.getsize(output_file) != output_size:
+            LOG.info(f'Output {output_file} is not the recorded size')
+            return None
+        if get_file_digest(output_file) != output_hash:
+            LOG.info(f'Output {output_file} does not match the recorded hash')
+            return None
+    except OSError:
+        return None
+    return plan_combinatory
+
+
+class InterruptHandler(object):
+    """
+    Cancel the run on the first SIGINT; a second SIGINT stops immediately
+
+    The handler is only installed on the main thread as Python only
+    delivers signals there.
+    """
+
+    def __init__(self, tracker):
+        self.tracker = tracker
+        self.previous_handler = None
+        self.interrupted = False
+
+    def handler(self, signum, frame):
+        self.interrupted = True
+        LOG.info('Interrupted; stopping after the current messages. Interrupt again to stop immediately')
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        self.tracker.cancel()
+
+    def __enter__(self):
+        if threading.current_thread() is threading.main_thread():
+            self.previous_handler = signal.signal(signal.SIGINT, self.handler)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.previous_handler is not None:
+            signal.signal(signal.SIGINT, self.previous_handler)
+
+
+def write_checkpoint(temp_directory, options, plan_directories):
+    completed = []
+    pending = []
+    for output_directory in plan_directories:
+        if os.path.exists(os.path.join(output_directory, plan_output_name)):
+            completed.append(output_directory)
+        else:
+            pending.append(output_directory)
+
+    checkpoint_file = os.path.join(temp_directory, checkpoint_name)
+    json.dump_to_file(
+        checkpoint_file,
+        {
+            "timestamp": datetime.datetime.utcnow().isoformat(),
+            "location": options.location,
+            "temp_directory": temp_directory,
+            "completed": completed,
+            "pending": pending,
+        },
     )
+    LOG.info(f'{len(completed)} file sets completed, {len(pending)} remaining; checkpoint written to {checkpoint_file}')
+    LOG.info(f'Continue the run with `--resume {temp_directory}`')
 
 
-async def combinatory(options, mboxfiles):
+async def combinatory(options, mboxfiles, tracker=None, hash_pool=None):
     # 1. Run the preplanner and find all the sets of files to deduplicate
     preplan = planner_walk.Preplanner(options)
     with time.TimeTracker("Preplanner"):
-        await preplan.preplan(mboxfiles)
+        # outputs of earlier runs are not deduplicated again
+        await preplan.preplan(
+            [
+                filename
+                for filename in mboxfiles
+                if not filename.endswith(dedup_suffix)
+            ]
+        )
 
     if preplan.plan_count() == 0:
         LOG.info('No data for deduplication')
         return
 
-    # 2. Create a temporary directory to build processing directories under
-    utc_time = datetime.datetime.utcnow()
-    temp_directory = tempfile.mkdtemp(
-        prefix=utc_time.strftime("%Y%m%d_%H%M%S"),
-        suffix='tbdedup',
-        dir=options.storage_location,
-    )
-    LOG.info(f'Using Temporary Directory {temp_directory}')
+    # 2. Create a temporary directory to build processing directories under,
+    #    or reuse the one from the run being resumed
+    resume_directory = getattr(options, 'resume', None)
+    if resume_directory is not None:
+        temp_directory = os.path.abspath(resume_directory)
+        if not os.path.isdir(temp_directory):
+            LOG.error(f'Unable to resume: {temp_directory} is not a directory')
+            return 1
+        LOG.info(f'Resuming in Temporary Directory {temp_directory}')
+    else:
+        utc_time = datetime.datetime.utcnow()
+        temp_directory = tempfile.mkdtemp(
+            prefix=utc_time.strftime("%Y%m%d_%H%M%S"),
+            suffix='tbdedup',
+            dir=options.storage_location,
+        )
+        LOG.info(f'Using Temporary Directory {temp_directory}')
+
+    compact_json = options.json_format != json_format_pretty
+    dedup_strategy = getattr(options, 'strategy', None) or dedup.strategy_content
+    dedup_mapped = getattr(options, 'mmap', False)
+    dedup_skip_expunged = not getattr(options, 'include_expunged', False)
+    dedup_use_summary = getattr(options, 'use_msf', False)
+    dedup_read_ahead = dedup.get_read_ahead(options)
 
     # 3. For each file set in the preplanner, add a directory under the
     #    temporary directory and add symlinks for each associated file
     LOG.info('Generating dedup plans...')
     dedup_workers = []
+    # results of the file sets completed by the run being resumed
+    resumed_results = []
+    plan_directories = []
 
     required_file_count = 0
 
     counters = {
-        "completed": 0.0,
-        "total": 0.0,
+        "completed": 0,
+        "total": 0,
     }
 
     def counter_update():
-        counters['completed'] = counters['completed'] + 1.0
-        if counters['total'] > 0:
-            percentage = (counters['completed'] / counters['total']) * 100.0
-            LOG.info(f'[Combinatory] Progress Report: {percentage:03.02f}')
+        counters['completed'] = counters['completed'] + 1
+        LOG.info(f"[Combinatory] Completed {counters['completed']} of {counters['total']} file sets")
+
+    # byte based progress across all of the file sets
+    if tracker is None:
+        tracker = progress.create("Combinatory")
 
     with time.TimeTracker("Planning"):
         for root_file, plan in preplan.plans():
@@ -124,6 +307,27 @@ async def combinatory(options, mboxfiles):
                 temp_directory,
                 root_file,
             )
+            plan_directories.append(output_directory)
+
+            if resume_directory is not None and os.path.isdir(output_directory):
+                completed_plan = load_completed_plan(output_directory, plan.files)
+                if completed_plan is not None:
+                    LOG.info(f'Skipping completed file set {output_directory}')
+                    plan.combinatory = completed_plan
+                    resumed_results.append(
+                        (
+                            output_directory,
+                            plan,
+                            completed_plan[planner_keys.plan_location][planner_keys.plan_mbox],
+                        )
+                    )
+                    continue
+
+                # start the set over; the directory only holds links to
+                # the source files and data generated from them
+                LOG.info(f'Restarting file set {output_directory}')
+                shutil.rmtree(output_directory)
+
             # ensure the directory tree exists
             os.makedirs(output_directory, mode=0o755, exist_ok=True)
 
@@ -144,6 +348,7 @@ async def combinatory(options, mboxfiles):
                     output_directory,
                     plan.files,
                     plan.combinatory,
+                    compact=compact_json,
                 )
             except planner_plan.GenerationError:
                 LOG.exception(f'Failed to generate data in {output_directory}')
@@ -167,31 +372,41 @@ async def combinatory(options, mboxfiles):
             use_disk_data_for_hash = dedup.source_option_to_boolean(
                 options.msg_hash_source
             )
+            # convert the link paths from just filenames to full paths
+            dedup_files = [
+                os.path.join(
+                    plan.combinatory[planner_keys.plan_location][planner_keys.plan_output],
+                    link_file,
+                )
+                for link_file in plan.combinatory[planner_keys.plan_file_map].keys()
+            ]
+            for dedup_file in dedup_files:
+                tracker.add_total(dedup.get_file_size(dedup_file))
             dedup_task = asyncio.create_task(
                 runDedup(
                     output_directory,
                     plan,
                     dedup.dedupper(
-                        # convert the link paths from just filenames to full paths
-                        [
-                            os.path.join(
-                                plan.combinatory[planner_keys.plan_location][planner_keys.plan_output],
-                                link_file,
-                            )
-                            for link_file in plan.combinatory[planner_keys.plan_file_map].keys()
-                        ],
+                        dedup_files,
                         dedup_hash_storage,
                         use_disk_data_for_hash=use_disk_data_for_hash,
                         output_base_path=plan.combinatory[planner_keys.plan_location][planner_keys.plan_output],
+                        tracker=tracker,
+                        strategy=dedup_strategy,
+                        mapped=dedup_mapped,
+                        skip_expunged=dedup_skip_expunged,
+                        use_summary=dedup_use_summary,
+                        read_ahead=dedup_read_ahead,
+                        hash_pool=hash_pool,
                     ),
                     counter_update=counter_update,
+                    compact=compact_json,
                 )
             )
             dedup_workers.append(dedup_task)
 
     counters['total'] = len(dedup_workers)
-    counters['completed'] = -1.0
-    counter_update()
+    tracker.report()
 
     # Ensure there are enough file handles to support the work
     soft_limit, hard_limit = resource.getrlimit(resource.RLIMIT_NOFILE)
@@ -218,34 +433,73 @@ async def combinatory(options, mboxfiles):
 
     LOG.info(f'Waiting on {len(dedup_workers)} dedup tasks to complete')
     with time.TimeTracker("Deduplicator"):
-        worker_results = await asyncio.gather(*dedup_workers)
+        with InterruptHandler(tracker):
+            try:
+                worker_results = await asyncio.gather(*dedup_workers)
+            except progress.ErrCancelled:
+                # let the other sets stop before recording what completed
+                await asyncio.gather(*dedup_workers, return_exceptions=True)
+                tracker.report()
+                write_checkpoint(temp_directory, options, plan_directories)
+                raise
+    tracker.report()
     LOG.info('Dedup Workers completed')
+    worker_results = resumed_results + list(worker_results)
 
     # 5. Move result files back into the original data set with the
     #    name `Dedup` appended to differentiate them.
     move_workers = []
     LOG.info(f'Arranging to move results back to Thunderbird')
+    move_limiter = asyncio.Semaphore(move_concurrency)
 
-    async def move_dedup_mbox(output_directory, plan, mboxfile):
+    async def move_dedup_mbox(output_directory, plan, mboxfile, plan_directory):
         if mboxfile is None:
             LOG.info(f'No mboxfile specified for {output_directory}')
-            return
+            return None
+
+        plan_location = plan.combinatory[planner_keys.plan_location]
+        if planner_keys.plan_final_mbox in plan_location:
+            LOG.info(f'{plan_location[planner_keys.plan_final_mbox]} was moved by an earlier run')
+            return plan_location[planner_keys.plan_final_mbox]
 
         target_directory = os.path.join(
             output_directory,
-            plan.combinatory[planner_keys.plan_location][planner_keys.plan_source]
+            plan_location[planner_keys.plan_source]
         )
-        output_mbox_file = f"{target_directory}_Dedup"
-        source_mbox_file = plan.combinatory[planner_keys.plan_location][planner_keys.plan_mbox]
-        LOG.info(f'Copying {source_mbox_file} to {output_mbox_file}')
+        output_mbox_file = f"{target_directory}{dedup_suffix}"
+        source_mbox_file = plan_location[planner_keys.plan_mbox]
+        if not os.path.isdir(os.path.dirname(output_mbox_file)):
+            LOG.error(f'Unable to move {source_mbox_file}: {os.path.dirname(output_mbox_file)} does not exist')
+            return None
+
+        async with move_limiter:
+            LOG.info(f'Moving {source_mbox_file} to {output_mbox_file}')
+            try:
+                method = await asyncio.to_thread(
+                    mover.move_file,
+                    source_mbox_file,
+                    output_mbox_file,
+                )
+            except mover.ErrTargetExists:
+                LOG.error(f'Not replacing existing {output_mbox_file}; output left at {source_mbox_file}')
+                return None
+            except OSError:
+                LOG.exception(f'Failed to move {source_mbox_file} to {output_mbox_file}')
+                return None
+
+        LOG.info(f'Moved {source_mbox_file} to {output_mbox_file} using {method}')
+        metrics.REGISTRY.increment(f"{metrics.files_moved}_{method}")
+        plan_location[planner_keys.plan_final_mbox] = output_mbox_file
+        write_plan_output(plan_directory, plan, compact=compact_json)
+        return output_mbox_file
 
     for wr_output_directory, wr_plan, wr_mboxfile in worker_results:
         move_task = asyncio.create_task(
             move_dedup_mbox(
-                #wr_output_directory,
                 options.location,
                 wr_plan,
                 wr_mboxfile,
+                wr_output_directory,
             ),
         )
         move_workers.append(move_task)
@@ -256,18 +510,39 @@ async def combinatory(options, mboxfiles):
     LOG.info('Move Workers completed')
 
     # finally write the completed operation under the output directory
-    data_output_file = os.path.join(
+    data_output_directory = (
         temp_directory
         if options.storage_location is None
-        else options.storage_location,
-        "combinatory_operation.json",
+        else options.storage_location
     )
-    json.dump_to_file(data_output_file, preplan)
+    if options.json_format == json_format_lines:
+        data_output_file = os.path.join(
+            data_output_directory,
+            "combinatory_operation.jsonl",
+        )
+        json.dump_lines_to_file(data_output_file, preplan.json_records())
+    else:
+        data_output_file = os.path.join(
+            data_output_directory,
+            "combinatory_operation.json",
+        )
+        json.dump_to_file(data_output_file, preplan, compact=compact_json)
 
 
-async def asyncCombinatory(options):
+async def asyncCombinatory(options, tracker=None):
     locationProcessor = mbox.MailboxFolder(options.location)
     with time.TimeTracker("File Search"):
         mboxfiles = await locationProcessor.getMboxFiles()
+    # one pool for every file set so --hash-threads bounds the whole run
+    hash_pool = dedup.hashpool.HashPool.from_options(options)
     with time.TimeTracker("Full Operation"):
-        await combinatory(options, mboxfiles)
+        try:
+            return await combinatory(options, mboxfiles, tracker=tracker, hash_pool=hash_pool)
+        except progress.ErrCancelled:
+            if tracker is not None:
+                # the caller asked for the cancellation
+                raise
+            return exit_interrupted
+        finally:
+            if hash_pool is not None:
+                hash_pool.close()
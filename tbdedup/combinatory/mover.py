@@ -0,0 +1,155 @@
+"""
+Copyright 2023 Benjamen R. Meyer
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import errno
+import fcntl
+import logging
+import os
+import shutil
+
+LOG = logging.getLogger(__name__)
+
+# ioctl request to share the data blocks of one file with another (Linux)
+FICLONE = 0x40049409
+
+move_method_link = 'link'
+move_method_rename = 'rename'
+move_method_reflink = 'reflink'
+move_method_copy_file_range = 'copy_file_range'
+move_method_copy = 'copy'
+
+# bytes per `copy_file_range` call
+copy_chunk_size = 64 * 1024 * 1024
+
+# errors meaning the method is not available for these files, as opposed
+# to the move itself failing
+_unsupported_errors = (
+    errno.EXDEV,
+    errno.EPERM,
+    errno.ENOSYS,
+    errno.EOPNOTSUPP,
+    errno.ENOTTY,
+    errno.EINVAL,
+    errno.EBADF,
+)
+
+
+class ErrTargetExists(Exception):
+    pass
+
+
+def _is_unsupported(ex):
+    return ex.errno in _unsupported_errors
+
+
+def _reflink(source_fd, target_fd):
+    fcntl.ioctl(target_fd, FICLONE, source_fd)
+
+
+def _copy_file_range(source_fd, target_fd, size):
+    offset = 0
+    while offset < size:
+        copied = os.copy_file_range(
+            source_fd,
+            target_fd,
+            min(copy_chunk_size, size - offset),
+            offset,
+            offset,
+        )
+        if copied == 0:
+            break
+        offset = offset + copied
+    if offset != size:
+        raise OSError(errno.EIO, f'copied {offset} of {size} bytes')
+
+
+def _copy(source_fd, target_fd):
+    with open(source_fd, "rb", closefd=False) as source, open(target_fd, "wb", closefd=False) as target:
+        shutil.copyfileobj(source, target)
+
+
+def _copy_between_filesystems(source, target):
+    with open(source, "rb") as source_input:
+        source_fd = source_input.fileno()
+        size = os.fstat(source_fd).st_size
+        # O_EXCL so an existing file is never replaced
+        try:
+            target_fd = os.open(target, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            raise ErrTargetExists(f'{target} already exists')
+
+        try:
+            try:
+                _reflink(source_fd, target_fd)
+                method = move_method_reflink
+            except OSError as ex:
+                if not _is_unsupported(ex):
+                    raise
+                try:
+                    if not hasattr(os, 'copy_file_range'):
+                        raise OSError(errno.ENOSYS, 'copy_file_range is not available')
+                    _copy_file_range(source_fd, target_fd, size)
+                    method = move_method_copy_file_range
+                except OSError as ex:
+                    if not _is_unsupported(ex):
+                        raise
+                    os.ftruncate(target_fd, 0)
+                    _copy(source_fd, target_fd)
+                    method = move_method_copy
+            os.fsync(target_fd)
+        except BaseException:
+            os.close(target_fd)
+            os.unlink(target)
+            raise
+        os.close(target_fd)
+    return method
+
+
+def move_file(source, target):
+    """
+    Move a file using the cheapest method available without replacing an
+    existing file
+
+    On the same filesystem the file is hard linked to the target and the
+    source removed, which is a rename that fails if the target exists;
+    `os.rename` is used where hard links are not supported. Between
+    filesystems the data is reflinked (FICLONE), copied in the kernel
+    (`copy_file_range`), or copied as the last resort, and the source is
+    removed once the copy is on disk.
+
+    :param source: file to move
+    :param target: new name of the file
+    :return: the method used, one of the `move_method_*` values
+    :raises ErrTargetExists: if the target already exists
+    """
+    try:
+        os.link(source, target)
+    except FileExistsError:
+        raise ErrTargetExists(f'{target} already exists')
+    except OSError as ex:
+        if ex.errno == errno.EXDEV:
+            method = _copy_between_filesystems(source, target)
+        elif _is_unsupported(ex):
+            if os.path.lexists(target):
+                raise ErrTargetExists(f'{target} already exists')
+            os.rename(source, target)
+            return move_method_rename
+        else:
+            raise
+    else:
+        method = move_method_link
+
+    os.unlink(source)
+    return method
@@ -29,11 +29,15 @@ Table 1:
   set no actual difference between the two could be observed in the output data. Therefore it is recommended at this time
   that the non-disk hash is used as it results in the smaller data set.
 """
+import itertools
 import logging
 import sqlite3
 
 LOG = logging.getLogger(__name__)
 
+# hashes of messages grouped by their Message-ID alone start with this
+MESSAGE_ID_HASH_PREFIX = 'message-id:'
+
 SCHEMAS = [
     {
         "version": 0,
@@ -42,6 +46,21 @@ SCHEMAS = [
             "CREATE TABLE IF NOT EXISTS messages(hashid TEXT, diskhashid TEXT, messageid TEXT, messageid2 TEXT, hashid2 TEXT, location TEXT, startOffset INT, endOffset INT)",
         ],
     },
+    {
+        "version": 1,
+        "changes": [
+            # messages that could not be fully parsed, see `add_quarantine`
+            "CREATE TABLE IF NOT EXISTS quarantine(messageid TEXT, location TEXT, startOffset INT, endOffset INT, reason TEXT)",
+        ],
+    },
+    {
+        "version": 2,
+        "changes": [
+            # the Message-ID alone, see `mboxmessage.message_id_key`
+            "ALTER TABLE messages ADD COLUMN messagekey TEXT",
+            "CREATE INDEX IF NOT EXISTS messages_messagekey ON messages(messagekey)",
+        ],
+    },
 ]
 
 ADD_SCHEMA_VERSION = """
@@ -56,8 +75,8 @@ FROM schema_version
 
 
 ADD_MESSAGE = """
-INSERT INTO messages(hashid, diskhashid, messageid, messageid2, hashid2, location, startOffset, endOffset)
-VALUES(:hashid, :diskhashid, :messageid, :messageid2, :hashid2, :location, :startOffset, :endOffset)
+INSERT INTO messages(hashid, diskhashid, messageid, messageid2, hashid2, location, startOffset, endOffset, messagekey)
+VALUES(:hashid, :diskhashid, :messageid, :messageid2, :hashid2, :location, :startOffset, :endOffset, :messagekey)
 """
 
 DISK_GET_UNIQUE_MESSAGE_COUNT = """
@@ -79,6 +98,20 @@ FROM messages
 WHERE diskhashid = :diskhashid
 """
 
+# every message grouped by its hash, the groups in the file order of their
+# first message so the messages written are read forward through each file
+DISK_GET_UNIQUE_MESSAGES = """
+SELECT diskhashid, messageid, location, startOffset, endOffset, diskhashid
+FROM (
+    SELECT *,
+        FIRST_VALUE(location) OVER file_order AS firstLocation,
+        FIRST_VALUE(startOffset) OVER file_order AS firstStartOffset
+    FROM messages
+    WINDOW file_order AS (PARTITION BY diskhashid ORDER BY location, startOffset)
+)
+ORDER BY firstLocation, firstStartOffset, location, startOffset
+"""
+
 GET_UNIQUE_MESSAGE_COUNT = """
 SELECT COUNT(*)
 FROM (
@@ -98,6 +131,71 @@ FROM messages
 WHERE hashid = :hashid
 """
 
+GET_UNIQUE_MESSAGES = """
+SELECT hashid, messageid, location, startOffset, endOffset, diskhashid
+FROM (
+    SELECT *,
+        FIRST_VALUE(location) OVER file_order AS firstLocation,
+        FIRST_VALUE(startOffset) OVER file_order AS firstStartOffset
+    FROM messages
+    WINDOW file_order AS (PARTITION BY hashid ORDER BY location, startOffset)
+)
+ORDER BY firstLocation, firstStartOffset, location, startOffset
+"""
+
+ADD_QUARANTINE = """
+INSERT INTO quarantine(messageid, location, startOffset, endOffset, reason)
+VALUES(:messageid, :location, :startOffset, :endOffset, :reason)
+"""
+
+GET_QUARANTINE_COUNT = """
+SELECT COUNT(*)
+FROM quarantine
+"""
+
+GET_QUARANTINE = """
+SELECT messageid, location, startOffset, endOffset, reason
+FROM quarantine
+ORDER BY location, startOffset
+"""
+
+# messages without a content hash that share their Message-ID with another
+# message, or have no Message-ID at all; in file order for sequential reads
+GET_MESSAGE_ID_CANDIDATES = """
+SELECT m.rowid, m.messageid, m.location, m.startOffset, m.endOffset, m.endOffset = last.endOffset
+FROM messages AS m
+JOIN (
+    SELECT location, MAX(endOffset) AS endOffset
+    FROM messages
+    GROUP BY location
+) AS last ON last.location = m.location
+WHERE m.hashid IS NULL
+AND (
+    m.messagekey IS NULL
+    OR m.messagekey IN (
+        SELECT messagekey
+        FROM messages
+        WHERE messagekey IS NOT NULL
+        GROUP BY messagekey
+        HAVING COUNT(*) > 1
+    )
+)
+ORDER BY m.location, m.startOffset
+"""
+
+SET_MESSAGE_HASHES = """
+UPDATE messages
+SET hashid = :hashid, diskhashid = :diskhashid
+WHERE rowid = :rowid
+"""
+
+# a message with a unique Message-ID is its own group
+SET_MESSAGE_ID_HASHES = """
+UPDATE messages
+SET hashid = :prefix || messagekey, diskhashid = :prefix || messagekey
+WHERE hashid IS NULL
+"""
+
 
 class MessageDatabase(object):
 
@@ -125,6 +223,12 @@ class MessageDatabase(object):
                 with self._db as cursor:
                     for change in version_schema["changes"]:
                         cursor.execute(change)
+                    cursor.execute(
+                        ADD_SCHEMA_VERSION,
+                        {
+                            "version": version_schema["version"],
+                        },
+                    )
                     cursor.commit()
 
     def _get_db(self):
@@ -137,11 +241,16 @@ class MessageDatabase(object):
             with self._get_db() as cursor:
                 result = cursor.execute(GET_SCHEMA_VERSION)
                 values = result.fetchone()
-                return values[0]
+                # databases created before the version was recorded
+                return (
+                    values[0]
+                    if values[0] is not None
+                    else -1
+                )
         except Exception:
             return -1
 
-    def add_message(self, msg_hash, msg_id, msg_location, msg_id2, msg_hash2, start_offset, end_offset, disk_hash):
+    def add_message(self, msg_hash, msg_id, msg_location, msg_id2, msg_hash2, start_offset, end_offset, disk_hash, msg_key=None):
         with self._get_db() as cursor:
             result = cursor.execute(
                 ADD_MESSAGE,
@@ -154,9 +263,46 @@ class MessageDatabase(object):
                     "location": msg_location,
                     "startOffset": start_offset,
                     "endOffset": end_offset,
+                    "messagekey": msg_key,
                 },
             )
 
+    def add_quarantine(self, msg_id, msg_location, start_offset, end_offset, reason):
+        """
+        Record a message that could not be fully parsed
+
+        The message is still stored with `add_message`; the quarantine
+        only lists it for inspection.
+        """
+        with self._get_db() as cursor:
+            cursor.execute(
+                ADD_QUARANTINE,
+                {
+                    "messageid": msg_id,
+                    "location": msg_location,
+                    "startOffset": start_offset,
+                    "endOffset": end_offset,
+                    "reason": reason,
+                },
+            )
+
+    def get_quarantine_count(self):
+        with self._get_db() as cursor:
+            result = cursor.execute(GET_QUARANTINE_COUNT)
+            value = result.fetchone()
+            return value[0]
+
+    def get_quarantine(self):
+        with self._get_db() as cursor:
+            for msg_id, msg_location, start_offset, end_offset, reason in cursor.execute(GET_QUARANTINE):
+                yield {
+                    "messageid": msg_id,
+                    "location": msg_location,
+                    "start_offset": start_offset,
+                    "end_offset": end_offset,
+                    "reason": reason,
+                }
+
     def get_unique_message_count(self, use_disk=False):
         with self._get_db() as cursor:
             result = cursor.execute(
@@ -195,12 +341,102 @@ class MessageDatabase(object):
                     sqlargs_key: hashid
                 },
             ):
-                yield {
-                    "hash": hashid,
+                yield self._message_row(hashid, msg_id, msg_location, start_offset, end_offset, disk_hashid)
+
+    def get_unique_messages(self, use_disk=False):
+        """
+        Every message grouped by its hash
+
+        The groups come in the order of their first message in the MBOX
+        files, and the messages of a group in file order, so the messages
+        that are written can be read forward through each file.
+
+        :return: iterator of tuples (hash, list of the messages as returned
+            by `get_messages_by_hash`)
+        """
+        with self._get_db() as cursor:
+            rows = cursor.execute(
+                DISK_GET_UNIQUE_MESSAGES
+                if use_disk
+                else GET_UNIQUE_MESSAGES
+            )
+            for hashid, group_rows in itertools.groupby(rows, key=lambda row: row[0]):
+                yield (
+                    hashid,
+                    [
+                        self._message_row(*row)
+                        for row in group_rows
+                    ],
+                )
+
+    @staticmethod
+    def _message_row(hashid, msg_id, msg_location, start_offset, end_offset, disk_hashid):
+        return {
+            "hash": hashid,
+            "messageid": msg_id,
+            "location": msg_location,
+            "start_offset": start_offset,
+            "end_offset": end_offset,
+            "length": end_offset - start_offset,
+            "disk_hash": (
+                disk_hashid
+                if not disk_hashid.startswith(MESSAGE_ID_HASH_PREFIX)
+                else None
+            ),
+        }
+
+    def get_message_id_candidates(self):
+        """
+        Messages that need a content hash when grouping by Message-ID
+
+        :return: list of the messages, `last_record` is True for the last
+            message of its file; the caller updates their hashes
+            so the rows are not read while they are being updated
+        """
+        with self._get_db() as cursor:
+            return [
+                {
+                    "rowid": rowid,
                     "messageid": msg_id,
                     "location": msg_location,
                     "start_offset": start_offset,
                     "end_offset": end_offset,
                     "length": end_offset - start_offset,
-                    "disk_hash": disk_hashid,
+                    "last_record": bool(last_record),
                 }
+                for rowid, msg_id, msg_location, start_offset, end_offset, last_record in cursor.execute(
+                    GET_MESSAGE_ID_CANDIDATES
+                )
+            ]
+
+    def set_message_hashes(self, message_hashes):
+        """
+        :param message_hashes: iterable of tuples (rowid, hash, disk hash)
+        """
+        with self._get_db() as cursor:
+            cursor.executemany(
+                SET_MESSAGE_HASHES,
+                (
+                    {
+                        "rowid": rowid,
+                        "hashid": msg_hash,
+                        "diskhashid": disk_hash,
+                    }
+                    for rowid, msg_hash, disk_hash in message_hashes
+                ),
+            )
+
+    def set_message_id_hashes(self):
+        """
+        Use the Message-ID hash of every message without a content hash
+
+        The disk hash is not known for these messages so
+        `get_messages_by_hash` reports it as None.
+        """
+        with self._get_db() as cursor:
+            cursor.execute(
+                SET_MESSAGE_ID_HASHES,
+                {
+                    "prefix": MESSAGE_ID_HASH_PREFIX,
+                },
+            )
@@ -14,6 +14,8 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 import asyncio
+import collections
+import concurrent.futures
 import datetime
 import hashlib
 import logging
@@ -26,11 +28,41 @@ from tbdedup import (
 
 from tbdedup.utils import (
     encoder,
+    metrics,
+    progress,
     time,
 )
 
+from . import expunge
+from . import hashpool
+from . import output
+from . import parts
+
 LOG = logging.getLogger(__name__)
 
+# number of records between progress summaries in the log
+summary_interval = 10000
+
+# `content` hashes every message; `message-id` groups the messages by their
+# Message-ID header first and only hashes the content of messages sharing a
+# Message-ID or without one. Messages with different Message-IDs are then
+# never duplicates of each other.
+strategy_content = 'content'
+strategy_message_id = 'message-id'
+strategy_choices = [
+    strategy_content,
+    strategy_message_id,
+]
+
+# `copy` writes the unique messages to a new MBOX file; `expunge` leaves
+# them where they are and marks the duplicates as expunged in place
+mode_copy = 'copy'
+mode_expunge = 'expunge'
+mode_choices = [
+    mode_copy,
+    mode_expunge,
+]
+
 
 def source_option_to_boolean(msg_hash_source):
     # NOTE: in testing found that `msg_hash_source == 'disk'` results
@@ -44,83 +76,460 @@ def source_option_to_boolean(msg_hash_source):
     )
 
 
-async def processFile(filename, storage, counter_update=None):
+def get_read_ahead(options):
+    """
+    :return: bytes to read ahead from the `--read-ahead-mb` option, or None
+        to read the files without a read-ahead thread
+    """
+    read_ahead_mb = getattr(options, 'read_ahead_mb', None)
+    if not read_ahead_mb:
+        return None
+    return read_ahead_mb * 1024 * 1024
+
+
+def get_file_size(filename):
+    try:
+        return os.path.getsize(filename)
+    except OSError:
+        LOG.error(f'Unable to determine the size of {filename}')
+        return 0
+
+
+def storeMessages(storage, pending, max_pending=0):
+    """
+    Store parsed messages in the order they were parsed
+
+    :param pending: deque of (hash futures, message row, malformed reason)
+        tuples; the hash futures are None when the content is not hashed
+    :param max_pending: messages left waiting on their hashes; the oldest
+        are waited for beyond that, and all of them for zero
+    """
+    while pending:
+        hashes, msg_row, malformed = pending[0]
+        if (
+            len(pending) <= max_pending and
+            hashes is not None and
+            not all(msg_hash.done() for msg_hash in hashes)
+        ):
+            return
+        pending.popleft()
+
+        msg_id, location, id_header, id_header_hash, start_offset, end_offset, msg_key = msg_row
+        try:
+            msg_hash, disk_hash = (
+                (hashes[0].result(), hashes[1].result())
+                if hashes is not None
+                else (None, None)
+            )
+            storage.add_message(
+                msg_hash,  # hash for comparisons
+                msg_id,
+                location,
+                id_header,
+                id_header_hash,
+                start_offset,
+                end_offset,
+                disk_hash,  # hash to ensure we read the right thing
+                msg_key,
+            )
+            if malformed is not None:
+                # kept for deduplication, listed for inspection
+                storage.add_quarantine(msg_id, location, start_offset, end_offset, malformed)
+        except Exception:
+            LOG.exception(f'File: {location} - Message ID: {msg_id} - Start: {start_offset} - End: {end_offset}')
+            raise
+
+
+async def processFile(filename, storage, counter_update=None, tracker=None, strategy=strategy_content, mapped=False, skip_expunged=True, use_summary=False, read_ahead=None, hash_pool=None):
     box = mbox.Mailbox(None, filename)
 
+    # content hashes are deferred to `hashMessageIdCandidates`
+    hash_content = strategy != strategy_message_id
+    # the Message-ID strategy only needs the offsets and Message-IDs the
+    # Thunderbird summary already has, so the file need not be parsed
+    summary_messages = (
+        mbox.mboxsummary.load_summary(filename)
+        if use_summary and not hash_content
+        else None
+    )
+    # messages parsed but not stored yet, waiting on their hashes
+    pending = collections.deque()
+    max_pending = (
+        hash_pool.max_pending
+        if hash_pool is not None
+        else 0
+    )
     counter = 0
+    quarantined = 0
+    expunged = 0
+    message_bytes = 0
+    # offset into the file already reported to the progress tracker
+    position = 0
+    if tracker is not None:
+        tracker.start_file(filename, get_file_size(filename))
     try:
         LOG.info(f'Processing records...')
-        for msg in box.buildSummary():
-            try:
-                storage.add_message(
-                    msg.getHash(diskHash=False),  # hash for comparisons
-                    msg.getMsgId(),  # id
-                    filename,  # location
-                    msg.getMessageIDHeader(),  # 2nd id from the headers
-                    msg.getMessageIDHeaderHash(),  # 2nd hash
-                    msg.start_offset,
-                    msg.end_offset,
-                    msg.getHash(diskHash=True),  # hash to ensure we read the right thing
-                )
-                counter = counter + 1
-                if time.check_yield(counter, 10000) == 0:
-                    LOG.info(f"Record Counter: {counter}")
-
-            except Exception:
-                LOG.exception(f'File: {filename} - Message ID: {msg.getMsgId()} - Start: {msg.start_offset} - End: {msg.end_offset}')
-                raise
+        messages = (
+            summary_messages
+            if summary_messages is not None
+            else box.buildSummary(mapped=mapped, read_ahead=read_ahead)
+        )
+        for msg in messages:
+            if skip_expunged and msg.isExpunged():
+                # Thunderbird drops it when compacting the folder
+                expunged = expunged + 1
+            else:
+                try:
+                    pending.append(
+                        (
+                            hashpool.hash_message(msg, hash_pool) if hash_content else None,
+                            (
+                                msg.getMsgId(),  # id
+                                filename,  # location
+                                msg.getMessageIDHeader(),  # 2nd id from the headers
+                                msg.getMessageIDHeaderHash(),  # 2nd hash
+                                msg.start_offset,
+                                msg.end_offset,
+                                msg.getMessageIDKey(),  # groups by Message-ID
+                            ),
+                            msg.malformed,
+                        )
+                    )
+                    if msg.malformed is not None:
+                        quarantined = quarantined + 1
+                    counter = counter + 1
+                    message_bytes = message_bytes + (msg.end_offset - msg.start_offset)
+                    if time.check_yield(counter, summary_interval):
+                        LOG.info('%s: Record Counter: %d', filename, counter)
+
+                except Exception:
+                    LOG.exception(f'File: {filename} - Message ID: {msg.getMsgId()} - Start: {msg.start_offset} - End: {msg.end_offset}')
+                    raise
+                storeMessages(storage, pending, max_pending)
+
+            # raises progress.ErrCancelled when the run is cancelled; the
+            # input offset is into the file on disk even when it is compressed
+            if tracker is not None and box.input_offset > position:
+                tracker.advance(box.input_offset - position, filename=filename)
+                position = box.input_offset
+
+        storeMessages(storage, pending)
 
     except mbox.ErrInvalidFileFormat as ex:
         LOG.error(f'Invalid file format detected: {ex}')
+        # keep the messages before the invalid data
+        storeMessages(storage, pending)
 
     except mbox.ErrEmptyFile as ex:
         LOG.info(f"Detected empty file - {filename}")
 
     else:
-        LOG.info(f"Detected {counter} messages in {filename}")
+        LOG.info(f"Detected {counter} messages in {filename}; skipped {expunged} expunged messages")
+
+    finally:
+        metrics.REGISTRY.increment(metrics.files_processed)
+        if summary_messages is not None:
+            metrics.REGISTRY.increment(metrics.messages_from_summary, counter + expunged)
+        else:
+            metrics.REGISTRY.increment(metrics.bytes_read, message_bytes)
+            metrics.REGISTRY.increment(metrics.messages_parsed, counter + expunged)
+        metrics.REGISTRY.increment(metrics.messages_skipped_expunged, expunged)
+        metrics.REGISTRY.increment(metrics.messages_quarantined, quarantined)
+        # parsed hash, disk hash, and the Message-ID hash
+        metrics.REGISTRY.increment(metrics.hashes_computed, counter * (3 if hash_content else 1))
+        metrics.REGISTRY.increment(metrics.db_rows_inserted, counter)
+        if tracker is not None:
+            tracker.finish_file(filename)
+            # account for anything the parser skipped or did not reach
+            # so the file counts as complete
+            remaining = get_file_size(filename) - position
+            if remaining > 0 and not tracker.cancelled:
+                tracker.advance(remaining)
 
     if counter_update is not None:
         counter_update()
 
 
-async def dedupper(mboxfiles, msg_hash_storage_location, use_disk_data_for_hash=False, output_base_path=None):
+def hashMessageIdCandidates(storage, hash_pool=None):
+    """
+    Hash the content of the messages the Message-ID can not tell apart
+
+    Messages that share a Message-ID, or have none, are read back and
+    hashed the same way `processFile` would have; every other message is
+    grouped by its Message-ID alone.
+
+    :return: number of messages hashed
+    """
+    candidates = storage.get_message_id_candidates()
+    max_pending = (
+        hash_pool.max_pending
+        if hash_pool is not None
+        else 0
+    )
+    pending_hashes = collections.deque()
+    message_hashes = []
+
+    def collect_hashes(keep):
+        while len(pending_hashes) > keep:
+            rowid, (msg_hash, disk_hash) = pending_hashes.popleft()
+            message_hashes.append((rowid, msg_hash.result(), disk_hash.result()))
+
+    # the candidates are in file order so each file is only read forward
+    with mbox.MessageReader() as message_reader:
+        for candidate in candidates:
+            msgData = mbox.Mailbox.getMessageFromFile(candidate, message_reader)
+            msg = mbox.Mailbox.parseRecord(msgData, candidate['last_record'])
+            pending_hashes.append(
+                (
+                    candidate['rowid'],
+                    hashpool.hash_message(msg, hash_pool),
+                )
+            )
+            metrics.REGISTRY.increment(metrics.bytes_read, len(msgData))
+            collect_hashes(max_pending)
+    collect_hashes(0)
+    storage.set_message_hashes(message_hashes)
+    storage.set_message_id_hashes()
+
+    metrics.REGISTRY.increment(metrics.hashes_computed, len(message_hashes) * 2)
+    metrics.REGISTRY.increment(metrics.messages_content_hashed, len(message_hashes))
+    return len(message_hashes)
+
+
+def writeMessageGroup(output_data, unique_hashid, msgs_for_hash, part_store=None, message_reader=None):
+    """
+    Write the first message of a group of duplicates that can be read back
+
+    With a `part_store` the large MIME parts are stored there and replaced
+    by references in the output.
+
+    :param message_reader: `mbox.MessageReader` the messages are read with
+    :return: True if a message was written
+    """
+    for msg_for_hash in msgs_for_hash:
+        msgData = mbox.Mailbox.getMessageFromFile(msg_for_hash, message_reader)
+        msgDataHasher = hashlib.sha256()
+        msgDataHasher.update(encoder.to_encoding(msgData))
+        msgDataHash = msgDataHasher.hexdigest()
+        metrics.REGISTRY.increment(metrics.bytes_read, len(msgData))
+        metrics.REGISTRY.increment(metrics.hashes_computed)
+        # messages grouped by Message-ID alone have no disk hash to check
+        if msg_for_hash['disk_hash'] is not None and msgDataHash != msg_for_hash['disk_hash']:
+            LOG.info(f'Unable to rebuild message with hash {unique_hashid} - got {msgDataHash} - {msgData}')
+            metrics.REGISTRY.increment(metrics.messages_unrecoverable)
+            with open(f"{msgDataHash}.orig-{unique_hashid}.mboxrecord", "wb") as msg_recorder:
+                msg_recorder.write(msgData)
+                msg_recorder.flush()
+            continue
+
+        if part_store is not None:
+            msgData = part_store.externalize(msgData)
+        output_data.write(msgData)
+        metrics.REGISTRY.increment(metrics.bytes_written, len(msgData))
+        metrics.REGISTRY.increment(metrics.messages_written)
+
+        # just take the first entry
+        return True
+    return False
+
+
+def writeUniqueMessages(storage, output_filename, use_disk_data_for_hash=False, output_format=None):
+    output_format = (
+        output_format
+        if output_format is not None
+        else output.OutputFormat()
+    )
+    with output_format.open(output_filename) as output_data, mbox.MessageReader() as message_reader:
+        wcounter = 0
+        for unique_hashid, msgs_for_hash in storage.get_unique_messages(use_disk=use_disk_data_for_hash):
+            writeMessageGroup(
+                output_data,
+                unique_hashid,
+                msgs_for_hash,
+                output_format.part_store,
+                message_reader,
+            )
+
+            wcounter = wcounter + 1
+            if time.check_yield(wcounter, 1000) and wcounter % summary_interval == 0:
+                LOG.info('%s: Wrote %d records', output_filename, wcounter)
+    return wcounter
+
+
+def writeShard(output_format, shard_filename, message_groups):
+    # each shard holds a run of messages in file order; its reader is not
+    # shared with the other shard writers
+    with output_format.open(shard_filename) as output_data, mbox.MessageReader() as message_reader:
+        for unique_hashid, msgs_for_hash in message_groups:
+            writeMessageGroup(output_data, unique_hashid, msgs_for_hash, output_format.part_store, message_reader)
+    LOG.info('%s: Wrote %d records', shard_filename, len(message_groups))
+    metrics.REGISTRY.increment(metrics.shards_written)
+    return len(message_groups)
+
+
+def writeShardedMessages(storage, output_filename, use_disk_data_for_hash, output_format):
+    """
+    Write the unique messages into shards, several shards at a time
+
+    The database is only read from this thread; each shard is handed to a
+    worker with everything it needs to read its messages.
+
+    :return: tuple (number of records, list of shard filenames)
+    """
+    shard_filenames = []
+    pending = set()
+    wcounter = 0
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=output_format.workers,
+        thread_name_prefix='shard-writer',
+    ) as executor:
+
+        def submit(message_groups):
+            nonlocal pending, wcounter
+            # keep a bounded number of shards in memory
+            while len(pending) >= output_format.workers * 2:
+                done, pending = concurrent.futures.wait(
+                    pending,
+                    return_when=concurrent.futures.FIRST_COMPLETED,
+                )
+                wcounter = wcounter + sum(future.result() for future in done)
+
+            shard_filename = output_format.filename(output_filename, len(shard_filenames) + 1)
+            shard_filenames.append(shard_filename)
+            pending.add(
+                executor.submit(writeShard, output_format, shard_filename, message_groups)
+            )
+
+        message_groups = []
+        shard_bytes = 0
+        for unique_hashid, msgs_for_hash in storage.get_unique_messages(use_disk=use_disk_data_for_hash):
+            # the size of the message that is expected to be written
+            message_bytes = (
+                msgs_for_hash[0]['end_offset'] - msgs_for_hash[0]['start_offset']
+                if msgs_for_hash
+                else 0
+            )
+            if message_groups and output_format.is_shard_full(
+                len(message_groups) + 1,
+                shard_bytes + message_bytes,
+            ):
+                submit(message_groups)
+                message_groups = []
+                shard_bytes = 0
+
+            message_groups.append((unique_hashid, msgs_for_hash))
+            shard_bytes = shard_bytes + message_bytes
+
+        # always write at least one shard so there is an output file
+        if message_groups or not shard_filenames:
+            submit(message_groups)
+
+        wcounter = wcounter + sum(future.result() for future in pending)
+    return (wcounter, shard_filenames)
+
+
+async def dedupper(
+    mboxfiles,
+    msg_hash_storage_location,
+    use_disk_data_for_hash=False,
+    output_base_path=None,
+    tracker=None,
+    output_format=None,
+    strategy=strategy_content,
+    mapped=False,
+    expunger=None,
+    skip_expunged=True,
+    use_summary=False,
+    read_ahead=None,
+    hash_pool=None,
+):
     # NOTE: in testing found that `use_disk_data_for_hash == True` results
     #   in twice as many files as `use_disk_data_for_hash == False` with
     #   the difference between deplicates. Thus the parameter value defaults
     #   to False as it yields better results
+    #
+    # NOTE: when `tracker` is provided the caller is responsible for its
+    #   total; otherwise a tracker is created for the files given here
+    #
+    # NOTE: returns the output filename, or the list of shard filenames
+    #   when `output_format` shards the output
+    #
+    # NOTE: with an `expunger` no output is written; the duplicates are
+    #   marked as expunged in place and the journal filename is returned
+    #
+    # NOTE: a `hash_pool` may be shared by several calls; the caller is
+    #   responsible for closing it
+    output_format = (
+        output_format
+        if output_format is not None
+        else output.OutputFormat()
+    )
+
+    if use_summary and strategy != strategy_message_id:
+        LOG.warning(f'Thunderbird summaries are only used with the {strategy_message_id} strategy')
 
     storage = db.MessageDatabase(msg_hash_storage_location)
 
-    counters = {
-        "completed": 0.0,
-        "total": 0.0,
-    }
-
-    def counter_update():
-        counters['completed'] = counters['completed'] + 1.0
-        if counters['total'] > 0:
-            percentage = (counters['completed'] / counters['total']) * 100.0
-            msg = (
-                f'[{output_base_path}] ' if output_base_path is not None else ''
-            )
-            msg = msg + f'Progress Report: {percentage:03.02f}'
-            LOG.info(msg)
+    owns_tracker = tracker is None
+    if owns_tracker:
+        tracker = progress.create(
+            output_base_path if output_base_path is not None else "Dedup",
+            total_bytes=sum(
+                get_file_size(filename)
+                for filename in mboxfiles
+            ),
+        )
 
     allFiles = '\n'.join(mboxfiles)
     LOG.info(f"Found {len(mboxfiles)} files to process:\n{allFiles}")
     file_tasks = []
     for filename in mboxfiles:
         file_task = asyncio.create_task(
-            processFile(filename, storage, counter_update=counter_update),
+            processFile(
+                filename,
+                storage,
+                tracker=tracker,
+                strategy=strategy,
+                mapped=mapped,
+                skip_expunged=skip_expunged,
+                use_summary=use_summary,
+                read_ahead=read_ahead,
+                hash_pool=hash_pool,
+            ),
         )
         file_tasks.append(file_task)
-    counters['total'] = len(file_tasks)
 
-    file_results = await asyncio.gather(*file_tasks)
+    with time.TimeTracker("Dedup Ingest"):
+        try:
+            file_results = await asyncio.gather(*file_tasks)
+        except progress.ErrCancelled:
+            LOG.info(f'Cancelled while processing {output_base_path}')
+            storage.close()
+            raise
+    if owns_tracker:
+        tracker.report()
+    if strategy == strategy_message_id:
+        with time.TimeTracker("Dedup Message-ID Groups"):
+            hashed_count = hashMessageIdCandidates(storage, hash_pool)
+        LOG.info(f"Hashed the content of {hashed_count} messages sharing a Message-ID or without one")
     LOG.info(f"[DISK  ] Detected {storage.get_unique_message_count(use_disk=True)} unique records")
     LOG.info(f"[PARSED] Detected {storage.get_unique_message_count(use_disk=False)} unique records")
     if storage.get_unique_message_count(use_disk=True) != storage.get_unique_message_count(use_disk=False):
         LOG.info(f"** WARNING ** Hash Source Choice may result in different output results -- Using {'DISK' if use_disk_data_for_hash else 'PARSED'}")
+    quarantine_count = storage.get_quarantine_count()
+    if quarantine_count:
+        LOG.warning(f"** WARNING ** {quarantine_count} messages could not be fully parsed; they are listed in the quarantine table of {msg_hash_storage_location}")
+
+    if expunger is not None:
+        if tracker.cancelled:
+            storage.close()
+            raise progress.ErrCancelled(f'Cancelled before expunging {msg_hash_storage_location}')
+        with time.TimeTracker("Dedup Expunge"):
+            expunger.expunge(storage, use_disk_data_for_hash)
+        storage.close()
+        for filename in mboxfiles:
+            mbox.release_index(filename)
+        return expunger.journal_filename
 
     utc_time = datetime.datetime.utcnow()
     output_filename_timestamp = utc_time.strftime("%Y%m%d_%H%M%S%f_deduplicated.mbox")
@@ -134,45 +543,74 @@ async def dedupper(mboxfiles, msg_hash_storage_location, use_disk_data_for_hash=
         )
     )
 
-    LOG.info(f"Writing unique records to {output_filename}")
-    with open(output_filename, "wb") as output_data:
-        wcounter = 0
-        for unique_hashid in storage.get_message_hashes(use_disk=use_disk_data_for_hash):
-            for msg_for_hash in storage.get_messages_by_hash(unique_hashid, use_disk=use_disk_data_for_hash):
-                msgData = mbox.Mailbox.getMessageFromFile(msg_for_hash)
-                msgDataHasher = hashlib.sha256()
-                msgDataHasher.update(encoder.to_encoding(msgData))
-                msgDataHash = msgDataHasher.hexdigest()
-                if msgDataHash != msg_for_hash['disk_hash']:
-                    LOG.info(f'Unable to rebuild message with hash {unique_hashid} - got {msgDataHash} - {msgData}')
-                    with open(f"{msgDataHash}.orig-{unique_hashid}.mboxrecord", "wb") as msg_recorder:
-                        msg_recorder.write(msgData)
-                        msg_recorder.flush()
-                    continue
-
-                output_data.write(msgData)
-                output_data.flush()
-
-                # just take the first entry
-                break
-
-            wcounter = wcounter + 1
-            time.check_yield(wcounter, 1000)
+    if tracker.cancelled:
+        storage.close()
+        raise progress.ErrCancelled(f'Cancelled before writing {output_filename}')
+
+    with time.TimeTracker("Dedup Output"):
+        if output_format.sharded:
+            LOG.info(f"Writing unique records to shards of {output_filename}")
+            wcounter, output_result = writeShardedMessages(
+                storage,
+                output_filename,
+                use_disk_data_for_hash,
+                output_format,
+            )
+        else:
+            output_result = output_format.filename(output_filename)
+            LOG.info(f"Writing unique records to {output_result}")
+            wcounter = writeUniqueMessages(
+                storage,
+                output_result,
+                use_disk_data_for_hash,
+                output_format,
+            )
     LOG.info(f'Wrote {wcounter} records')
+    if output_format.part_store is not None:
+        output_format.part_store.report()
     # close the database and free up some memory
     # it's not sent any where else so it can be safely closed now
     storage.close()
-    return output_filename
+    # seek points kept for compressed inputs are no longer needed
+    for filename in mboxfiles:
+        mbox.release_index(filename)
+    return output_result
 
 
 # wrap for the command-line
-async def asyncDedup(options):
+async def asyncDedup(options, tracker=None):
     locationProcessor = mbox.MailboxFolder(options.location)
     with time.TimeTracker("File Search"):
         mboxfiles = await locationProcessor.getMboxFiles()
     use_disk_data_for_hash = source_option_to_boolean(
         options.msg_hash_source
     )
+    if tracker is not None:
+        for filename in mboxfiles:
+            tracker.add_total(get_file_size(filename))
 
-    with time.TimeTracker("Deduplicator"):
-        await dedupper(mboxfiles, options.hash_storage, use_disk_data_for_hash)
+    # large messages are hashed on these threads while parsing continues
+    hash_pool = hashpool.HashPool.from_options(options)
+    try:
+        with time.TimeTracker("Deduplicator"):
+            await dedupper(
+                mboxfiles,
+                options.hash_storage,
+                use_disk_data_for_hash,
+                tracker=tracker,
+                output_format=output.OutputFormat.from_options(options),
+                strategy=getattr(options, 'strategy', None) or strategy_content,
+                mapped=getattr(options, 'mmap', False),
+                skip_expunged=not getattr(options, 'include_expunged', False),
+                use_summary=getattr(options, 'use_msf', False),
+                read_ahead=get_read_ahead(options),
+                hash_pool=hash_pool,
+                expunger=(
+                    expunge.Expunger.from_options(options)
+                    if getattr(options, 'mode', None) == mode_expunge
+                    else None
+                ),
+            )
+    finally:
+        if hash_pool is not None:
+            hash_pool.close()
@@ -0,0 +1,110 @@
+"""
+Copyright 2023 Benjamen R. Meyer
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import threading
+
+from tbdedup import (
+    combinatory,
+    dedup,
+)
+from tbdedup.utils import (
+    progress,
+)
+
+LOG = logging.getLogger(__name__)
+
+job_dedup = 'dedup'
+job_combinatory = 'do'
+job_choices = [
+    job_dedup,
+    job_combinatory,
+]
+
+# seconds between the progress snapshots sent back to the caller
+report_interval = 0.5
+
+# set in the worker process by `initialize`; queues and events can only be
+# handed to a worker process when it is created
+_progress_queue = None
+_cancel_event = None
+
+
+def initialize(progress_queue, cancel_event):
+    """
+    Worker process initializer for `concurrent.futures.ProcessPoolExecutor`
+
+    :param progress_queue: queue receiving the progress snapshots
+    :param cancel_event: event set by the caller to cancel the job
+    """
+    global _progress_queue
+    global _cancel_event
+    _progress_queue = progress_queue
+    _cancel_event = cancel_event
+
+
+def _queue_listener(snapshot):
+    _progress_queue.put(snapshot)
+
+
+def _watch_for_cancel(tracker):
+    _cancel_event.wait()
+    LOG.info(f'Cancelling {tracker.name}')
+    tracker.cancel()
+
+
+def run_job(job, options):
+    """
+    Run a dedup or combinatory job, reporting progress to the queue given to
+    `initialize`
+
+    :param job: one of `job_choices`
+    :param options: dict of the command-line options for the job
+    :return: True if the job completed, False if it was cancelled
+    """
+    tracker = progress.ProgressTracker(job, report_interval=report_interval)
+    tracker.add_listener(progress.log_listener)
+    if _progress_queue is not None:
+        tracker.add_listener(_queue_listener)
+    if _cancel_event is not None:
+        if _cancel_event.is_set():
+            tracker.cancel()
+        else:
+            threading.Thread(
+                target=_watch_for_cancel,
+                args=(tracker,),
+                daemon=True,
+            ).start()
+
+    job_options = argparse.Namespace(**options)
+    try:
+        if job == job_dedup:
+            # dedup writes its output into the current directory
+            if getattr(job_options, 'output_directory', None) is not None:
+                os.chdir(job_options.output_directory)
+            asyncio.run(dedup.asyncDedup(job_options, tracker=tracker))
+        elif job == job_combinatory:
+            asyncio.run(combinatory.asyncCombinatory(job_options, tracker=tracker))
+        else:
+            raise ValueError(f'Unknown job {job}')
+    except progress.ErrCancelled:
+        LOG.info(f'{job} job cancelled')
+        return False
+    finally:
+        tracker.report()
+    return True
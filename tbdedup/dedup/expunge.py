@@ -0,0 +1,304 @@
+"""
+Copyright 2023 Benjamen R. Meyer
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import datetime
+import hashlib
+import logging
+import os
+import re
+
+from tbdedup import (
+    mbox,
+)
+from tbdedup.utils import (
+    json,
+    metrics,
+)
+
+LOG = logging.getLogger(__name__)
+
+MSG_FLAG_EXPUNGED = mbox.mboxmessage.MSG_FLAG_EXPUNGED
+
+# the fixed width status field Thunderbird writes into every message
+statusHeaderMatch = re.compile(
+    rb'^X-Mozilla-Status:[ \t]*([0-9a-fA-F]{4})[ \t]*\r?$',
+    re.IGNORECASE | re.MULTILINE,
+)
+headerEndMatch = re.compile(rb'\r?\n\r?\n')
+
+# journal entry keys
+journal_location = 'location'
+journal_offset = 'offset'
+journal_old = 'old'
+journal_new = 'new'
+journal_messageid = 'messageid'
+
+
+def find_status(msg_data):
+    """
+    :param msg_data: raw record, starting at its MBOX FROM line
+    :return: tuple of the offset of the status digits in the record and the
+        status value, or None if the record has no X-Mozilla-Status header
+    """
+    header_end = headerEndMatch.search(msg_data)
+    status = statusHeaderMatch.search(
+        msg_data,
+        0,
+        header_end.start() if header_end is not None else len(msg_data),
+    )
+    if status is None:
+        return None
+    return status.start(1), int(status.group(1), 16)
+
+
+def format_status(value):
+    return b'%04x' % value
+
+
+def write_at(fd, data, offset):
+    if hasattr(os, 'pwrite'):
+        return os.pwrite(fd, data, offset)
+    os.lseek(fd, offset, os.SEEK_SET)
+    return os.write(fd, data)
+
+
+def read_at(fd, length, offset):
+    if hasattr(os, 'pread'):
+        return os.pread(fd, length, offset)
+    os.lseek(fd, offset, os.SEEK_SET)
+    return os.read(fd, length)
+
+
+def default_journal_filename():
+    utc_time = datetime.datetime.utcnow()
+    return utc_time.strftime("%Y%m%d_%H%M%S%f_expunge_journal.jsonl")
+
+
+class Expunger(object):
+    """
+    Mark duplicate messages as expunged in the MBOX files themselves
+
+    Instead of writing a new MBOX file the X-Mozilla-Status header of every
+    duplicate gets the expunged flag, a four byte write per message, and
+    Thunderbird removes them the next time it compacts the folder. Every
+    write is recorded in a JSON Lines journal first so `undo` can put the
+    original values back.
+    """
+
+    def __init__(self, journal_filename=None, dry_run=False):
+        self.journal_filename = (
+            journal_filename
+            if journal_filename is not None
+            else default_journal_filename()
+        )
+        self.dry_run = dry_run
+        self.journal = None
+        self.file_descriptors = {}
+        self.compressed = {}
+
+        self.expunged = 0
+        # duplicates that were already expunged
+        self.already_expunged = 0
+        # duplicates without an X-Mozilla-Status header
+        self.no_status = 0
+        # duplicates that did not match the hash storage or are compressed
+        self.skipped = 0
+
+    @classmethod
+    def from_options(cls, options):
+        return cls(
+            journal_filename=getattr(options, 'expunge_journal', None),
+            dry_run=getattr(options, 'dry_run', False),
+        )
+
+    def is_compressed(self, location):
+        if location not in self.compressed:
+            self.compressed[location] = mbox.mboxcompress.detect_compression(location) is not None
+        return self.compressed[location]
+
+    def get_fd(self, location):
+        if location not in self.file_descriptors:
+            self.file_descriptors[location] = os.open(location, os.O_RDWR)
+        return self.file_descriptors[location]
+
+    def write_journal(self, entry):
+        if self.journal is None:
+            self.journal = open(self.journal_filename, 'at')
+        self.journal.write(json.dumps_line(entry))
+        self.journal.write('\n')
+        # the entry must be on disk before the MBOX file changes
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+
+    def read_message(self, msg_for_hash):
+        """
+        :return: the record if it still matches the hash storage, else None
+        """
+        if self.is_compressed(msg_for_hash['location']):
+            return None
+        msgData = mbox.Mailbox.getMessageFromFile(msg_for_hash)
+        metrics.REGISTRY.increment(metrics.bytes_read, len(msgData))
+        if msg_for_hash['disk_hash'] is not None:
+            if hashlib.sha256(msgData).hexdigest() != msg_for_hash['disk_hash']:
+                return None
+        elif not mbox.Mailbox.mboxMessageStart.match(msgData[:7].decode('latin1')):
+            return None
+        return msgData
+
+    def expunge_group(self, msgs_for_hash):
+        """
+        Keep the first message of a group of duplicates and expunge the rest
+
+        :return: number of messages expunged
+        """
+        kept = False
+        expunged = 0
+        for msg_for_hash in msgs_for_hash:
+            msgData = self.read_message(msg_for_hash)
+            if msgData is None:
+                LOG.info(f"{msg_for_hash['location']}[{msg_for_hash['start_offset']}] does not match the hash storage; skipped")
+                self.skipped = self.skipped + 1
+                continue
+
+            status = find_status(msgData)
+            if status is not None and status[1] & MSG_FLAG_EXPUNGED:
+                self.already_expunged = self.already_expunged + 1
+                continue
+            if not kept:
+                kept = True
+                continue
+            if status is None:
+                self.no_status = self.no_status + 1
+                continue
+
+            status_offset, status_value = status
+            old_digits = msgData[status_offset:status_offset + 4]
+            new_digits = format_status(status_value | MSG_FLAG_EXPUNGED)
+            # in the case the file uses, so only the flag digit changes
+            if old_digits.isupper():
+                new_digits = new_digits.upper()
+            entry = {
+                # undo may run from another directory
+                journal_location: os.path.abspath(msg_for_hash['location']),
+                journal_offset: msg_for_hash['start_offset'] + status_offset,
+                journal_old: old_digits.decode('ascii'),
+                journal_new: new_digits.decode('ascii'),
+                journal_messageid: msg_for_hash['messageid'],
+            }
+            if self.dry_run:
+                LOG.debug(f'Would expunge {entry}')
+            else:
+                self.write_journal(entry)
+                write_at(
+                    self.get_fd(entry[journal_location]),
+                    entry[journal_new].encode('ascii'),
+                    entry[journal_offset],
+                )
+                metrics.REGISTRY.increment(metrics.bytes_written, len(entry[journal_new]))
+                metrics.REGISTRY.increment(metrics.messages_expunged)
+            expunged = expunged + 1
+        self.expunged = self.expunged + expunged
+        return expunged
+
+    def expunge(self, storage, use_disk_data_for_hash=False):
+        """
+        :return: number of messages expunged, or that would be for a dry run
+        """
+        try:
+            for unique_hashid in storage.get_message_hashes(use_disk=use_disk_data_for_hash):
+                msgs_for_hash = list(
+                    storage.get_messages_by_hash(
+                        unique_hashid,
+                        use_disk=use_disk_data_for_hash,
+                    )
+                )
+                if len(msgs_for_hash) > 1:
+                    self.expunge_group(msgs_for_hash)
+        finally:
+            self.close()
+        self.report()
+        return self.expunged
+
+    def report(self):
+        action = (
+            'Would expunge'
+            if self.dry_run
+            else 'Expunged'
+        )
+        LOG.info(
+            f'{action} {self.expunged} duplicates; {self.already_expunged} already expunged, '
+            f'{self.no_status} without an X-Mozilla-Status header, {self.skipped} skipped'
+        )
+        if self.expunged and not self.dry_run:
+            LOG.info(f'Journal written to {self.journal_filename}')
+
+    def close(self):
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        for fd in self.file_descriptors.values():
+            os.close(fd)
+        self.file_descriptors = {}
+
+
+def undo(journal_filename, dry_run=False):
+    """
+    Put back the X-Mozilla-Status values recorded in an expunge journal
+
+    Entries are undone last to first. A value that is neither the expunged
+    nor the original one means the file changed since; it is left alone.
+
+    :return: number of messages restored
+    """
+    entries = list(json.load_lines_from_file(journal_filename))
+    restored = 0
+    mismatched = 0
+    file_descriptors = {}
+    try:
+        for entry in reversed(entries):
+            location = entry[journal_location]
+            if location not in file_descriptors:
+                file_descriptors[location] = os.open(location, os.O_RDWR)
+            fd = file_descriptors[location]
+
+            old_value = entry[journal_old].encode('ascii')
+            new_value = entry[journal_new].encode('ascii')
+            current_value = read_at(fd, len(new_value), entry[journal_offset])
+            if current_value == old_value:
+                continue
+            if current_value != new_value:
+                LOG.warning(
+                    f'{location}[{entry[journal_offset]}] is {current_value!r}, '
+                    f'expected {new_value!r}; left alone'
+                )
+                mismatched = mismatched + 1
+                continue
+            if not dry_run:
+                write_at(fd, old_value, entry[journal_offset])
+            restored = restored + 1
+    finally:
+        for fd in file_descriptors.values():
+            os.close(fd)
+
+    LOG.info(
+        f"{'Would restore' if dry_run else 'Restored'} {restored} messages from "
+        f"{journal_filename}; {mismatched} changed since"
+    )
+    return restored
+
+
+# wrap for the command-line
+async def asyncUndo(options):
+    undo(options.journal, dry_run=options.dry_run)
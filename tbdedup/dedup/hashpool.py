@@ -0,0 +1,111 @@
+"""
+Copyright 2023 Benjamen R. Meyer
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import concurrent.futures
+import hashlib
+import logging
+
+from tbdedup.utils import (
+    metrics,
+)
+
+LOG = logging.getLogger(__name__)
+
+# messages smaller than this are hashed right away; handing them to a
+# thread costs more than hashing them
+default_min_size = 1024 * 1024
+
+
+def hash_buffers(buffers):
+    mhash = hashlib.sha256()
+    for buffer in buffers:
+        # hashlib lets go of the GIL for large buffers
+        mhash.update(buffer)
+    return mhash.hexdigest()
+
+
+def completed(value):
+    future = concurrent.futures.Future()
+    future.set_result(value)
+    return future
+
+
+def hash_message(msg, hash_pool=None):
+    """
+    :return: tuple of futures of the parsed and disk hashes of the message
+    """
+    if hash_pool is None:
+        return (
+            completed(msg.getHash(diskHash=False)),
+            completed(msg.getHash(diskHash=True)),
+        )
+    return hash_pool.hash_message(msg)
+
+
+class HashPool(object):
+    """
+    Hash large messages on a pool of threads while parsing continues
+
+    The data of each large message is copied out of the parser first, so
+    the message, and the memory map it may refer to, can go before the
+    hash is done. Smaller messages are hashed right away.
+    """
+
+    def __init__(self, thread_count, min_size=None, max_pending=None):
+        self.thread_count = thread_count
+        self.min_size = (
+            min_size
+            if min_size is not None
+            else default_min_size
+        )
+        # messages parsed but not yet stored; bounds the memory held by
+        # the copies waiting to be hashed
+        self.max_pending = (
+            max_pending
+            if max_pending is not None
+            else thread_count * 4
+        )
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=thread_count,
+            thread_name_prefix='tbdedup-hash',
+        )
+        self.pooled = 0
+        metrics.REGISTRY.set_gauge(metrics.hash_threads, thread_count)
+
+    @classmethod
+    def from_options(cls, options):
+        """
+        :return: a pool for the `--hash-threads` option, or None to hash on
+            the event loop thread
+        """
+        thread_count = getattr(options, 'hash_threads', None)
+        if not thread_count:
+            return None
+        return cls(thread_count)
+
+    def hash_message(self, msg):
+        if msg.end_offset - msg.start_offset < self.min_size:
+            return hash_message(msg)
+
+        self.pooled = self.pooled + 1
+        metrics.REGISTRY.increment(metrics.messages_hashed_in_pool)
+        return (
+            self.executor.submit(hash_buffers, msg.getHashData(diskHash=False)),
+            self.executor.submit(hash_buffers, msg.getHashData(diskHash=True)),
+        )
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        LOG.info(f'Hashed {self.pooled} messages on {self.thread_count} threads')
@@ -0,0 +1,145 @@
+"""
+Copyright 2023 Benjamen R. Meyer
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import bz2
+import gzip
+import logging
+import lzma
+
+from . import parts
+
+LOG = logging.getLogger(__name__)
+
+output_compression_none = 'none'
+output_compression_gzip = 'gzip'
+output_compression_xz = 'xz'
+output_compression_bz2 = 'bz2'
+output_compression_choices = [
+    output_compression_none,
+    output_compression_gzip,
+    output_compression_xz,
+    output_compression_bz2,
+]
+output_extensions = {
+    output_compression_none: '',
+    output_compression_gzip: '.gz',
+    output_compression_xz: '.xz',
+    output_compression_bz2: '.bz2',
+}
+
+# number of shards written at the same time
+default_workers = 4
+
+
+class OutputFormat(object):
+    """
+    How the deduplicated messages are written
+
+    Output may be compressed, and may be split into shards once a shard
+    holds `shard_max_bytes` of MBOX data or `shard_max_messages` messages;
+    the limits are on the uncompressed data. Shards are written in
+    parallel by `workers` threads. With a `part_store` the large MIME parts
+    of each message are kept in the store instead of the output.
+    """
+
+    def __init__(
+        self,
+        compression=output_compression_none,
+        shard_max_bytes=None,
+        shard_max_messages=None,
+        workers=default_workers,
+        part_store=None,
+    ):
+        if compression not in output_extensions:
+            raise ValueError(f'Unknown output compression {compression}')
+        for name, value in (
+            ("shard_max_bytes", shard_max_bytes),
+            ("shard_max_messages", shard_max_messages),
+            ("workers", workers),
+        ):
+            if value is not None and value < 1:
+                raise ValueError(f'{name} must be at least 1, not {value}')
+
+        self.compression = compression
+        self.shard_max_bytes = shard_max_bytes
+        self.shard_max_messages = shard_max_messages
+        self.workers = workers
+        self.part_store = part_store
+
+    @classmethod
+    def from_options(cls, options):
+        shard_max_mb = getattr(options, 'shard_max_mb', None)
+        part_store_location = getattr(options, 'part_store', None)
+        part_min_kb = getattr(options, 'part_min_kb', None)
+        return cls(
+            compression=getattr(options, 'output_compression', None) or output_compression_none,
+            shard_max_bytes=(
+                shard_max_mb * 1024 * 1024
+                if shard_max_mb is not None
+                else None
+            ),
+            shard_max_messages=getattr(options, 'shard_max_messages', None),
+            workers=getattr(options, 'output_workers', None) or default_workers,
+            part_store=(
+                parts.PartStore(
+                    part_store_location,
+                    min_part_size=(
+                        part_min_kb * 1024
+                        if part_min_kb is not None
+                        else None
+                    ),
+                )
+                if part_store_location is not None
+                else None
+            ),
+        )
+
+    @property
+    def sharded(self):
+        return self.shard_max_bytes is not None or self.shard_max_messages is not None
+
+    def is_shard_full(self, message_count, byte_count):
+        """
+        :return: True if a shard with this many messages and bytes is over
+            either limit
+        """
+        return (
+            (self.shard_max_messages is not None and message_count > self.shard_max_messages) or
+            (self.shard_max_bytes is not None and byte_count > self.shard_max_bytes)
+        )
+
+    def filename(self, output_filename, shard_number=None):
+        """
+        :param output_filename: name of the uncompressed, unsharded output
+        :param shard_number: number of the shard, starting from 1
+        :return: name of the file to write
+        """
+        if shard_number is not None:
+            base, dot, extension = output_filename.rpartition('.')
+            output_filename = (
+                f'{base}_{shard_number:04}.{extension}'
+                if dot
+                else f'{output_filename}_{shard_number:04}'
+            )
+        return output_filename + output_extensions[self.compression]
+
+    def open(self, filename):
+        if self.compression == output_compression_gzip:
+            return gzip.open(filename, 'wb')
+        elif self.compression == output_compression_xz:
+            return lzma.open(filename, 'wb')
+        elif self.compression == output_compression_bz2:
+            return bz2.open(filename, 'wb')
+        return open(filename, 'wb')
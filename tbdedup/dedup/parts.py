@@ -0,0 +1,242 @@
+"""
+Copyright 2023 Benjamen R. Meyer
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import hashlib
+import logging
+import os
+import os.path
+import re
+import tempfile
+import threading
+
+from tbdedup import (
+    mbox,
+)
+from tbdedup.utils import (
+    metrics,
+)
+
+LOG = logging.getLogger(__name__)
+
+# parts smaller than this stay in the message; a reference is ~100 bytes
+default_min_part_size = 64 * 1024
+
+# the line a stored part is replaced with in the output
+part_reference_format = b'X-TBDedup-Part-Ref: sha256=%s size=%d\n'
+partReferenceMatch = re.compile(rb'^X-TBDedup-Part-Ref: sha256=([0-9a-f]{64}) size=(\d+)\n$')
+
+headerEndMatch = re.compile(rb'\r?\n\r?\n')
+contentTypeMatch = re.compile(
+    rb'^Content-Type:.*(?:\r?\n[ \t].*)*',
+    re.IGNORECASE | re.MULTILINE,
+)
+
+
+class ErrMissingPart(Exception):
+    pass
+
+
+def find_parts(msg_data):
+    """
+    Locate the top level MIME parts of a raw message
+
+    :param msg_data: raw message, as read from the MBOX file
+    :return: list of (start, end) offsets of each part; a part covers its
+        own headers and content up to the next boundary line
+    """
+    header_end = headerEndMatch.search(msg_data)
+    if header_end is None:
+        return []
+    content_type = contentTypeMatch.search(msg_data, 0, header_end.start())
+    if content_type is None:
+        return []
+    # same boundary parsing the MBOX parser uses
+    try:
+        marker = mbox.Mailbox.boundaryMarkerFromHeader(content_type.group(0))
+    except mbox.ErrMalformedBoundary:
+        # kept whole
+        return []
+    if not marker:
+        return []
+    marker = marker.encode('latin1')
+    closing_marker = marker + b'--'
+
+    parts = []
+    part_start = None
+    offset = header_end.end()
+    data_length = len(msg_data)
+    while offset < data_length:
+        line_end = msg_data.find(b'\n', offset)
+        line_end = (
+            line_end + 1
+            if line_end >= 0
+            else data_length
+        )
+        line = msg_data[offset:line_end].strip()
+        if line == marker or line == closing_marker:
+            if part_start is not None and offset > part_start:
+                parts.append((part_start, offset))
+            if line == closing_marker:
+                break
+            part_start = line_end
+        offset = line_end
+    return parts
+
+
+class PartStore(object):
+    """
+    Content addressed store of MIME parts
+
+    Every part is stored once under its SHA-256 digest. Messages written
+    through `externalize` have each large part replaced by a reference
+    line; `reassemble` puts the parts back so the original MBOX data can
+    be rebuilt byte for byte.
+    """
+
+    def __init__(self, directory, min_part_size=None):
+        self.directory = directory
+        self.min_part_size = (
+            min_part_size
+            if min_part_size is not None
+            else default_min_part_size
+        )
+        os.makedirs(self.directory, exist_ok=True)
+
+        self.lock = threading.Lock()
+        # digests stored or being stored by this process
+        self.known = set()
+        # parts replaced by references and their total size
+        self.parts_referenced = 0
+        self.bytes_referenced = 0
+        # parts that were not in the store yet and their total size
+        self.parts_stored = 0
+        self.bytes_stored = 0
+        # size of the reference lines written in place of the parts
+        self.reference_bytes = 0
+
+    @property
+    def bytes_saved(self):
+        return self.bytes_referenced - self.bytes_stored - self.reference_bytes
+
+    def path(self, digest):
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def put(self, data):
+        """
+        Store a part unless it is already in the store
+
+        :return: the hex digest of the part
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        part_path = self.path(digest)
+        with self.lock:
+            is_new = digest not in self.known
+            self.known.add(digest)
+        if is_new and not os.path.exists(part_path):
+            part_directory = os.path.dirname(part_path)
+            os.makedirs(part_directory, exist_ok=True)
+            # written aside and renamed so a part is never seen half written
+            temp_fd, temp_path = tempfile.mkstemp(dir=part_directory, suffix='.tmp')
+            try:
+                with os.fdopen(temp_fd, 'wb') as part_output:
+                    part_output.write(data)
+                os.replace(temp_path, part_path)
+            except BaseException:
+                with self.lock:
+                    self.known.discard(digest)
+                os.unlink(temp_path)
+                raise
+            with self.lock:
+                self.parts_stored = self.parts_stored + 1
+                self.bytes_stored = self.bytes_stored + len(data)
+            metrics.REGISTRY.increment(metrics.parts_stored)
+        return digest
+
+    def get(self, digest, size=None):
+        part_path = self.path(digest)
+        try:
+            with open(part_path, 'rb') as part_input:
+                data = part_input.read()
+        except FileNotFoundError:
+            raise ErrMissingPart(f'Part {digest} is not in {self.directory}')
+        if size is not None and len(data) != size:
+            raise ErrMissingPart(f'Part {digest} is {len(data)} bytes, expected {size}')
+        return data
+
+    def externalize(self, msg_data):
+        """
+        Store the large parts of a message
+
+        :return: the message with every stored part replaced by a reference
+        """
+        output_data = []
+        position = 0
+        for start, end in find_parts(msg_data):
+            if end - start < self.min_part_size:
+                continue
+            digest = self.put(msg_data[start:end])
+            reference = part_reference_format % (digest.encode('ascii'), end - start)
+            output_data.append(msg_data[position:start])
+            output_data.append(reference)
+            position = end
+            with self.lock:
+                self.parts_referenced = self.parts_referenced + 1
+                self.bytes_referenced = self.bytes_referenced + (end - start)
+                self.reference_bytes = self.reference_bytes + len(reference)
+
+        if not output_data:
+            return msg_data
+        output_data.append(msg_data[position:])
+        return b''.join(output_data)
+
+    def report(self):
+        LOG.info(
+            f'[{self.directory}] Referenced {self.parts_referenced} parts '
+            f'({self.bytes_referenced} bytes); stored {self.parts_stored} new parts '
+            f'({self.bytes_stored} bytes); saved {self.bytes_saved} bytes'
+        )
+        metrics.REGISTRY.set_gauge(metrics.part_bytes_saved, self.bytes_saved)
+
+    def reassemble(self, data_input, output_data):
+        """
+        Rebuild the original MBOX data from output written with a store
+
+        :param data_input: binary file object of the output with references
+        :param output_data: binary file object to write the MBOX data to
+        :return: number of parts put back
+        """
+        part_count = 0
+        for line in data_input:
+            reference = partReferenceMatch.match(line)
+            if reference is None:
+                output_data.write(line)
+                continue
+            output_data.write(
+                self.get(
+                    reference.group(1).decode('ascii'),
+                    int(reference.group(2)),
+                )
+            )
+            part_count = part_count + 1
+        return part_count
+
+
+# wrap for the command-line
+async def asyncReassemble(options):
+    store = PartStore(options.part_store)
+    with mbox.mboxcompress.open_mbox(options.input) as data_input:
+        with open(options.output, 'wb') as output_data:
+            part_count = store.reassemble(data_input, output_data)
+    LOG.info(f'Rebuilt {options.output} from {options.input} with {part_count} parts')
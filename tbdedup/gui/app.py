@@ -4,6 +4,7 @@ import os.path
 from asyncslot import asyncSlot
 
 from PyQt5.QtWidgets import (
+    QComboBox,
     QFileDialog,
     QHBoxLayout,
     QLabel,
@@ -21,9 +22,20 @@ from PyQt5.QtCore import (
 )
 #from PySide6.QtAsyncio as QtAsyncio
 
+from tbdedup.dedup import (
+    background,
+)
 from tbdedup.gui import (
+    jobs,
+    model,
     searcher,
 )
+from tbdedup.utils import (
+    progress,
+)
+
+# number of files in progress shown below the progress bar
+active_file_display_count = 3
 
 class MainWindow(QMainWindow):
 
@@ -32,6 +44,7 @@ class MainWindow(QMainWindow):
         self.searcher = searcher.Searcher()
         self.searcher.progress.connect(asyncSlot(self.receive_progress))
         self.searcher.completed.connect(asyncSlot(self.receive_search_completed))
+        self.dedup_job = None
 
         self.setWindowTitle("Thunderbird MBox Deduplicator")
         layout = QVBoxLayout()
@@ -55,9 +68,26 @@ class MainWindow(QMainWindow):
         self.tree_view = QTreeView()
         layout.addWidget(self.tree_view)
 
+        # deduplication
+        dedup_layout = QHBoxLayout()
+        self.cmb_dedup_job = QComboBox()
+        self.cmb_dedup_job.addItems(background.job_choices)
+        dedup_layout.addWidget(self.cmb_dedup_job)
+        self.btn_dedup_start = QPushButton("Deduplicate...")
+        self.btn_dedup_start.clicked.connect(asyncSlot(self.dedup_start_clicked))
+        dedup_layout.addWidget(self.btn_dedup_start)
+        self.btn_dedup_cancel = QPushButton("Cancel")
+        self.btn_dedup_cancel.setEnabled(False)
+        self.btn_dedup_cancel.clicked.connect(asyncSlot(self.dedup_cancel_clicked))
+        dedup_layout.addWidget(self.btn_dedup_cancel)
+        layout.addLayout(dedup_layout)
+
         self.progress = QProgressBar()
         layout.addWidget(self.progress)
 
+        self.lbl_active_files = QLabel("")
+        layout.addWidget(self.lbl_active_files)
+
         self.status_bar = QStatusBar()
         layout.addWidget(self.status_bar)
 
@@ -82,27 +112,100 @@ class MainWindow(QMainWindow):
         print(f"Path Text Changed: {new_path}")
 
     async def receive_progress(self, value):
-        pass
+        self.progress.setValue(value)
 
     async def receive_search_completed(self):
         print("Search completed")
-        print(f'Result type: {type(self.searcher.result)}')
-        print(f"\tError: {self.searcher.error_result}")
-        print(
-            '\t'.join(
-                [
-                    v
-                    for v in (
-                        self.searcher.result
-                        if self.searcher.result is not None
-                        else []
-                    )
-                ]
+        if self.searcher.error_result is not None:
+            print(f"\tError: {self.searcher.error_result}")
+            self.status_bar.showMessage(f"Search failed: {self.searcher.error_result[1]}")
+            return
+
+        mboxfiles = (
+            self.searcher.result
+            if self.searcher.result is not None
+            else []
+        )
+        # the model only builds the rows the view displays so this stays
+        # quick no matter how many files were found
+        self.tree_view.setModel(
+            model.SearchResultModel(self.searcher.location, mboxfiles)
+        )
+        self.status_bar.showMessage(f"Found {len(mboxfiles)} MBOX files")
+
+    async def dedup_start_clicked(self):
+        folder_path = self.txt_path_selector.text()
+        if not os.path.isdir(folder_path):
+            print(f"Selected path ({folder_path}) is not a directory")
+            return
+        if self.dedup_job is not None and self.dedup_job.running:
+            self.status_bar.showMessage("Deduplication is already running")
+            return
+
+        output_path = QFileDialog.getExistingDirectory(
+            self,
+            "Select Output Path",
+            os.environ.get("HOME", "/"),
+            QFileDialog.ShowDirsOnly | QFileDialog.DontResolveSymlinks,
+        )
+        if not output_path:
+            print("Output selection cancelled")
+            return
+
+        job = self.cmb_dedup_job.currentText()
+        self.dedup_job = jobs.DedupJob(
+            job,
+            jobs.get_job_options(job, folder_path, output_path),
+        )
+        self.dedup_job.signals.progress.connect(asyncSlot(self.receive_progress))
+        self.dedup_job.signals.status.connect(asyncSlot(self.receive_dedup_status))
+        self.dedup_job.signals.result.connect(asyncSlot(self.receive_dedup_completed))
+        self.dedup_job.signals.cancelled.connect(asyncSlot(self.receive_dedup_cancelled))
+        self.dedup_job.signals.error.connect(asyncSlot(self.receive_dedup_error))
+        self.dedup_job.signals.finished.connect(asyncSlot(self.receive_dedup_finished))
+        self.progress.setValue(0)
+        self.btn_dedup_start.setEnabled(False)
+        self.btn_dedup_cancel.setEnabled(True)
+        self.dedup_job.start()
+        self.status_bar.showMessage(f"Started {job} of {folder_path}")
+
+    async def dedup_cancel_clicked(self):
+        if self.dedup_job is not None:
+            self.dedup_job.cancel()
+            self.status_bar.showMessage("Cancelling...")
+
+    async def receive_dedup_status(self, snapshot):
+        self.status_bar.showMessage(
+            f"{snapshot['percentage']:0.01f}% - {snapshot['files_completed']} files done - "
+            f"{snapshot['mb_per_second']:0.02f} MB/s - ETA {progress.format_duration(snapshot['eta_seconds'])}"
+        )
+        active_files = sorted(
+            snapshot["files"].items(),
+            key=lambda item: item[1]["mb_per_second"],
+            reverse=True,
+        )[:active_file_display_count]
+        self.lbl_active_files.setText(
+            '\n'.join(
+                f"{os.path.basename(filename)}: {data['mb_per_second']:0.02f} MB/s"
+                for filename, data in active_files
             )
-            if self.searcher.result
-            else 'empty result'
         )
-        # see self.searcher.result and self.searcher.error_result
+
+    async def receive_dedup_completed(self, options):
+        self.progress.setValue(100)
+        self.status_bar.showMessage(f"Deduplication of {options['location']} completed")
+
+    async def receive_dedup_cancelled(self):
+        self.status_bar.showMessage("Deduplication cancelled")
+
+    async def receive_dedup_error(self, err_tuple):
+        print(f"\tError: {err_tuple[2]}")
+        self.status_bar.showMessage(f"Deduplication failed: {err_tuple[1]}")
+
+    async def receive_dedup_finished(self):
+        self.lbl_active_files.setText("")
+        self.btn_dedup_start.setEnabled(True)
+        self.btn_dedup_cancel.setEnabled(False)
 
     async def path_search_clicked(self):
         folder_path = self.txt_path_selector.text()
@@ -0,0 +1,166 @@
+"""
+Copyright 2023 Benjamen R. Meyer
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+import queue
+import sys
+import traceback
+
+from PyQt5.QtCore import (
+    QObject,
+    QTimer,
+)
+
+from tbdedup import (
+    cmd,
+)
+from tbdedup.dedup import (
+    background,
+)
+from tbdedup.gui.runner import (
+    RunnerSignals,
+)
+
+LOG = logging.getLogger(__name__)
+
+# milliseconds between checks of the worker process
+poll_interval = 200
+
+
+class ErrJobAlreadyRunning(Exception):
+    pass
+
+
+def get_job_options(job, location, output_path):
+    """
+    Options for a job started from the GUI
+
+    Everything not chosen in the GUI keeps the default of the job's
+    command-line parser.
+
+    :param job: one of `background.job_choices`
+    :param location: folder to deduplicate
+    :param output_path: folder the results are written to
+    :return: dict of the command-line options for the job
+    """
+    arguments = [job, '--location', location]
+    if job == background.job_dedup:
+        arguments.extend(['--hash-storage', os.path.join(output_path, "tbdedup-hash.sqlite")])
+    else:
+        arguments.extend(['--storage-location', output_path])
+    options = vars(cmd.get_argument_parser().parse_args(arguments))
+    if job == background.job_dedup:
+        # not a command-line option; dedup writes into the current directory
+        options["output_directory"] = output_path
+    return options
+
+
+class DedupJob(QObject):
+    """
+    Run a dedup or combinatory job in a worker process
+
+    The work is CPU bound and holds the GIL, so a thread would still stall
+    the Qt event loop; a separate process does not. Progress snapshots come
+    back over a queue which a QTimer drains on the GUI thread and forwards
+    through `RunnerSignals`:
+
+        - `progress`: overall percentage
+        - `status`: the full progress snapshot, including per file throughput
+        - `result`: the job options when the job completes
+        - `cancelled`: the job stopped after `cancel()`
+        - `error`: (type, value, traceback) if the job failed
+        - `finished`: always, after one of the above
+
+    :param job: one of `background.job_choices`
+    :param options: dict of the command-line options for the job
+    """
+
+    def __init__(self, job, options):
+        super().__init__()
+        self.job = job
+        self.options = options
+        self.signals = RunnerSignals()
+        self.executor = None
+        self.future = None
+        self.progress_queue = None
+        self.cancel_event = None
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.poll)
+
+    @property
+    def running(self):
+        return self.future is not None
+
+    def start(self):
+        if self.running:
+            raise ErrJobAlreadyRunning(f'{self.job} job is already running')
+
+        # fork is not safe once Qt has started its threads
+        context = multiprocessing.get_context('spawn')
+        self.progress_queue = context.Queue()
+        self.cancel_event = context.Event()
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=context,
+            initializer=background.initialize,
+            initargs=(self.progress_queue, self.cancel_event),
+        )
+        self.future = self.executor.submit(
+            background.run_job,
+            self.job,
+            self.options,
+        )
+        self.timer.start(poll_interval)
+
+    def cancel(self):
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+
+    def _drain(self):
+        while True:
+            try:
+                snapshot = self.progress_queue.get_nowait()
+            except queue.Empty:
+                return
+            self.signals.progress.emit(int(snapshot["percentage"]))
+            self.signals.status.emit(snapshot)
+
+    def poll(self):
+        self._drain()
+        if not self.future.done():
+            return
+
+        self.timer.stop()
+        try:
+            completed = self.future.result()
+        except Exception:
+            LOG.exception(f'{self.job} job failed')
+            exctype, value = sys.exc_info()[:2]
+            self.signals.error.emit((exctype, value, traceback.format_exc()))
+        else:
+            # pick up the final report sent as the job ended
+            self._drain()
+            if completed:
+                self.signals.result.emit(self.options)
+            else:
+                self.signals.cancelled.emit()
+        finally:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+            self.future = None
+            self.signals.finished.emit()
@@ -0,0 +1,268 @@
+"""
+Copyright 2023 Benjamen R. Meyer
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import logging
+import os
+import os.path
+
+from PyQt5.QtCore import (
+    QAbstractItemModel,
+    QModelIndex,
+    QObject,
+    QRunnable,
+    QThreadPool,
+    Qt,
+    pyqtSignal,
+)
+
+from tbdedup import (
+    mbox,
+)
+
+LOG = logging.getLogger(__name__)
+
+column_name = 0
+column_size = 1
+column_messages = 2
+column_headers = [
+    "Name",
+    "Size",
+    "Messages",
+]
+
+# number of rows added to a folder each time the view asks for more
+fetch_batch_size = 256
+# message counting reads whole files; keep it from saturating the disk
+count_thread_count = 2
+
+
+def format_size(size):
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size < 1024:
+            return f"{size:0.0f} {unit}" if unit == "B" else f"{size:0.01f} {unit}"
+        size = size / 1024
+    return f"{size:0.01f} TB"
+
+
+class ResultNode(object):
+    """
+    A folder or MBOX file in the search result
+
+    Children are only created when the view fetches them; `entries` holds
+    the names of everything under a folder until then.
+    """
+
+    def __init__(self, parent, name, path, is_folder):
+        self.parent = parent
+        self.name = name
+        self.path = path
+        self.is_folder = is_folder
+        self.row = (
+            len(parent.children)
+            if parent is not None
+            else 0
+        )
+        self.children = []
+        self.entries = None
+        self.size = None
+        # None - not counted, False - count requested, int - the count
+        self.message_count = None
+
+    def get_size(self):
+        if self.size is None:
+            try:
+                self.size = os.path.getsize(self.path)
+            except OSError:
+                self.size = -1
+        return self.size
+
+
+class CountSignals(QObject):
+    counted = pyqtSignal(object, int)
+
+
+class MessageCounter(QRunnable):
+
+    def __init__(self, node):
+        super().__init__()
+        self.node = node
+        self.signals = CountSignals()
+
+    def run(self):
+        try:
+            count = mbox.Mailbox.count_messages(self.node.path)
+        except Exception:
+            LOG.exception(f'Unable to count messages in {self.node.path}')
+            count = -1
+        self.signals.counted.emit(self.node, count)
+
+
+class SearchResultModel(QAbstractItemModel):
+    """
+    Tree of the MBOX files found by the search, grouped by folder
+
+    Nothing is created for a folder until the view expands it, and then only
+    `fetch_batch_size` rows at a time (`canFetchMore`/`fetchMore`). File sizes
+    are read when a row is first displayed and message counts are computed on
+    a background thread pool, so a profile with tens of thousands of MBOX
+    files does not block the GUI.
+
+    :param location: folder that was searched
+    :param mboxfiles: MBOX files found under the location
+    """
+
+    def __init__(self, location, mboxfiles, parent=None):
+        super().__init__(parent)
+        self.location = os.path.abspath(location)
+        # folder path -> {name: is_folder} for every entry under it
+        self.folder_entries = {}
+        for filename in mboxfiles:
+            self._add_path(os.path.abspath(filename))
+
+        self.root = ResultNode(None, self.location, self.location, True)
+        self.threadpool = QThreadPool()
+        self.threadpool.setMaxThreadCount(count_thread_count)
+
+    def _add_path(self, path):
+        relative_path = os.path.relpath(path, self.location)
+        if relative_path.startswith(os.pardir):
+            LOG.info(f'{path} is not under {self.location}')
+            return
+        is_folder = False
+        while relative_path not in ('', os.curdir):
+            folder, name = os.path.split(relative_path)
+            entries = self.folder_entries.setdefault(
+                os.path.normpath(os.path.join(self.location, folder)),
+                {},
+            )
+            if name in entries:
+                # the rest of the path was added by an earlier file
+                entries[name] = entries[name] or is_folder
+                return
+            entries[name] = is_folder
+            relative_path = folder
+            is_folder = True
+
+    def _get_entries(self, node):
+        if node.entries is None:
+            entries = self.folder_entries.pop(node.path, {})
+            # folders first, then files, each sorted by name
+            node.entries = sorted(
+                entries.items(),
+                key=lambda entry: (not entry[1], entry[0]),
+            )
+        return node.entries
+
+    def node_from_index(self, index):
+        if index.isValid():
+            return index.internalPointer()
+        return self.root
+
+    def index(self, row, column, parent=QModelIndex()):
+        if not self.hasIndex(row, column, parent):
+            return QModelIndex()
+        node = self.node_from_index(parent)
+        if row >= len(node.children):
+            return QModelIndex()
+        return self.createIndex(row, column, node.children[row])
+
+    def parent(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        node = index.internalPointer()
+        if node.parent is None or node.parent is self.root:
+            return QModelIndex()
+        return self.createIndex(node.parent.row, 0, node.parent)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        return len(self.node_from_index(parent).children)
+
+    def columnCount(self, parent=QModelIndex()):
+        return len(column_headers)
+
+    def hasChildren(self, parent=QModelIndex()):
+        node = self.node_from_index(parent)
+        if not node.is_folder:
+            return False
+        if node.entries is None:
+            return node.path in self.folder_entries
+        return len(node.entries) > 0
+
+    def canFetchMore(self, parent):
+        node = self.node_from_index(parent)
+        if not node.is_folder:
+            return False
+        return len(node.children) < len(self._get_entries(node))
+
+    def fetchMore(self, parent):
+        node = self.node_from_index(parent)
+        entries = self._get_entries(node)
+        start = len(node.children)
+        end = min(start + fetch_batch_size, len(entries))
+        if end <= start:
+            return
+
+        self.beginInsertRows(parent, start, end - 1)
+        for name, is_folder in entries[start:end]:
+            node.children.append(
+                ResultNode(node, name, os.path.join(node.path, name), is_folder)
+            )
+        self.endInsertRows()
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return column_headers[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        node = index.internalPointer()
+        column = index.column()
+
+        if role == Qt.TextAlignmentRole and column != column_name:
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        if role != Qt.DisplayRole:
+            return None
+
+        if column == column_name:
+            return node.name
+        if node.is_folder:
+            return None
+        if column == column_size:
+            size = node.get_size()
+            return format_size(size) if size >= 0 else "?"
+        if column == column_messages:
+            return self._get_message_count(node)
+        return None
+
+    def _get_message_count(self, node):
+        if node.message_count is None:
+            node.message_count = False
+            counter = MessageCounter(node)
+            counter.signals.counted.connect(self.receive_message_count)
+            self.threadpool.start(counter)
+        if node.message_count is False:
+            return "..."
+        if node.message_count < 0:
+            return "?"
+        return str(node.message_count)
+
+    def receive_message_count(self, node, count):
+        node.message_count = count
+        index = self.createIndex(node.row, column_messages, node)
+        self.dataChanged.emit(index, index, [Qt.DisplayRole])
@@ -1,3 +1,7 @@
+import asyncio
+import sys
+import traceback
+
 from PyQt5.QtCore import (
     QObject,
     QRunnable,
@@ -9,6 +13,9 @@ class RunnerSignals(QObject):
     error = pyqtSignal(tuple) # tuple on error
     result = pyqtSignal(object)
     progress = pyqtSignal(int)
+    # progress snapshot dict from `utils.progress.ProgressTracker`
+    status = pyqtSignal(object)
+    cancelled = pyqtSignal()
 
 class Runner(QRunnable):
     def __init__(self, fn, *args, **kwargs):
@@ -19,11 +26,14 @@ class Runner(QRunnable):
         self.signals = RunnerSignals()
         self.kwargs['progress_callback'] = self.signals.progress
 
-    async def run(self):
+    def run(self):
+        # QThreadPool calls this on a worker thread which has no event loop
         try:
-            result = await self.fn(
-                *self.args,
-                **self.kwargs,
+            result = asyncio.run(
+                self.fn(
+                    *self.args,
+                    **self.kwargs,
+                )
             )
         except:
             traceback.print_exc()
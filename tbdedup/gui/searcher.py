@@ -6,8 +6,11 @@ from PyQt5.QtCore import (
     pyqtSignal,
 )
 
-from tbdedup.mbox import (
-    MailboxFolder,
+from tbdedup import (
+    mbox,
+)
+from tbdedup.utils import (
+    time,
 )
 from tbdedup.gui.runner import (
     Runner,
@@ -25,6 +28,7 @@ class Searcher(QObject):
         super().__init__()
         self.threadpool = QThreadPool()
         self.search_active = False
+        self.location = None
         self.result = None
         self.error_result = None
 
@@ -50,8 +54,11 @@ class Searcher(QObject):
         if self.search_active:
             raise ErrSearchAlreadyInProgress("search already in progress. Please try again later.")
         self.search_active = True
+        self.location = location
+        self.result = None
+        self.error_result = None
 
-        worker = Runner(self.get_files)
+        worker = Runner(self.get_files, location=location)
         worker.signals.result.connect(asyncSlot(self.receive_result))
         worker.signals.error.connect(asyncSlot(self.receive_error))
         worker.signals.progress.connect(self.progress)
@@ -14,11 +14,22 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+from . import mboxcompress
 from . import mboxfile
 from . import mboxfolder
+from . import mboxmessage
+from . import mboxsniff
+from . import mboxsummary
+from . import mork
 
 Mailbox = mboxfile.Mailbox
 MailboxFolder = mboxfolder.MailboxFolder
+MailboxSniffer = mboxsniff.MailboxSniffer
+MessageReader = mboxfile.MessageReader
 
 ErrInvalidFileFormat = mboxfile.ErrInvalidFileFormat
 ErrEmptyFile = mboxfile.ErrEmptyFile
+ErrMalformedBoundary = mboxfile.ErrMalformedBoundary
+ErrNotParsed = mboxmessage.ErrNotParsed
+
+release_index = mboxcompress.release_index
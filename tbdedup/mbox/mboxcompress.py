@@ -0,0 +1,348 @@
+"""
+Copyright 2023 Benjamen R. Meyer
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import bisect
+import bz2
+import io
+import logging
+import lzma
+import os
+import os.path
+import threading
+import zlib
+
+LOG = logging.getLogger(__name__)
+
+compression_gzip = 'gzip'
+compression_xz = 'xz'
+compression_bz2 = 'bz2'
+
+# files are recognized by their content, not their name
+compression_magic = (
+    (b'\x1f\x8b', compression_gzip),
+    (b'\xfd7zXZ\x00', compression_xz),
+    (b'BZh', compression_bz2),
+)
+magic_length = max(len(magic) for magic, _ in compression_magic)
+
+# decompressed bytes between the seek points saved while reading; smaller
+# values make random reads faster at the cost of memory for each gzip point
+checkpoint_interval = 4 * 1024 * 1024
+# compressed bytes read from the file at a time
+read_size = 256 * 1024
+
+
+def detect_compression_data(data):
+    for magic, compression in compression_magic:
+        if data.startswith(magic):
+            return compression
+    return None
+
+
+def detect_compression(filename):
+    """
+    :return: the compression of the file, or None for an uncompressed file
+    """
+    with open(filename, 'rb') as data_input:
+        return detect_compression_data(data_input.read(magic_length))
+
+
+def new_decompressor(compression):
+    if compression == compression_gzip:
+        return zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+    elif compression == compression_xz:
+        return lzma.LZMADecompressor()
+    elif compression == compression_bz2:
+        return bz2.BZ2Decompressor()
+    raise ValueError(f'Unknown compression {compression}')
+
+
+class Checkpoint(object):
+    """
+    A point the decompression can be restarted from
+
+    `decompressor` is None at the start of a stream; otherwise it is a copy
+    of the decompressor state after reading up to `compressed_offset`.
+    """
+
+    __slots__ = ('compressed_offset', 'decompressed_offset', 'decompressor')
+
+    def __init__(self, compressed_offset, decompressed_offset, decompressor=None):
+        self.compressed_offset = compressed_offset
+        self.decompressed_offset = decompressed_offset
+        self.decompressor = decompressor
+
+
+class CheckpointIndex(object):
+    """
+    Seek points for one compressed file, ordered by decompressed offset
+
+    Points are added as the file is read so the first full pass (the
+    summary) leaves an index behind for the message reads that follow.
+    Every stream in the file starts with a point; within a gzip stream a
+    copy of the decompressor is kept every `checkpoint_interval` bytes.
+    xz and bz2 decompressors can not be copied so those files can only be
+    restarted at the start of each stream.
+    """
+
+    def __init__(self, compression, interval=None):
+        self.compression = compression
+        self.interval = (
+            interval
+            if interval is not None
+            else checkpoint_interval
+        )
+        self.checkpoints = [Checkpoint(0, 0)]
+        self.offsets = [0]
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.checkpoints)
+
+    @property
+    def last_offset(self):
+        return self.offsets[-1]
+
+    def add(self, checkpoint):
+        with self.lock:
+            # readers only add points past the end of what is known
+            if checkpoint.decompressed_offset <= self.offsets[-1]:
+                return
+            self.checkpoints.append(checkpoint)
+            self.offsets.append(checkpoint.decompressed_offset)
+
+    def find(self, offset):
+        """
+        :return: the last checkpoint at or before the decompressed offset
+        """
+        with self.lock:
+            index = bisect.bisect_right(self.offsets, offset) - 1
+            return self.checkpoints[max(index, 0)]
+
+
+# indexes are kept for the life of the process keyed by the absolute path;
+# the modification time and size detect a file that changed
+INDEXES = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(filename, compression):
+    file_stat = os.stat(filename)
+    key = os.path.abspath(filename)
+    with _indexes_lock:
+        cached = INDEXES.get(key)
+        if (
+            cached is not None and
+            cached[0] == file_stat.st_mtime_ns and
+            cached[1] == file_stat.st_size and
+            cached[2].compression == compression
+        ):
+            return cached[2]
+
+        index = CheckpointIndex(compression)
+        INDEXES[key] = (file_stat.st_mtime_ns, file_stat.st_size, index)
+        return index
+
+
+def release_index(filename):
+    with _indexes_lock:
+        INDEXES.pop(os.path.abspath(filename), None)
+
+
+class CompressedReader(io.RawIOBase):
+    """
+    Read only, seekable view of the decompressed data of a file
+
+    Offsets (`tell`, `seek`) are into the decompressed data so they can be
+    used the same way as offsets into an uncompressed MBOX file.
+    Concatenated streams (`cat a.gz b.gz`, `pbzip2`) are read as one.
+    """
+
+    def __init__(self, filename, compression, index=None):
+        super().__init__()
+        self.filename = filename
+        self.compression = compression
+        self.index = (
+            index
+            if index is not None
+            else get_index(filename, compression)
+        )
+        self._file = open(filename, 'rb')
+        self._restart(self.index.find(0))
+
+    def _restart(self, checkpoint):
+        self._file.seek(checkpoint.compressed_offset)
+        # offset into the file of the next byte to give the decompressor
+        self.compressed_position = checkpoint.compressed_offset
+        self._decompressor = (
+            checkpoint.decompressor.copy()
+            if checkpoint.decompressor is not None
+            else new_decompressor(self.compression)
+        )
+        # decompressed offset of the first byte of `_pending`
+        self._position = checkpoint.decompressed_offset
+        self._pending = b''
+        self._pending_offset = 0
+        self._last_checkpoint = checkpoint.decompressed_offset
+        self._eof = False
+
+    def _next_stream(self, unused_data):
+        # the next stream starts right after the one that just finished
+        stream_start = self.compressed_position - len(unused_data)
+        if not unused_data:
+            unused_data = self._file.read(read_size)
+            self.compressed_position = self.compressed_position + len(unused_data)
+        if not unused_data.strip(b'\0'):
+            # end of the file; trailing NUL padding is ignored like gzip does
+            self._eof = True
+            return b''
+
+        self.index.add(Checkpoint(stream_start, self._position))
+        self._decompressor = new_decompressor(self.compression)
+        self._last_checkpoint = self._position
+        return unused_data
+
+    def _fill(self):
+        data = b''
+        while not data and not self._eof:
+            if self._decompressor.eof:
+                compressed = self._next_stream(self._decompressor.unused_data)
+                if self._eof:
+                    break
+            else:
+                compressed = self._file.read(read_size)
+                self.compressed_position = self.compressed_position + len(compressed)
+                if not compressed:
+                    raise EOFError(f'{self.filename}: compressed data ended before the end of the stream')
+
+            data = self._decompressor.decompress(compressed)
+
+            # all the input was consumed so the state of the decompressor
+            # matches the file position; xz and bz2 can not be copied
+            end_offset = self._position + len(data)
+            if (
+                hasattr(self._decompressor, 'copy') and
+                not self._decompressor.eof and
+                end_offset - self._last_checkpoint >= self.index.interval and
+                end_offset > self.index.last_offset
+            ):
+                self.index.add(
+                    Checkpoint(
+                        self.compressed_position,
+                        end_offset,
+                        self._decompressor.copy(),
+                    )
+                )
+                self._last_checkpoint = end_offset
+
+        self._pending = data
+        self._pending_offset = 0
+        return len(data)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._pending_offset >= len(self._pending):
+            self._position = self._position + len(self._pending)
+            self._pending = b''
+            self._pending_offset = 0
+            if not self._fill():
+                return 0
+
+        count = min(len(buffer), len(self._pending) - self._pending_offset)
+        buffer[:count] = self._pending[self._pending_offset:self._pending_offset + count]
+        self._pending_offset = self._pending_offset + count
+        return count
+
+    def tell(self):
+        return self._position + self._pending_offset
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset = self.tell() + offset
+        elif whence != io.SEEK_SET:
+            raise io.UnsupportedOperation('compressed files can only seek relative to the start')
+        if offset < 0:
+            raise ValueError(f'negative seek position {offset}')
+
+        current = self.tell()
+        checkpoint = self.index.find(offset)
+        if offset < current or checkpoint.decompressed_offset > current:
+            # behind the data already read, or a seek point is closer
+            self._restart(checkpoint)
+
+        # decompress up to the offset
+        while self.tell() < offset:
+            available = len(self._pending) - self._pending_offset
+            if not available:
+                self._position = self._position + len(self._pending)
+                self._pending = b''
+                self._pending_offset = 0
+                if not self._fill():
+                    break
+                continue
+            self._pending_offset = self._pending_offset + min(available, offset - self.tell())
+        return self.tell()
+
+    def close(self):
+        compressed_file = getattr(self, '_file', None)
+        if compressed_file is not None:
+            compressed_file.close()
+            self._pending = b''
+            self._decompressor = None
+        super().close()
+
+
+def open_mbox(filename, compression=None):
+    """
+    Open an MBOX file for binary reading, decompressing it if needed
+
+    :param filename: MBOX file to open
+    :param compression: the compression of the file if already known
+    :return: a buffered binary reader; offsets are always into the MBOX data
+    """
+    if compression is None:
+        compression = detect_compression(filename)
+    if compression is None:
+        return open(filename, 'rb')
+    return io.BufferedReader(
+        CompressedReader(filename, compression),
+        buffer_size=read_size,
+    )
+
+
+def read_head(filename, length):
+    """
+    Read the start of the MBOX data of a possibly compressed file
+
+    :return: up to `length` bytes; b'' if the compressed data is invalid
+    """
+    compression = detect_compression(filename)
+    if compression is None:
+        with open(filename, 'rb') as data_input:
+            return data_input.read(length)
+
+    try:
+        # a throw away index so sniffing does not keep anything around
+        reader = CompressedReader(filename, compression, index=CheckpointIndex(compression))
+        with io.BufferedReader(reader) as data_input:
+            return data_input.read(length)
+    except (EOFError, OSError, zlib.error, lzma.LZMAError) as ex:
+        LOG.debug(f'Unable to decompress {filename}: {ex}')
+        return b''
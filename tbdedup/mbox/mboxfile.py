@@ -13,11 +13,17 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
+import collections
+import io
 import logging
+import mmap
+import os
 import re
-import sys
 
+from . import mboxcompress
+from . import mboxindex
 from . import mboxmessage
+from . import mboxreadahead
 
 LOG = logging.getLogger(__name__)
 
@@ -34,6 +40,60 @@ class ErrEmptyFile(Exception):
     pass
 
 
+class ErrMalformedBoundary(Exception):
+    pass
+
+
+# files a `MessageReader` keeps open
+default_max_open_readers = 8
+
+
+class MessageReader(object):
+    """
+    Read records back from their MBOX files without reopening them
+
+    Offsets into a compressed file are into its decompressed data, so
+    opening it for every record decompresses it again up to the record.
+    Keeping the reader open and reading the records of each file in offset
+    order only ever decompresses forward.
+
+    :param max_open: number of files kept open; the least recently read
+        is closed first
+    """
+
+    def __init__(self, max_open=None):
+        self.max_open = (
+            max_open
+            if max_open is not None
+            else default_max_open_readers
+        )
+        self.readers = collections.OrderedDict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def read(self, location, start_offset, length):
+        data_input = self.readers.pop(location, None)
+        if data_input is None:
+            data_input = mboxcompress.open_mbox(location)
+            while len(self.readers) >= self.max_open:
+                _, oldest_input = self.readers.popitem(last=False)
+                oldest_input.close()
+        self.readers[location] = data_input
+
+        if data_input.tell() != start_offset:
+            data_input.seek(start_offset)
+        return data_input.read(length)
+
+    def close(self):
+        while self.readers:
+            _, data_input = self.readers.popitem()
+            data_input.close()
+
+
 class Mailbox(object):
     mboxRdMatch = re.compile(r'^>\s?From - ')
     mboxOMatch = re.compile(r'^From - ')
@@ -42,6 +102,10 @@ class Mailbox(object):
     # Start Line: `^FROM - [DOW] [MOY] [DD] [hh]:[mm]:[ss] [yyyy]$`
     mboxMessageStart = re.compile(r'^From - ')
     mboxHeaderStart = re.compile(r'(^[\S-]*):(.*)')
+    # the boundary parameter of a Content-Type header up to its value; an
+    # unquoted value ends at the first separator
+    boundaryParameterMatch = re.compile(rb'(?:^|[;\s])boundary[ \t]*=[ \t]*', re.IGNORECASE)
+    boundaryTokenMatch = re.compile(rb'[^;\s"]*')
     # Likely Thunderbird specific headers:
     # X-Mozilla-Status
     # X-Mozilla-Status2
@@ -49,6 +113,22 @@ class Mailbox(object):
     # X-Apparently-To
     # Message-ID
 
+    # Sampling Detection looks at windows of raw data instead of
+    # reading the file line by line
+    mboxSampleRdMatch = re.compile(rb'^[ \t]*>\s?From - ', re.MULTILINE)
+    mboxSampleOMatch = re.compile(rb'^[ \t]*From - ', re.MULTILINE)
+    mboxSampleCLMatch = re.compile(rb'^[ \t]*Content-Length:', re.MULTILINE)
+    sample_count = 8
+    sample_window = 64 * 1024
+    # start of every record after the first: a blank line followed by the
+    # MBOX FROM line, matching how `buildSummary` splits records
+    mboxCountMatch = re.compile(rb'\n[ \t\r]*\n[ \t]*From - ')
+
+    # per line tracing of the parser; logged at DEBUG level only
+    trace_enabled = False
+    # number of records between the DEBUG level parser summaries
+    summary_interval = 10000
+
     MBOXO = 0
     MBOXRD = 1
     MBOXCL = 2
@@ -58,11 +138,14 @@ class Mailbox(object):
         self.db = db
         self.filename = filename
         self.debug_enabled = False
+        # offset into the file on disk of the input consumed by
+        # `buildSummary`; differs from the message offsets for compressed files
+        self.input_offset = 0
 
     @classmethod
     def detect_mbox_type(cls, filename):
         LOG.info(f'Checking file {filename}')
-        with open(filename, 'rb') as data_input:
+        with mboxcompress.open_mbox(filename) as data_input:
             inMessage = False
             fromIsPrepended = False
             hasContentLength = False
@@ -118,6 +201,171 @@ class Mailbox(object):
                 LOG.info("Detected MBOXO")
                 return cls.MBOXO
 
+    @classmethod
+    def mbox_type_from_evidence(cls, fromIsPrepended, hasContentLength):
+        if fromIsPrepended and hasContentLength:
+            return cls.MBOXCL
+        elif fromIsPrepended and not hasContentLength:
+            return cls.MBOXRD
+        elif not fromIsPrepended and hasContentLength:
+            return cls.MBOXCL2
+        else:  # elif not fromIsPrepended and not hasContentLength:
+            return cls.MBOXO
+
+    @classmethod
+    def get_sample_offsets(cls, file_length, sample_count, sample_window):
+        if file_length <= sample_window:
+            return [0]
+
+        offsets = [0]
+        # evenly space the remaining samples through the rest of the file
+        # making sure not to overlap the first window
+        for sample_index in range(1, sample_count + 1):
+            offset = (sample_index * file_length) // (sample_count + 1)
+            if offset <= offsets[-1] + sample_window:
+                offset = offsets[-1] + sample_window
+            if offset >= file_length:
+                break
+            offsets.append(offset)
+        return offsets
+
+    @classmethod
+    def detect_mbox_type_sampled(cls, filename, sample_count=None, sample_window=None):
+        """
+        Detect the MBOX format by sampling windows of the file
+
+        :param filename: MBOX file to check
+        :param sample_count: number of windows to sample after the head
+        :param sample_window: size in bytes of each window
+        :return: tuple (detected MBOX format, confidence between 0.0 and 1.0)
+
+        .. note:: the confidence is the fraction of the sampled windows
+            that agree with the detected format; windows that lie entirely
+            within a large message provide no evidence and lower the
+            confidence.
+        """
+        sample_count = (
+            sample_count
+            if sample_count is not None
+            else cls.sample_count
+        )
+        sample_window = (
+            sample_window
+            if sample_window is not None
+            else cls.sample_window
+        )
+        compression = mboxcompress.detect_compression(filename)
+        if compression is not None:
+            # the length of the data is unknown until it is all decompressed;
+            # only the head of the file is sampled
+            with mboxcompress.open_mbox(filename, compression) as data_input:
+                window = data_input.read(sample_window)
+            if not window:
+                LOG.info(f'{filename} is empty; unable to detect format')
+                return (cls.MBOXO, 0.0)
+            window_evidence = [
+                (
+                    len(cls.mboxSampleRdMatch.findall(window)),
+                    len(cls.mboxSampleOMatch.findall(window)),
+                    len(cls.mboxSampleCLMatch.findall(window)),
+                )
+            ]
+            return cls.mbox_type_from_window_evidence(filename, window_evidence)
+
+        with open(filename, 'rb') as data_input:
+            data_input.seek(0, 2)  # move to the end of the file
+            file_length = data_input.tell()
+            if not file_length:
+                LOG.info(f'{filename} is empty; unable to detect format')
+                return (cls.MBOXO, 0.0)
+
+            with mmap.mmap(data_input.fileno(), 0, access=mmap.ACCESS_READ) as data_map:
+                window_evidence = []
+                for offset in cls.get_sample_offsets(file_length, sample_count, sample_window):
+                    window_start = offset
+                    if offset > 0:
+                        # align to the start of the next line
+                        window_start = data_map.find(b'\n', offset, offset + sample_window) + 1
+                        if window_start == 0:
+                            # a single line fills the window; no evidence here
+                            window_evidence.append((0, 0, 0))
+                            continue
+                    window = data_map[window_start:window_start + sample_window]
+                    window_evidence.append(
+                        (
+                            len(cls.mboxSampleRdMatch.findall(window)),
+                            len(cls.mboxSampleOMatch.findall(window)),
+                            len(cls.mboxSampleCLMatch.findall(window)),
+                        )
+                    )
+
+        return cls.mbox_type_from_window_evidence(filename, window_evidence)
+
+    @classmethod
+    def mbox_type_from_window_evidence(cls, filename, window_evidence):
+        rd_total = sum(rd for rd, _, _ in window_evidence)
+        o_total = sum(o for _, o, _ in window_evidence)
+        cl_total = sum(cl for _, _, cl in window_evidence)
+        fromIsPrepended = rd_total > o_total
+        hasContentLength = cl_total > 0
+        detected_format = cls.mbox_type_from_evidence(fromIsPrepended, hasContentLength)
+
+        agreeing = 0
+        for rd, o, cl in window_evidence:
+            if rd == 0 and o == 0:
+                continue
+            if (rd > o) == fromIsPrepended and (cl > 0) == hasContentLength:
+                agreeing = agreeing + 1
+        confidence = agreeing / len(window_evidence)
+
+        LOG.info(f'{filename}: sampled {len(window_evidence)} windows - detected format {detected_format} with confidence {confidence:0.02f}')
+        return (detected_format, confidence)
+
+    @classmethod
+    def count_messages(cls, filename):
+        """
+        Count the records in the file without parsing them
+
+        :param filename: MBOX file to count
+        :return: number of records `buildSummary` would return for the file,
+            or zero if the file does not start with an MBOX FROM line
+        """
+        compression = mboxcompress.detect_compression(filename)
+        if compression is not None:
+            return cls.count_messages_streamed(filename, compression)
+
+        with open(filename, 'rb') as data_input:
+            data_input.seek(0, 2)  # move to the end of the file
+            if not data_input.tell():
+                return 0
+
+            with mmap.mmap(data_input.fileno(), 0, access=mmap.ACCESS_READ) as data_map:
+                first_line_end = data_map.find(b'\n')
+                first_line = data_map[:first_line_end if first_line_end >= 0 else len(data_map)]
+                if not cls.mboxMessageStart.match(first_line.decode('latin1').strip()):
+                    return 0
+                return 1 + sum(1 for _ in cls.mboxCountMatch.finditer(data_map))
+
+    @classmethod
+    def count_messages_streamed(cls, filename, compression):
+        # compressed files can not be mapped; count line by line instead
+        # with the same rules as `mboxCountMatch`
+        with mboxcompress.open_mbox(filename, compression) as data_input:
+            first_line = data_input.readline()
+            if not cls.mboxMessageStart.match(first_line.decode('latin1').strip()):
+                return 0
+
+            count = 1
+            foundBlankLine = False
+            for line in data_input:
+                if not line.strip(b' \t\r\n'):
+                    foundBlankLine = True
+                    continue
+                if foundBlankLine and line.lstrip(b' \t').startswith(b'From - '):
+                    count = count + 1
+                foundBlankLine = False
+            return count
+
     # @staticmethod
     # def getMessages(filename):
     #    # So we try another method:
@@ -152,214 +400,372 @@ class Mailbox(object):
     #            foundBlankLine = False
 
     def parseBoundaryMarker(self, currentRecord, header_name):
-        record_boundary_marker = ""
+        """
+        :return: the boundary line of the record, an empty string if it has
+            none or it is malformed, or None if the header is missing;
+            malformed records are flagged in `currentRecord.malformed`
+        """
         header_value_data = currentRecord.getData(header_name)
         if header_value_data is None:
-            print("no header value data")
+            LOG.debug('%s[%d] no %s header data', self.filename, currentRecord.getMsgId(), header_name)
             return None
 
-        header_value = header_value_data.decode('latin1')
-        # '='.join(y.split(':')[1].split("\r\n")[1].strip().split('=')[1:])
-        value_components = header_value.split(":")[1].split("\r\n")
-        # LOG.info(f'Found Content Type Components: {value_components}')
-        for value_line in value_components:
-            vline = value_line.strip()
-            if '=' in vline:
-                # LOG.info(f'Found potential Content Boundary Marker: "{vline}"')
-                vline_components = vline.split('=')
-                vline_key = vline_components[0]
-                vline_data = '='.join(vline_components[1:])
-                if vline_key.lower().endswith('boundary'):
-                    try:
-                        # LOG.info(f'Found Content Boundary Marker: RAW = "{vline_data}"')
-                        if '"' in vline_data:
-                            record_boundary_marker = '--' + vline_data.split('"')[1]
-                        else:
-                            record_boundary_marker = '--' + vline_data
-                        # LOG.info(f'Found Content Boundary Marker: "{record_boundary_marker}"')
-                    except Exception:
-                        LOG.info(f'Found Content Boundary Marker: RAW = "{vline_data}"')
-                        LOG.exception(f'Failed to parse boundary marker')
-                        sys.exit(1)
-
-        return record_boundary_marker
-
-    def buildSummary(self):
-        with open(self.filename, 'rb') as data_input:
-            data_input.seek(0, 2) # move to the end of the file
-            file_length = data_input.tell()
-            data_input.seek(0, 0) # move back to the start of the file
-            if not file_length:
+        try:
+            return self.boundaryMarkerFromHeader(header_value_data)
+        except ErrMalformedBoundary as ex:
+            LOG.warning(
+                '%s[%d] Start: %d - %s',
+                self.filename, currentRecord.getMsgId(), currentRecord.start_offset, ex,
+            )
+            currentRecord.malformed = str(ex)
+            return ""
+
+    @classmethod
+    def boundaryMarkerFromHeader(cls, header_value_data):
+        """
+        :param header_value_data: raw Content-Type header, including the
+            header name and any continuation lines
+        :return: the line that separates the MIME parts (`--` followed by
+            the boundary) or an empty string if there is no boundary
+        :raises: ErrMalformedBoundary if the boundary parameter is present
+            but can not be used
+        """
+        # skip the header name so it can not match
+        value_start = header_value_data.find(b':') + 1
+        parameter = cls.boundaryParameterMatch.search(header_value_data, value_start)
+        if parameter is None:
+            return ""
+
+        value_start = parameter.end()
+        if header_value_data.startswith(b'"', value_start):
+            value_end = header_value_data.find(b'"', value_start + 1)
+            if value_end < 0:
+                raise ErrMalformedBoundary(
+                    f'unterminated boundary: {header_value_data[value_start:value_start + 80]!r}'
+                )
+            boundary = header_value_data[value_start + 1:value_end]
+            if b'\n' in boundary:
+                raise ErrMalformedBoundary(f'boundary spans lines: {boundary[:80]!r}')
+        else:
+            boundary = cls.boundaryTokenMatch.match(header_value_data, value_start).group(0)
+
+        if not boundary:
+            raise ErrMalformedBoundary('empty boundary')
+        return '--' + boundary.decode('latin1')
+
+    def buildSummary(self, mapped=False, read_ahead=None):
+        """
+        :param mapped: parse an uncompressed file through a memory map; the
+            records are then `mboxmessage.MappedMessage`, which are only
+            valid until the summary is finished. Compressed files are
+            always read as a stream.
+        :param read_ahead: bytes an uncompressed file is read ahead by a
+            thread while it is parsed, see `mboxreadahead`
+        """
+        compression = mboxcompress.detect_compression(self.filename)
+        if mapped and compression is None:
+            yield from self.buildMappedSummary()
+            return
+
+        data_input = (
+            mboxreadahead.open_read_ahead(self.filename, read_ahead)
+            if read_ahead and compression is None
+            else mboxcompress.open_mbox(self.filename, compression)
+        )
+        with data_input:
+            if not data_input.peek(1):
                 # no data in the file
                 msg = f'{self.filename} is empty'
                 LOG.debug(msg)
                 raise ErrEmptyFile(msg)
 
+            yield from self.parseRecords(data_input)
 
-            recordIndex = 0
-            recordCounter = 0
-            currentRecord = mboxmessage.Message(0, "", 0)
-            foundBlankLine = False
+    def buildMappedSummary(self):
+        with open(self.filename, 'rb') as data_input:
+            if not os.fstat(data_input.fileno()).st_size:
+                # no data in the file; empty files can not be mapped
+                msg = f'{self.filename} is empty'
+                LOG.debug(msg)
+                raise ErrEmptyFile(msg)
+            # the map keeps its own handle to the file
+            data_map = mmap.mmap(data_input.fileno(), 0, access=mmap.ACCESS_READ)
 
-            def log_file_tracking(msg, old_pos, new_pos):
-                if self.debug_enabled:
-                    # Enable the below for debugging
-                    LOG.debug(f'{self.filename}[{recordIndex}][Old Pos: {old_pos} New Pos: {new_pos}] {msg}')
+        try:
+            record_index = mboxindex.RecordIndex.build(data_map)
+            if record_index is None:
+                LOG.debug('NumPy is not available; finding the records line by line')
+            yield from self.parseRecords(data_map, record_index=record_index)
+        finally:
+            data_map.close()
+
+    @classmethod
+    def parseRecord(cls, record_data, last_record=False):
+        """
+        Parse one record as returned by `getMessageFromFile`
+
+        A record that was followed by another in its file ends with the
+        blank line before the next MBOX FROM line; the parser only drops
+        that line when it finds the FROM line so one is added here to get
+        the same result, and the same hashes, as `buildSummary`.
+
+        :param record_data: raw record data
+        :param last_record: True if the record is the last of its file
+        :return: the parsed `mboxmessage.Message`
+        """
+        if not last_record:
+            record_data = record_data + b'From - Thu Jan  1 00:00:00 1970\n'
+        box = cls(None, None)
+        return next(box.parseRecords(io.BytesIO(record_data)))
+
+    def parseRecords(self, data_input, record_index=None):
+        """
+        Parse the records of an open MBOX file
+
+        :param data_input: binary file object positioned at the start of
+            the MBOX data; offsets are relative to its start. For a memory
+            map the records are `mboxmessage.MappedMessage` over the map.
+        :param record_index: `mboxindex.RecordIndex` of the memory map; the
+            body of a record is then taken in one range up to where the
+            index says the next record starts instead of line by line
+        """
+        compressed = isinstance(
+            getattr(data_input, 'raw', None),
+            mboxcompress.CompressedReader,
+        )
+        if isinstance(data_input, mmap.mmap):
+            def new_message(index, fromLine, start_offset):
+                return mboxmessage.MappedMessage(index, fromLine, start_offset, data_input)
+        else:
+            new_message = mboxmessage.Message
+        # the debug output files want every line
+        skip_body = (
+            record_index is not None and
+            isinstance(data_input, mmap.mmap) and
+            not self.debug_enabled
+        )
+
+        recordIndex = 0
+        recordCounter = 0
+        currentRecord = mboxmessage.Message(0, "", 0)
+        foundBlankLine = False
+
+        # decided once per file so the per-line cost when tracing is
+        # disabled is a single boolean check; the arguments are only
+        # formatted by the logging module if the record is emitted
+        trace = (
+            (self.trace_enabled or self.debug_enabled) and
+            LOG.isEnabledFor(logging.DEBUG)
+        )
+        summarize = LOG.isEnabledFor(logging.DEBUG)
+
+        def log_file_tracking(msg, old_pos, new_pos, *args):
+            LOG.debug(
+                '%s[%d][Old Pos: %d New Pos: %d] ' + msg,
+                self.filename, recordIndex, old_pos, new_pos, *args,
+            )
+
+        def get_msg_file(counter):
+            if self.debug_enabled:
+                return open(f"msg{counter}", "wb")
+            return None
 
-            def get_msg_file(counter):
-                if self.debug_enabled:
-                    return open(f"msg{counter}", "wb")
-                return None
+        # Create the first file for output
+        msg_output = get_msg_file(recordCounter)
 
-            # Create the first file for output
-            msg_output = get_msg_file(recordCounter)
+        def potential_write(line):
+            if msg_output is not None:
+                msg_output.write(line)
 
-            def potential_write(line):
-                if msg_output is not None:
-                    msg_output.write(line)
-
-            # so file_location will escape the loop
-            file_location = 0
-            previous_file_location = 0
-            header_name = ""
-            current_field_data = ""
-            record_boundary_marker = ""
-            for rawline in data_input:
-                previous_file_location = file_location
-                file_location = data_input.tell()
-                log_file_tracking(f"Old Location: {previous_file_location} New Location: {file_location}", previous_file_location, file_location)
-                rawline2 = rawline.decode('latin1')
-                line = rawline2.strip()
-                isStartLine = self.mboxMessageStart.match(line)
-                isHeaderLine = self.mboxHeaderStart.match(rawline2)
-
-                if recordIndex == 0:
-                    if not isStartLine:
-                        # start line does not match properly
-                        raise ErrInvalidFileFormat(f"invalid start line: {line}")
-
-                    # start line does match
-                    log_file_tracking(f'Found start of file: \"{rawline}\"', previous_file_location, file_location)
-                    currentRecord = mboxmessage.Message(0, rawline, previous_file_location)
-                    potential_write(rawline)
-
-                elif len(line) == 0:
+        # so file_location will escape the loop
+        file_location = 0
+        previous_file_location = 0
+        header_name = ""
+        current_field_data = ""
+        record_boundary_marker = ""
+        # memory maps are not iterable by line
+        for rawline in iter(data_input.readline, b''):
+            previous_file_location = file_location
+            file_location = data_input.tell()
+            if trace:
+                log_file_tracking('Old Location: %d New Location: %d', previous_file_location, file_location, previous_file_location, file_location)
+            rawline2 = rawline.decode('latin1')
+            line = rawline2.strip()
+            isStartLine = self.mboxMessageStart.match(line)
+            isHeaderLine = self.mboxHeaderStart.match(rawline2)
+
+            if recordIndex == 0:
+                if not isStartLine:
+                    # start line does not match properly
+                    raise ErrInvalidFileFormat(f"invalid start line: {line}")
+
+                # start line does match
+                if trace:
+                    log_file_tracking('Found start of file: "%r"', previous_file_location, file_location, rawline)
+                currentRecord = new_message(0, rawline, previous_file_location)
+                potential_write(rawline)
+
+            elif len(line) == 0:
+                if trace:
                     log_file_tracking('Found blank line', previous_file_location, file_location)
-                    foundBlankLine = True
-                    currentRecord.addData(header_name, rawline)
-                    potential_write(rawline)
-
-                elif isHeaderLine and header_name != 'body':
-                    foundBlankLine = False
-                    # before capturing the new header value
-                    # check the existing one to see if we need
-                    # to process it for anything
-                    if len(header_name) > 0:
-                        lower_header_name = header_name.lower()
-                        if lower_header_name == "content-type":
-                            record_boundary_marker = self.parseBoundaryMarker(currentRecord, header_name)
-                            log_file_tracking(f'Found Content Type: {header_name}: "{currentRecord.getData(header_name)}"', previous_file_location, file_location)
-                            # record_boundary_marker = ""
-                            # header_value = currentRecord.getData(header_name).decode('latin1')
-                            # #'='.join(y.split(':')[1].split("\r\n")[1].strip().split('=')[1:])
-                            # value_components = header_value.split(":")[1].split("\r\n")
-                            # log_file_tracking(f'Found Content Type Components: {value_components}', previous_file_location, file_location)
-                            # for value_line in value_components:
-                            #    vline = value_line.strip()
-                            #    if '=' in vline:
-                            #        log_file_tracking(f'Found potential Content Boundary Marker: "{vline}"', previous_file_location, file_location)
-                            #        vline_components = vline.split('=')
-                            #        vline_key = vline_components[0]
-                            #        vline_data = '='.join(vline_components[1:])
-                            #        if vline_key.lower() == 'boundary':
-                            #            record_boundary_marker = '--' + vline_data.split('"')[1]
-                            #            log_file_tracking(f'Found Content Boundary Marker: "{record_boundary_marker}"', previous_file_location, file_location)
-                            #
-                            # matches = self.mboxHeaderStart.match(raw_header_value, re.MULTILINE)
-                            # hname = matches.groups()[0]
-                            # hvalue = matches.groups()[1]
-                            # log_file_tracking(f'Content Type has value: {hvalue}', previous_file_location, file_location)
-
-                    # capture the new header
-                    header_name = isHeaderLine.groups()[0]
-                    header_data = isHeaderLine.groups()[1]
-                    log_file_tracking(f'Found Header field: {header_name} = "{header_data}"', previous_file_location, file_location)
-                    currentRecord.addData(header_name, rawline)
-
-                    if header_name.lower() == "content-length":
-                        log_file_tracking(f'Found Content Length: {header_name}: "{currentRecord.getData(header_name)}"', previous_file_location, file_location)
-                        currentRecord.setContentLength(header_data)
-
-                elif line == record_boundary_marker:
-                    foundBlankLine = False
-                    log_file_tracking(f'Found Content Boundary Marker - {record_boundary_marker}', previous_file_location, file_location)
-                    # denote that the body is now being processed
-                    header_name = 'body'
-                    currentRecord.addData(header_name, rawline)
-
-                elif foundBlankLine and isStartLine:
-                    log_file_tracking(f'Found start of new record', previous_file_location, file_location)
-                    # point the end_offset at the previous line
-                    currentRecord.end_offset = previous_file_location
-                    # drop the blank line just added
-                    if len(currentRecord.lines) != 0:
-                        currentRecord.lines.pop()
-                    log_file_tracking(f'Returning record number {recordCounter}', previous_file_location, file_location)
-                    yield currentRecord
-
-                    log_file_tracking(f'Start of next message: \"{rawline}\"', previous_file_location, file_location)
-                    if msg_output is not None:
-                        msg_output.close()
-                        if recordCounter < 10:
-                            msg_output = get_msg_file(recordCounter)
-                        else:
-                            msg_output = None
-                    foundBlankLine = False
-                    header_name = ''
-                    # should not hurt to reset the boundary marker when
-                    # a new record is being generated
-                    record_boundary_marker = ''
-                    recordCounter = recordCounter + 1
-                    currentRecord = mboxmessage.Message(recordCounter, rawline, previous_file_location)
-                    potential_write(rawline)
-
-                elif foundBlankLine and (not isHeaderLine) and record_boundary_marker == '':
-                    # Found a blank line on the previous iteration,
-                    # there is no boundary marker,
-                    # and the current line is not a header line
-                    # then the data must be the message body
-                    header_name = 'body'
-                    currentRecord.addData(header_name, rawline)
-
-                else:
-                    log_file_tracking(f'Content[{header_name}]: "{rawline}"', previous_file_location, file_location)
-                    foundBlankLine = False
-                    currentRecord.addData(header_name, rawline)
-                    potential_write(rawline)
-
-                recordIndex = recordIndex + 1
-
-            if currentRecord is not None:
-                currentRecord.end_offset = data_input.tell()
+                foundBlankLine = True
+                currentRecord.addData(header_name, rawline, previous_file_location)
+                potential_write(rawline)
+
+            elif isHeaderLine and header_name != 'body':
+                foundBlankLine = False
+                # before capturing the new header value
+                # check the existing one to see if we need
+                # to process it for anything
+                if len(header_name) > 0:
+                    lower_header_name = header_name.lower()
+                    if lower_header_name == "content-type":
+                        record_boundary_marker = self.parseBoundaryMarker(currentRecord, header_name)
+                        if trace:
+                            log_file_tracking('Found Content Type: %s: "%r"', previous_file_location, file_location, header_name, currentRecord.getData(header_name))
+                        # record_boundary_marker = ""
+                        # header_value = currentRecord.getData(header_name).decode('latin1')
+                        # #'='.join(y.split(':')[1].split("\r\n")[1].strip().split('=')[1:])
+                        # value_components = header_value.split(":")[1].split("\r\n")
+                        # log_file_tracking(f'Found Content Type Components: {value_components}', previous_file_location, file_location)
+                        # for value_line in value_components:
+                        #    vline = value_line.strip()
+                        #    if '=' in vline:
+                        #        log_file_tracking(f'Found potential Content Boundary Marker: "{vline}"', previous_file_location, file_location)
+                        #        vline_components = vline.split('=')
+                        #        vline_key = vline_components[0]
+                        #        vline_data = '='.join(vline_components[1:])
+                        #        if vline_key.lower() == 'boundary':
+                        #            record_boundary_marker = '--' + vline_data.split('"')[1]
+                        #            log_file_tracking(f'Found Content Boundary Marker: "{record_boundary_marker}"', previous_file_location, file_location)
+                        #
+                        # matches = self.mboxHeaderStart.match(raw_header_value, re.MULTILINE)
+                        # hname = matches.groups()[0]
+                        # hvalue = matches.groups()[1]
+                        # log_file_tracking(f'Content Type has value: {hvalue}', previous_file_location, file_location)
+
+                # capture the new header
+                header_name = isHeaderLine.groups()[0]
+                header_data = isHeaderLine.groups()[1]
+                if trace:
+                    log_file_tracking('Found Header field: %s = "%s"', previous_file_location, file_location, header_name, header_data)
+                currentRecord.addData(header_name, rawline, previous_file_location)
+
+                if header_name.lower() == "content-length":
+                    if trace:
+                        log_file_tracking('Found Content Length: %s: "%r"', previous_file_location, file_location, header_name, currentRecord.getData(header_name))
+                    currentRecord.setContentLength(header_data)
+                elif header_name.lower() == "x-mozilla-status":
+                    currentRecord.setStatus(header_data)
+
+            elif line == record_boundary_marker:
+                foundBlankLine = False
+                if trace:
+                    log_file_tracking('Found Content Boundary Marker - %s', previous_file_location, file_location, record_boundary_marker)
+                # denote that the body is now being processed
+                header_name = 'body'
+                currentRecord.addData(header_name, rawline, previous_file_location)
+
+            elif foundBlankLine and isStartLine:
+                if trace:
+                    log_file_tracking('Found start of new record', previous_file_location, file_location)
+                # point the end_offset at the previous line
+                currentRecord.end_offset = previous_file_location
+                self.input_offset = (
+                    data_input.raw.compressed_position
+                    if compressed
+                    else previous_file_location
+                )
+                # drop the blank line just added
+                currentRecord.dropLastBodyLine()
+                if trace:
+                    log_file_tracking('Returning record number %d', previous_file_location, file_location, recordCounter)
                 yield currentRecord
 
-    @classmethod
-    def getMessageFromFile(cls, msgData) -> bytes:
-        with open(msgData['location'], 'rb') as data_input:
-            data_input.seek(0, 2) # move to the end of the file
-            file_length = data_input.tell()
-            data_input.seek(0, 0) # move back to the start of the file
-            if not file_length:
-                # file is empty so return an empty array
-                return b''
+                if summarize and (recordCounter + 1) % self.summary_interval == 0:
+                    LOG.debug(
+                        '%s: parsed %d records through offset %d',
+                        self.filename, recordCounter + 1, previous_file_location,
+                    )
+                if trace:
+                    log_file_tracking('Start of next message: "%r"', previous_file_location, file_location, rawline)
+                if msg_output is not None:
+                    msg_output.close()
+                    if recordCounter < 10:
+                        msg_output = get_msg_file(recordCounter)
+                    else:
+                        msg_output = None
+                foundBlankLine = False
+                header_name = ''
+                # should not hurt to reset the boundary marker when
+                # a new record is being generated
+                record_boundary_marker = ''
+                recordCounter = recordCounter + 1
+                currentRecord = new_message(recordCounter, rawline, previous_file_location)
+                potential_write(rawline)
+
+            elif foundBlankLine and (not isHeaderLine) and record_boundary_marker == '':
+                # Found a blank line on the previous iteration,
+                # there is no boundary marker,
+                # and the current line is not a header line
+                # then the data must be the message body
+                header_name = 'body'
+                currentRecord.addData(header_name, rawline, previous_file_location)
 
-            length = msgData['end_offset'] - msgData['start_offset']
-            LOG.info(f'Reading - Record[{msgData["messageid"]}] Start Offset: {msgData["start_offset"]} End Ofset: {msgData["end_offset"]} - Length: {length}')
-            if length > 0:
+            else:
+                if trace:
+                    log_file_tracking('Content[%s]: "%r"', previous_file_location, file_location, header_name, rawline)
+                foundBlankLine = False
+                currentRecord.addData(header_name, rawline, previous_file_location)
+                potential_write(rawline)
+
+            if skip_body and header_name == 'body':
+                # nothing but the next record ends the body
+                body_end = record_index.body_end(file_location)
+                if body_end is not None and body_end > file_location:
+                    if trace:
+                        log_file_tracking('Skipping body to %d', previous_file_location, file_location, body_end)
+                    currentRecord.addRange(header_name, file_location, body_end)
+                    data_input.seek(body_end)
+                    file_location = body_end
+
+            recordIndex = recordIndex + 1
+
+        if currentRecord is not None:
+            currentRecord.end_offset = data_input.tell()
+            self.input_offset = (
+                data_input.raw.compressed_position
+                if compressed
+                else currentRecord.end_offset
+            )
+            yield currentRecord
+
+    @classmethod
+    def getMessageFromFile(cls, msgData, message_reader=None) -> bytes:
+        """
+        :param msgData: the location and offsets of the record
+        :param message_reader: `MessageReader` to read through; without
+            one the file is opened for this record alone
+        """
+        if not os.path.getsize(msgData['location']):
+            # file is empty so return an empty array
+            return b''
+
+        length = msgData['end_offset'] - msgData['start_offset']
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug(
+                'Reading - Record[%s] Start Offset: %d End Offset: %d - Length: %d',
+                msgData["messageid"], msgData["start_offset"], msgData["end_offset"], length,
+            )
+        if length > 0:
+            if message_reader is not None:
+                return message_reader.read(msgData['location'], msgData['start_offset'], length)
+            # offsets of compressed files are into the decompressed data
+            with mboxcompress.open_mbox(msgData['location']) as data_input:
                 data_input.seek(msgData['start_offset'])
                 return data_input.read(length)
-            elif length == 0:
-                # message length is zero; file is empty or its a message at the end of the file
-                return b''
-            else:
-                raise ErrInvalidRecordLength(f"{msgData['end_offset']} - {msgData['start_offset']} = {length} <= 0")
+        elif length == 0:
+            # message length is zero; file is empty or its a message at the end of the file
+            return b''
+        else:
+            raise ErrInvalidRecordLength(f"{msgData['end_offset']} - {msgData['start_offset']} = {length} <= 0")
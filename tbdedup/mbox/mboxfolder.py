@@ -19,13 +19,20 @@ import logging
 import os
 import os.path
 
+from . import mboxsniff
+
 LOG = logging.getLogger(__name__)
 
 
 class MailboxFolder(object):
 
-    def __init__(self, foldername):
+    def __init__(self, foldername, sniffer=None):
         self.foldername = foldername
+        self.sniffer = (
+            sniffer
+            if sniffer is not None
+            else mboxsniff.DEFAULT_SNIFFER
+        )
 
     async def getMboxFiles(self):
         fileResult = []
@@ -33,15 +40,14 @@ class MailboxFolder(object):
             LOG.info(f"[{root}] Found {len(dirs)} sub-directories and {len(files)} files")
             for filename in files:
                 LOG.info(f"[{root}] Found file: {filename}")
-                if "." in filename:
-                    LOG.debug(f"[{root}] Skipping file {filename}")
-                    continue
-                fileResult.append(
-                    os.path.join(
-                        root,
-                        filename,
-                    ),
+                full_filename = os.path.join(
+                    root,
+                    filename,
                 )
+                if not self.sniffer.is_mbox(full_filename):
+                    LOG.debug(f"[{root}] Skipping non-MBOX file {filename}")
+                    continue
+                fileResult.append(full_filename)
             for dirname in dirs:
                 LOG.info(f"[{root}] Found folder: {dirname}")
 
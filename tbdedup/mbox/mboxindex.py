@@ -0,0 +1,217 @@
+"""
+Copyright 2023 Benjamen R. Meyer
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import logging
+
+try:
+    import numpy
+except ImportError:
+    # optional; without it the records are found line by line
+    numpy = None
+
+LOG = logging.getLogger(__name__)
+
+# the MBOX FROM line, as `Mailbox.mboxMessageStart` matches it
+from_marker = b'From - '
+from_marker_text = from_marker.decode('latin1')
+
+# bytes compared at once; bounds the memory of the comparison arrays
+default_chunk_size = 64 * 1024 * 1024
+
+# bytes `str.strip` removes from a line decoded as latin1
+whitespace = bytes(
+    value
+    for value in range(256)
+    if chr(value).isspace()
+)
+
+
+def find_all(data, pattern, chunk_size=None):
+    """
+    Find every occurrence of a pattern with NumPy
+
+    Each byte of the pattern is compared against the whole chunk at once
+    and the results are combined, so no Python code runs per byte.
+
+    :param data: bytes-like object, such as a memory map
+    :return: NumPy array of the offsets of the occurrences, in order
+    """
+    chunk_size = (
+        chunk_size
+        if chunk_size is not None
+        else default_chunk_size
+    )
+    data_array = numpy.frombuffer(data, dtype=numpy.uint8)
+    pattern_array = numpy.frombuffer(pattern, dtype=numpy.uint8)
+    # offsets at which the whole pattern fits
+    last_start = len(data_array) - len(pattern_array) + 1
+    found = []
+    try:
+        for chunk_start in range(0, max(last_start, 0), chunk_size):
+            chunk_end = min(chunk_start + chunk_size, last_start)
+            hits = data_array[chunk_start:chunk_end] == pattern_array[0]
+            for pattern_offset in range(1, len(pattern_array)):
+                hits &= (
+                    data_array[chunk_start + pattern_offset:chunk_end + pattern_offset] ==
+                    pattern_array[pattern_offset]
+                )
+            found.append(numpy.flatnonzero(hits) + chunk_start)
+    finally:
+        # the array must not outlive this call, even on an error; it holds
+        # the map open
+        del data_array
+    if not found:
+        return numpy.zeros(0, dtype=numpy.int64)
+    return numpy.concatenate(found)
+
+
+class RecordIndex(object):
+    """
+    Where the records of a memory mapped MBOX file start
+
+    Every `From - ` in the file is found with NumPy up front. The ones at
+    the start of a line that follows a blank line are where the parser
+    starts a new record; the parser has to look at every other one itself
+    as it may still start a record. Once the parser is in the body of a
+    record it can then take everything up to the next record in one range
+    instead of line by line.
+    """
+
+    def __init__(self, data_map, from_positions):
+        self.data_map = data_map
+        self.size = len(data_map)
+        self.from_positions = from_positions
+        # for each position: the start of the blank line before it if it
+        # starts a record, else -1
+        self.blank_lines = self._find_blank_lines()
+
+    def _find_blank_lines(self):
+        """
+        Check every position at once against the newlines of the map
+
+        A position at the start of a line followed by a line of just a
+        newline is a record start; one in the middle of a line or after a
+        non-blank line is not. Only the positions that may be either, after
+        or before other whitespace, are checked by `get_blank_line`.
+        """
+        positions = self.from_positions
+        blank_lines = numpy.full(len(positions), -1, dtype=numpy.int64)
+        if not len(positions):
+            return blank_lines
+
+        newlines = find_all(self.data_map, b'\n')
+        if not len(newlines):
+            # a single line; no position has a line before it
+            return blank_lines
+
+        data_array = numpy.frombuffer(self.data_map, dtype=numpy.uint8)
+        try:
+            is_whitespace = numpy.zeros(256, dtype=bool)
+            is_whitespace[list(whitespace)] = True
+
+            # both are sorted offsets; without `assume_unique` numpy.isin is
+            # far slower on the millions of newlines of a large file
+            at_line_start = numpy.isin(positions - 1, newlines, assume_unique=True) | (positions == 0)
+            # newlines before each position; the last one ends the line before
+            line_index = numpy.searchsorted(newlines, positions)
+            has_previous_line = at_line_start & (line_index > 0)
+            previous_end = newlines[numpy.maximum(line_index - 1, 0)]
+            previous_start = numpy.where(
+                line_index > 1,
+                newlines[numpy.maximum(line_index - 2, 0)] + 1,
+                0,
+            )
+            previous_blank = previous_end == previous_start
+            # a non-blank line before that may still be only whitespace
+            previous_whitespace = ~previous_blank & is_whitespace[data_array[numpy.maximum(previous_end - 1, 0)]]
+
+            # the line must not be only whitespace after the marker
+            after_marker = positions + len(from_marker)
+            has_text = numpy.zeros(len(positions), dtype=bool)
+            in_data = after_marker < self.size
+            has_text[in_data] = ~is_whitespace[data_array[after_marker[in_data]]]
+
+            sure_start = has_previous_line & previous_blank & has_text
+            blank_lines[sure_start] = previous_start[sure_start]
+
+            # leading whitespace before the marker, or whitespace around the
+            # lines, needs the line decoded the same way as the parser does
+            indented = ~at_line_start & is_whitespace[data_array[numpy.maximum(positions - 1, 0)]]
+            uncertain = has_previous_line & (previous_blank | previous_whitespace) & ~sure_start
+        finally:
+            # the array must not outlive this call, even on an error; it
+            # holds the map open
+            del data_array
+
+        for index in numpy.flatnonzero(indented | uncertain).tolist():
+            blank_line = self.get_blank_line(int(positions[index]))
+            if blank_line is not None:
+                blank_lines[index] = blank_line
+        return blank_lines
+
+    @classmethod
+    def build(cls, data_map):
+        """
+        :return: the index of the map, or None if NumPy is not available
+        """
+        if numpy is None:
+            return None
+        return cls(data_map, find_all(data_map, from_marker))
+
+    def get_blank_line(self, position):
+        """
+        :return: start of the blank line before the line at `position` if
+            that line always starts a record, else None
+        """
+        line_start = self.data_map.rfind(b'\n', 0, position) + 1
+        if not line_start:
+            # the first line of the file
+            return None
+        line_end = self.data_map.find(b'\n', position)
+        # decoded and stripped the same way as the parser does
+        line = self.data_map[line_start:line_end if line_end >= 0 else self.size].decode('latin1')
+        if not line.strip().startswith(from_marker_text):
+            return None
+        if line_start + len(line) - len(line.lstrip()) != position:
+            # another `From - ` on the same line
+            return None
+        blank_line = self.data_map.rfind(b'\n', 0, line_start - 1) + 1
+        if self.data_map[blank_line:line_start].decode('latin1').strip():
+            return None
+        return blank_line
+
+    @property
+    def record_offsets(self):
+        """
+        :return: NumPy array of the offsets of the records that always
+            start one; other FROM lines may start more
+        """
+        starts = self.from_positions[self.blank_lines >= 0]
+        return numpy.concatenate(([0], starts)) if self.size else starts
+
+    def body_end(self, position):
+        """
+        :param position: start of a line in the body of a record
+        :return: where the body of the record ends for sure, the blank line
+            before the next record or the end of the file, or None if there
+            is a FROM line before that the parser needs to look at
+        """
+        index = int(numpy.searchsorted(self.from_positions, position))
+        if index == len(self.from_positions):
+            return self.size
+        blank_line = int(self.blank_lines[index])
+        if blank_line < position:
+            return None
+        return blank_line
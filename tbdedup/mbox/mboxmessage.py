@@ -22,6 +22,10 @@ from tbdedup.utils import encoder
 LOG = logging.getLogger(__name__)
 
 
+class ErrNotParsed(Exception):
+    pass
+
+
 def Atoi(s):
     intMap = {
         '{0}'.format(n): n
@@ -41,6 +45,40 @@ THUNDERBIRD_HEADERS = [
     'X-Apparently-To',      # Differentiate between soruces?
     'Message-ID',           # Unique Message ID
 ]
+# nsMsgMessageFlags::Expunged in X-Mozilla-Status; Thunderbird drops these
+# messages when the folder is compacted
+MSG_FLAG_EXPUNGED = 0x0008
+
+thunderbirdHeaderMatches = [
+    re.compile(f"^{skip_header}", flags=re.I)
+    for skip_header in THUNDERBIRD_HEADERS
+]
+messageIdHeaderMatch = re.compile("^Message-ID", flags=re.I)
+
+
+def message_id_key(value):
+    """
+    :param value: Message-ID header value, with or without the angle brackets
+    :return: the Message-ID alone, the same for every spelling and folding
+        of the header, or None if there is none
+    """
+    if value is None:
+        return None
+    value = value.strip()
+    start = value.find('<')
+    if start >= 0:
+        end = value.find('>', start)
+        if end >= 0:
+            value = value[start + 1:end]
+    value = ''.join(value.split())
+    return value if value else None
+
+
+def is_thunderbird_header(name):
+    for m in thunderbirdHeaderMatches:
+        if m.match(name):
+            return True
+    return False
 
 
 class Message(object):
@@ -64,8 +102,16 @@ class Message(object):
         self.lines = []
         self.rawLines = []
         self.rawLines.append(self.fromLine)
+        # why the record could not be fully parsed, if it could not
+        self.malformed = None
+        # X-Mozilla-Status flags, if the record has the header
+        self.status = None
 
-    def addData(self, key, data):
+    def addData(self, key, data, offset=None):
+        """
+        :param offset: offset of the data in the MBOX file; only used by
+            `MappedMessage`
+        """
         self.rawLines.append(data)
         if key == "body":
             self.lines.append(data)
@@ -74,6 +120,10 @@ class Message(object):
                 self.headers[key] = []
             self.headers[key].append(data)
 
+    def dropLastBodyLine(self):
+        if len(self.lines) != 0:
+            self.lines.pop()
+
     def getData(self, key):
         if key == "body":
             return b''.join(self.lines)
@@ -91,42 +141,177 @@ class Message(object):
         # LOG.info(f'Detected Content Length Integer value of {content_length}')
         self.content_length = content_length
 
-    def getHash(self, diskHash=False):
-        mhash = hashlib.sha256()
+    def setStatus(self, rawDataValue):
+        try:
+            self.status = int(rawDataValue.strip(), 16)
+        except ValueError:
+            LOG.debug(f'Record[{self.index}] invalid X-Mozilla-Status: "{rawDataValue}"')
+
+    def isExpunged(self):
+        return self.status is not None and bool(self.status & MSG_FLAG_EXPUNGED)
+
+    def _hashedLines(self, diskHash):
         if diskHash:
-            for rl in self.rawLines:
-                mhash.update(encoder.to_encoding(rl))
+            yield from self.rawLines
         else:
-            matchers = [
-                re.compile(f"^{skip_header}", flags=re.I)
-                for skip_header in THUNDERBIRD_HEADERS
-            ]
             for k, v in self.headers.items():
-                do_skip = False
-                for m in matchers:
-                    if m.match(k):
-                        do_skip = True
-                        continue
-                if do_skip:
+                if is_thunderbird_header(k):
                     continue
-                for vline in v:
-                    mhash.update(encoder.to_encoding(vline))
-            for line in self.lines:
-                mhash.update(encoder.to_encoding(line))
+                yield from v
+            yield from self.lines
+
+    def getHash(self, diskHash=False):
+        mhash = hashlib.sha256()
+        for line in self._hashedLines(diskHash):
+            mhash.update(encoder.to_encoding(line))
 
         return mhash.hexdigest()
 
+    def getHashData(self, diskHash=False):
+        """
+        :return: list of buffers with the data `getHash` hashes, copied so
+            they can be hashed elsewhere after the message is gone
+        """
+        return [
+            b''.join(
+                encoder.to_encoding(line)
+                for line in self._hashedLines(diskHash)
+            )
+        ]
+
     def getMsgId(self):
         return self.index
 
     def getMessageIDHeader(self):
-        idHeader = re.compile("^Message-ID", flags=re.I)
         for k, v in self.headers.items():
-            if idHeader.match(k):
+            if messageIdHeaderMatch.match(k):
                 return b''.join(v).decode('latin1')
 
+    def getMessageIDKey(self):
+        idHeader = self.getMessageIDHeader()
+        if idHeader is None:
+            return None
+        # drop the header name
+        return message_id_key(idHeader.partition(':')[2])
+
     def getMessageIDHeaderHash(self):
         idHeader = self.getMessageIDHeader()
         m = hashlib.sha256()
         m.update(encoder.to_encoding(idHeader))
         return m.hexdigest()
+
+
+class MappedMessage(Message):
+    """
+    Message that refers to its data in a memory map of the MBOX file
+
+    Only the (start, end) offsets of each header and of the body are kept,
+    adjacent lines being merged into one range, so `headers`, `lines` and
+    `rawLines` stay empty. The ranges are hashed straight out of the map
+    without copying them. The map must stay open while the message is used.
+    """
+
+    def __init__(self, index, fromLine, start_offset, data_map):
+        super().__init__(index, fromLine, start_offset)
+        self.data_map = data_map
+        # header name to a list of [start, end] ranges
+        self.headerRanges = {}
+        self.bodyRanges = []
+        # start of the last body line, see `dropLastBodyLine`
+        self.lastBodyLine = None
+
+    def addData(self, key, data, offset=None):
+        self.addRange(key, offset, offset + len(data))
+
+    def addRange(self, key, start, end):
+        if key == "body":
+            ranges = self.bodyRanges
+            self.lastBodyLine = start
+        else:
+            ranges = self.headerRanges.setdefault(key, [])
+        if ranges and ranges[-1][1] == start:
+            ranges[-1][1] = end
+        else:
+            ranges.append([start, end])
+
+    def dropLastBodyLine(self):
+        if self.bodyRanges:
+            last_range = self.bodyRanges[-1]
+            last_range[1] = self.lastBodyLine
+            if last_range[0] == last_range[1]:
+                self.bodyRanges.pop()
+
+    def _update(self, mhash, ranges):
+        with memoryview(self.data_map) as view:
+            for start, end in ranges:
+                mhash.update(view[start:end])
+
+    def _join(self, ranges):
+        return b''.join(
+            self.data_map[start:end]
+            for start, end in ranges
+        )
+
+    def getData(self, key):
+        if key == "body":
+            return self._join(self.bodyRanges)
+        else:
+            if key in self.headerRanges:
+                return self._join(self.headerRanges[key])
+            else:
+                return None
+
+    def _hashedRanges(self, diskHash):
+        if diskHash:
+            # the record is every line from the MBOX FROM line on
+            yield (self.start_offset, self.end_offset)
+        else:
+            for k, ranges in self.headerRanges.items():
+                if is_thunderbird_header(k):
+                    continue
+                yield from ranges
+            yield from self.bodyRanges
+
+    def getHash(self, diskHash=False):
+        mhash = hashlib.sha256()
+        self._update(mhash, self._hashedRanges(diskHash))
+
+        return mhash.hexdigest()
+
+    def getHashData(self, diskHash=False):
+        # slices of a memory map are copies
+        return [
+            self.data_map[start:end]
+            for start, end in self._hashedRanges(diskHash)
+        ]
+
+    def getMessageIDHeader(self):
+        for k, ranges in self.headerRanges.items():
+            if messageIdHeaderMatch.match(k):
+                return self._join(ranges).decode('latin1')
+
+
+class SummaryMessage(Message):
+    """
+    Message known only from the Thunderbird summary of its MBOX file
+
+    The offsets, Message-ID and flags come from the summary; nothing has
+    been read from the MBOX file so hashing it raises `ErrNotParsed`. Use
+    `Mailbox.parseRecord` on its data for that.
+    """
+
+    def __init__(self, index, start_offset, end_offset, message_key, flags):
+        super().__init__(index, None, start_offset)
+        self.end_offset = end_offset
+        self.message_key = message_key
+        # the summary flags share their low bits with X-Mozilla-Status
+        self.status = flags & 0xffff
+
+    def getMessageIDKey(self):
+        return self.message_key
+
+    def getHash(self, diskHash=False):
+        raise ErrNotParsed(f'Record[{self.index}] is only known from the summary')
+
+    def getHashData(self, diskHash=False):
+        raise ErrNotParsed(f'Record[{self.index}] is only known from the summary')
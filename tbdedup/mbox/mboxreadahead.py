@@ -0,0 +1,186 @@
+"""
+Copyright 2023 Benjamen R. Meyer
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import io
+import logging
+import mmap
+import os
+import queue
+import threading
+
+from tbdedup.utils import metrics
+
+LOG = logging.getLogger(__name__)
+
+# one buffer is parsed while the other is filled
+buffer_count = 2
+# what the parser reads from the read-ahead buffers at a time
+read_size = 256 * 1024
+
+
+def advise(fd, offset, length, advice_name):
+    """
+    Give the kernel a hint about how the file will be read, if the platform
+    supports it
+    """
+    advice = getattr(os, advice_name, None)
+    if advice is None or not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        os.posix_fadvise(fd, offset, length, advice)
+    except OSError as ex:
+        LOG.debug(f'posix_fadvise({advice_name}) failed: {ex}')
+
+
+class ReadAheadReader(io.RawIOBase):
+    """
+    Read only, sequential view of a file read ahead by a thread
+
+    A thread fills large page aligned buffers with `readinto` while the
+    parser consumes the one filled before, so reading the disk and parsing
+    and hashing overlap. The kernel is told the file is read sequentially,
+    and every buffer that has been consumed is dropped from the page cache
+    so a scan of a large file does not push everything else out of it.
+    """
+
+    def __init__(self, filename, buffer_size):
+        super().__init__()
+        self.filename = filename
+        # whole pages; anonymous maps are page aligned
+        self.buffer_size = max(mmap.PAGESIZE, buffer_size - buffer_size % mmap.PAGESIZE)
+        self._file = open(filename, 'rb', buffering=0)
+        advise(self._file.fileno(), 0, 0, 'POSIX_FADV_SEQUENTIAL')
+
+        self._buffers = [
+            mmap.mmap(-1, self.buffer_size)
+            for _ in range(buffer_count)
+        ]
+        self._free = queue.Queue()
+        for buffer in self._buffers:
+            self._free.put(buffer)
+        # (buffer, offset into the file, length); None at the end of the
+        # file, or the exception the thread failed with
+        self._filled = queue.Queue()
+        self._stop = threading.Event()
+
+        self._current = None
+        self._current_start = 0
+        self._current_length = 0
+        self._current_offset = 0
+        self._position = 0
+        self._eof = False
+        # times the parser had to wait for the disk
+        self.stalls = 0
+
+        self._thread = threading.Thread(
+            target=self._read_ahead,
+            name=f'read-ahead:{filename}',
+            daemon=True,
+        )
+        self._thread.start()
+
+    def _fill(self, buffer):
+        length = 0
+        with memoryview(buffer) as view:
+            while length < self.buffer_size:
+                count = self._file.readinto(view[length:])
+                if not count:
+                    break
+                length = length + count
+        return length
+
+    def _read_ahead(self):
+        file_offset = 0
+        try:
+            while not self._stop.is_set():
+                buffer = self._free.get()
+                if buffer is None:
+                    # closed
+                    return
+                length = self._fill(buffer)
+                if length:
+                    self._filled.put((buffer, file_offset, length))
+                    file_offset = file_offset + length
+                if length < self.buffer_size:
+                    self._filled.put(None)
+                    return
+        except Exception as ex:
+            self._filled.put(ex)
+
+    def _next_buffer(self):
+        if self._filled.empty():
+            self.stalls = self.stalls + 1
+        item = self._filled.get()
+        if isinstance(item, Exception):
+            raise item
+        if item is None:
+            self._eof = True
+            return False
+        self._current, self._current_start, self._current_length = item
+        self._current_offset = 0
+        return True
+
+    def _release_current(self):
+        # everything before the cursor has been parsed
+        advise(self._file.fileno(), self._current_start, self._current_length, 'POSIX_FADV_DONTNEED')
+        self._free.put(self._current)
+        self._current = None
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._current is not None and self._current_offset >= self._current_length:
+            self._release_current()
+        if self._current is None:
+            if self._eof or not self._next_buffer():
+                return 0
+
+        count = min(len(buffer), self._current_length - self._current_offset)
+        with memoryview(self._current) as view:
+            buffer[:count] = view[self._current_offset:self._current_offset + count]
+        self._current_offset = self._current_offset + count
+        self._position = self._position + count
+        return count
+
+    def tell(self):
+        return self._position
+
+    def close(self):
+        if self.closed:
+            return
+        self._stop.set()
+        # wake the thread if it is waiting for a buffer
+        self._free.put(None)
+        self._thread.join()
+        self._file.close()
+        self._current = None
+        for buffer in self._buffers:
+            buffer.close()
+        metrics.REGISTRY.increment(metrics.read_ahead_stalls, self.stalls)
+        super().close()
+
+
+def open_read_ahead(filename, buffer_size):
+    """
+    Open an uncompressed MBOX file read ahead by a thread
+
+    :param buffer_size: bytes read ahead at a time
+    :return: a buffered binary reader
+    """
+    return io.BufferedReader(
+        ReadAheadReader(filename, buffer_size),
+        buffer_size=read_size,
+    )
@@ -0,0 +1,133 @@
+"""
+Copyright 2023 Benjamen R. Meyer
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import logging
+import os
+import os.path
+
+from tbdedup.utils import json
+
+from . import mboxcompress
+from . import mboxfile
+
+LOG = logging.getLogger(__name__)
+
+# Only the start of the file is needed to decide if the file is an MBOX file;
+# the MBOX FROM line is always the first line of the file
+sniff_length = 512
+
+# Thunderbird keeps a summary file next to every MBOX file; these are never
+# MBOX files so skip them without opening them
+KNOWN_NON_MBOX_EXTENSIONS = (
+    '.msf',
+)
+
+
+class MailboxSniffer(object):
+    """
+    Classify files as MBOX files by looking at the first few bytes
+
+    The verdict for each file is cached against the inode, modification time
+    and size of the file so that repeated runs do not need to re-open files
+    that have not changed. The cache may optionally be persisted to disk.
+    """
+
+    def __init__(self):
+        self.cache = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def load(self, filename):
+        if not os.path.exists(filename):
+            LOG.info(f'Sniffer cache {filename} does not exist yet')
+            return
+
+        try:
+            self.cache = json.load_from_file(filename)
+        except Exception:
+            LOG.exception(f'Unable to load sniffer cache {filename}; ignoring it')
+            self.cache = {}
+
+    def save(self, filename):
+        json.dump_to_file(filename, self.cache)
+
+    @staticmethod
+    def sniff_data(data):
+        # MBOX files are text; a NUL byte means it is some binary format
+        if b'\0' in data:
+            return False
+
+        newline = data.find(b'\n')
+        if newline < 0:
+            # the MBOX FROM line is short; if it did not end in the sniffed
+            # data then only accept a file that is nothing but the FROM line
+            if len(data) >= sniff_length:
+                return False
+            first_line = data
+        else:
+            first_line = data[:newline]
+
+        # match the same way `Mailbox.buildSummary` does so anything
+        # accepted here will also be accepted by the parser
+        line = first_line.decode('latin1').strip()
+        return mboxfile.Mailbox.mboxMessageStart.match(line) is not None
+
+    def is_mbox(self, filename):
+        if filename.lower().endswith(KNOWN_NON_MBOX_EXTENSIONS):
+            return False
+
+        try:
+            file_stat = os.stat(filename)
+        except OSError:
+            LOG.debug(f'Unable to stat {filename}')
+            return False
+
+        if file_stat.st_size == 0:
+            return False
+
+        cache_key = os.path.abspath(filename)
+        cached = self.cache.get(cache_key)
+        if (
+            cached is not None and
+            cached["inode"] == file_stat.st_ino and
+            cached["mtime"] == file_stat.st_mtime_ns and
+            cached["size"] == file_stat.st_size
+        ):
+            self.cache_hits = self.cache_hits + 1
+            return cached["verdict"]
+
+        self.cache_misses = self.cache_misses + 1
+        try:
+            with open(filename, 'rb') as data_input:
+                data = data_input.read(sniff_length)
+            if mboxcompress.detect_compression_data(data) is not None:
+                # compressed MBOX files are judged by their content
+                data = mboxcompress.read_head(filename, sniff_length)
+        except OSError:
+            LOG.debug(f'Unable to read {filename}')
+            return False
+
+        verdict = self.sniff_data(data)
+        self.cache[cache_key] = {
+            "inode": file_stat.st_ino,
+            "mtime": file_stat.st_mtime_ns,
+            "size": file_stat.st_size,
+            "verdict": verdict,
+        }
+        return verdict
+
+
+# shared sniffer so the cache is shared by everything in the process
+DEFAULT_SNIFFER = MailboxSniffer()
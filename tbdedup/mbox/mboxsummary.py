@@ -0,0 +1,187 @@
+"""
+Copyright 2023 Benjamen R. Meyer
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import logging
+import os
+
+from . import mboxcompress
+from . import mboxfile
+from . import mboxmessage
+from . import mork
+
+LOG = logging.getLogger(__name__)
+
+# Thunderbird keeps the summary next to the MBOX file
+summary_extension = '.msf'
+
+# entries checked against the MBOX file before the summary is used
+default_sample_count = 16
+
+# columns of the summary rows
+column_message_id = 'message-id'
+column_flags = 'flags'
+# offset of the message in decimal; older versions use `msgOffset` in hex
+# or the message key, the row id, which was the offset
+column_store_token = 'storeToken'
+column_msg_offset = 'msgOffset'
+# bytes of messages deleted but still in the MBOX file until it is compacted
+column_expunged_bytes = 'expungedBytes'
+
+# Thunderbird makes up an ID for messages without a Message-ID header
+generated_message_id_prefix = 'md5:'
+
+
+def summary_filename(filename):
+    # the plans link to the MBOX files; the summary is next to the file
+    return os.path.realpath(filename) + summary_extension
+
+
+def row_offset(row_id, cells):
+    if column_store_token in cells:
+        return int(cells[column_store_token])
+    if column_msg_offset in cells:
+        return int(cells[column_msg_offset], 16)
+    return int(row_id, 16)
+
+
+def read_summary(filename):
+    """
+    Read the messages of an MBOX file from its Thunderbird summary
+
+    :return: list of `mboxmessage.SummaryMessage` in file order, or None if
+        there is no summary that can be used: it is missing, older than the
+        MBOX file, unreadable, or the folder needs compacting
+    """
+    summary = summary_filename(filename)
+    try:
+        summary_stat = os.stat(summary)
+    except FileNotFoundError:
+        return None
+    mbox_stat = os.stat(filename)
+    if summary_stat.st_mtime < mbox_stat.st_mtime:
+        LOG.info(f'{summary} is older than {filename}; not using it')
+        return None
+    if mboxcompress.detect_compression(filename) is not None:
+        return None
+
+    try:
+        rows = mork.read_rows(summary)
+    except (mork.ErrInvalidMork, UnicodeDecodeError):
+        LOG.exception(f'Unable to read {summary}; not using it')
+        return None
+
+    entries = []
+    for (_, row_id), cells in rows.items():
+        if column_expunged_bytes in cells:
+            try:
+                expunged_bytes = int(cells[column_expunged_bytes], 16)
+            except ValueError:
+                expunged_bytes = 0
+            if expunged_bytes:
+                # deleted messages the summary no longer lists are still
+                # between the ones it does
+                LOG.info(f'{filename} has {expunged_bytes} bytes of deleted messages; not using {summary}')
+                return None
+        if column_message_id not in cells:
+            continue
+        try:
+            offset = row_offset(row_id, cells)
+            flags = int(cells.get(column_flags) or '0', 16)
+        except ValueError:
+            LOG.info(f'{summary} row {row_id} has an invalid offset or flags; not using it')
+            return None
+        message_key = mboxmessage.message_id_key(cells[column_message_id])
+        if message_key is not None and message_key.startswith(generated_message_id_prefix):
+            message_key = None
+        entries.append((offset, message_key, flags))
+
+    entries.sort(key=lambda entry: entry[0])
+    if not entries or entries[0][0] != 0 or entries[-1][0] >= mbox_stat.st_size:
+        LOG.info(f'{summary} does not cover {filename}; not using it')
+        return None
+
+    messages = []
+    for index, (offset, message_key, flags) in enumerate(entries):
+        # each message runs up to the next one
+        end_offset = (
+            entries[index + 1][0]
+            if index + 1 < len(entries)
+            else mbox_stat.st_size
+        )
+        if end_offset <= offset:
+            LOG.info(f'{summary} lists offset {offset} twice; not using it')
+            return None
+        messages.append(
+            mboxmessage.SummaryMessage(index, offset, end_offset, message_key, flags)
+        )
+    return messages
+
+
+def validate_summary(filename, messages, sample_count=None):
+    """
+    Check a sample of the summary messages against the MBOX file
+
+    Each sampled message must be a single record starting with an MBOX FROM
+    line and have the Message-ID the summary has for it.
+
+    :return: True if every sampled message matches
+    """
+    sample_count = (
+        sample_count
+        if sample_count is not None
+        else default_sample_count
+    )
+    step = max(1, len(messages) // sample_count)
+    sample = messages[::step]
+    if sample[-1] is not messages[-1]:
+        sample.append(messages[-1])
+
+    for msg in sample:
+        msgData = mboxfile.Mailbox.getMessageFromFile({
+            "location": filename,
+            "messageid": msg.getMsgId(),
+            "start_offset": msg.start_offset,
+            "end_offset": msg.end_offset,
+        })
+        first_line = msgData[:msgData.find(b'\n') + 1].decode('latin1').strip()
+        if not mboxfile.Mailbox.mboxMessageStart.match(first_line):
+            LOG.info(f'{filename}[{msg.start_offset}] is not the start of a message')
+            return False
+        if mboxfile.Mailbox.mboxCountMatch.search(msgData) is not None:
+            LOG.info(f'{filename}[{msg.start_offset}] holds more than one message')
+            return False
+        record = mboxfile.Mailbox.parseRecord(msgData, msg is messages[-1])
+        if record.getMessageIDKey() != msg.getMessageIDKey():
+            LOG.info(
+                f'{filename}[{msg.start_offset}] has Message-ID {record.getMessageIDKey()}, '
+                f'the summary has {msg.getMessageIDKey()}'
+            )
+            return False
+    return True
+
+
+def load_summary(filename, sample_count=None):
+    """
+    :return: the messages of the MBOX file from its summary if the summary
+        is current and matches a sample of the file, else None
+    """
+    messages = read_summary(filename)
+    if messages is None:
+        return None
+    if not validate_summary(filename, messages, sample_count):
+        LOG.info(f'{summary_filename(filename)} does not match {filename}; not using it')
+        return None
+    LOG.info(f'Using {summary_filename(filename)} for the {len(messages)} messages of {filename}')
+    return messages
@@ -0,0 +1,202 @@
+"""
+Copyright 2023 Benjamen R. Meyer
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import logging
+import re
+
+LOG = logging.getLogger(__name__)
+
+# Mork, the format of the Thunderbird summary (.msf) files, is made of
+# dictionaries `<(80=value)>` of values and column names, tables `{...}`
+# and rows `[id(^column^value)(^column=literal)]`, optionally wrapped in
+# transaction groups `@$${id{@ ... @$$}id}@`.
+morkTokenMatch = re.compile(
+    r'''
+        (?P<space>\s+)
+      | (?P<comment>//[^\n]*)
+      | (?P<group>@\$\$[{}][^@]*@)
+      | (?P<cell>\((?:[^)\\]|\\.)*\))
+      | (?P<open>[<{\[])
+      | (?P<close>[>}\]])
+      | (?P<id>[^\s()<>{}\[\]@]+)
+    ''',
+    re.VERBOSE | re.DOTALL,
+)
+morkCellMatch = re.compile(r'(\^?[^=^]+)(?:=(.*)|\^([0-9A-Fa-f]+))$', re.DOTALL)
+morkEscapeMatch = re.compile(r'\\\r?\n|\\(.)|\$([0-9A-Fa-f]{2})', re.DOTALL)
+
+# kinds of open brackets
+kind_dict = '<'
+kind_meta = 'meta'
+kind_table = '{'
+kind_row = '['
+
+
+class ErrInvalidMork(Exception):
+    pass
+
+
+def unescape(value):
+    def replace(match):
+        if match.group(1) is not None:
+            return match.group(1)
+        if match.group(2) is not None:
+            return chr(int(match.group(2), 16))
+        # line continuation
+        return ''
+    return morkEscapeMatch.sub(replace, value)
+
+
+class MorkReader(object):
+    """
+    Read the rows of a Mork file
+
+    Only what is needed to get at the rows is understood: the value and
+    column dictionaries, tables, rows, and updates to rows in later
+    transaction groups. Rows are keyed by their scope and id and every
+    update replaces the cells it names.
+    """
+
+    def __init__(self):
+        self.atoms = {}
+        self.columns = {}
+        # (scope, row id) to {column: value}
+        self.rows = {}
+
+    def resolve_id(self, value, namespace):
+        # `^80` refers to an entry of a dictionary
+        if value.startswith('^'):
+            return namespace.get(value[1:].upper(), value)
+        return value
+
+    def parse_id(self, token, default_scope):
+        """
+        :return: tuple of (scope, id, cut) for a table or row id such as
+            `-1:^80`; a leading `-` removes the existing cells first
+        """
+        cut = token.startswith('-')
+        if cut:
+            token = token[1:]
+        row_id, _, scope = token.partition(':')
+        # scopes are named in the column dictionary
+        scope = (
+            self.resolve_id(scope, self.columns)
+            if scope
+            else default_scope
+        )
+        return scope, row_id.upper(), cut
+
+    def add_dict_entry(self, content, is_columns):
+        match = morkCellMatch.match(content)
+        if match is None or match.group(2) is None:
+            return
+        (self.columns if is_columns else self.atoms)[match.group(1).upper()] = unescape(match.group(2))
+
+    def add_row_cell(self, row, content):
+        match = morkCellMatch.match(content)
+        if match is None:
+            return
+        column = self.resolve_id(match.group(1), self.columns)
+        if match.group(2) is not None:
+            row[column] = unescape(match.group(2))
+        else:
+            row[column] = self.atoms.get(match.group(3).upper(), '')
+
+    def parse(self, data):
+        """
+        :param data: contents of the Mork file, decoded as latin1
+        """
+        stack = []
+        # the dictionary being read holds column names instead of values
+        dict_columns = False
+        table_scope = None
+        # the id of the table or row just opened is the next token
+        expect_id = None
+        row = None
+
+        position = 0
+        data_length = len(data)
+        while position < data_length:
+            token = morkTokenMatch.match(data, position)
+            if token is None:
+                raise ErrInvalidMork(f'Unexpected data at {position}: {data[position:position + 40]!r}')
+            position = token.end()
+            kind = token.lastgroup
+            value = token.group(kind)
+            top = stack[-1] if stack else None
+
+            if kind in ('space', 'comment', 'group'):
+                continue
+
+            elif kind == 'open':
+                if top in (kind_dict, kind_row, kind_meta) or (top == kind_table and value == '{'):
+                    # meta dictionaries, tables, and rows
+                    stack.append(kind_meta)
+                    continue
+                if value == '<':
+                    dict_columns = False
+                    stack.append(kind_dict)
+                elif value == '{':
+                    stack.append(kind_table)
+                    expect_id = kind_table
+                else:
+                    stack.append(kind_row)
+                    expect_id = kind_row
+
+            elif kind == 'close':
+                if not stack:
+                    raise ErrInvalidMork(f'Unbalanced {value!r} at {position}')
+                closed = stack.pop()
+                if closed == kind_table:
+                    table_scope = None
+                elif closed == kind_row:
+                    row = None
+                expect_id = None
+
+            elif kind == 'id':
+                if expect_id == kind_table:
+                    table_scope, _, _ = self.parse_id(value, None)
+                elif expect_id == kind_row:
+                    scope, row_id, cut = self.parse_id(value, table_scope)
+                    key = (scope, row_id)
+                    if cut or key not in self.rows:
+                        self.rows[key] = {}
+                    row = self.rows[key]
+                expect_id = None
+
+            elif kind == 'cell':
+                content = value[1:-1]
+                if top == kind_meta:
+                    # `<(a=c)>` switches the dictionary to column names
+                    if len(stack) > 1 and stack[-2] == kind_dict:
+                        name, _, scope = content.partition('=')
+                        if name in ('a', 'atomScope'):
+                            dict_columns = scope == 'c'
+                elif top == kind_dict:
+                    self.add_dict_entry(content, dict_columns)
+                elif top == kind_row and row is not None:
+                    self.add_row_cell(row, content)
+        if stack:
+            raise ErrInvalidMork(f'Unterminated {stack[-1]!r} at the end')
+        return self.rows
+
+
+def read_rows(filename):
+    """
+    :return: dictionary of (scope, row id) to the cells of the row
+    """
+    with open(filename, 'rb') as data_input:
+        data = data_input.read().decode('latin1')
+    return MorkReader().parse(data)
@@ -23,9 +23,15 @@ plan_output = "output"
 plan_source = "source"
 plan_mbox = "mbox"
 plan_output_plan = "plan"
+plan_mbox_size = "mbox_size"
+plan_mbox_hash = "mbox_hash"
+plan_final_mbox = "final_mbox"
 
 preplan_location = "location"
 preplan_planning = "planning"
 
 preplan_planning_file_location = "location"
 preplan_planning_file_files = "files"
+
+preplan_record_root = "root"
+preplan_record_plan = "plan"
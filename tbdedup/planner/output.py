@@ -16,6 +16,7 @@ limitations under the License.
 import datetime
 import os
 import os.path
+import re
 
 
 # impossible to mock `datetime.datetime.utcnow`
@@ -43,34 +44,77 @@ def generate_name(utc_time, name, extension, counter):
     )
 
 
+def next_counter(utc_time, name, extension, directory="."):
+    # list the directory once and find the highest counter already used
+    # for the timestamp and name instead of probing each name in turn
+    timestamped = utc_time.strftime(f"%Y%m%d_%H%M%S")
+    suffix = (
+        f"_{name}"
+        if len(extension) == 0
+        else f"_{name}.{extension}"
+    )
+    name_matcher = re.compile(
+        f"^{re.escape(timestamped)}(?:_([0-9]+))?{re.escape(suffix)}$"
+    )
+
+    highest = -1
+    for entry in os.listdir(directory):
+        matched = name_matcher.match(entry)
+        if matched is None:
+            continue
+        counter = (
+            int(matched.groups()[0])
+            if matched.groups()[0] is not None
+            else 0
+        )
+        if counter > highest:
+            highest = counter
+    return highest + 1
+
+
 def get_filename():
-    counter = 0
+    attempts = 0
     utc_time = utcnow()
+    counter = next_counter(utc_time, "dedup_preplanner", "json")
     while True:
         output_filename = generate_name(utc_time, "dedup_preplanner", "json", counter)
-        if counter > max_looping:
+        if attempts > max_looping:
             raise ExcessiveLoopError("too many iterations to find a valid filename")
 
-        if os.path.exists(output_filename):
+        try:
+            # atomically reserve the name so concurrent runs cannot
+            # both be given the same file
+            fd = os.open(
+                output_filename,
+                os.O_WRONLY | os.O_CREAT | os.O_EXCL,
+                0o644,
+            )
+        except FileExistsError:
+            # another run claimed the name after the directory was listed
+            attempts = attempts + 1
             counter = counter + 1
             # try again
             continue
         else:
+            os.close(fd)
             return output_filename
 
 
 def get_directory():
-    counter = 0
+    attempts = 0
     utc_time = utcnow()
+    counter = next_counter(utc_time, "dedup_planner", "")
     while True:
         output_directory = generate_name(utc_time, "dedup_planner", "", counter)
 
-        if counter > max_looping:
+        if attempts > max_looping:
             raise ExcessiveLoopError("too many iterations to find a valid filename")
 
         try:
             os.mkdir(output_directory)
         except (FileExistsError, FileNotFoundError):
+            # another run claimed the name after the directory was listed
+            attempts = attempts + 1
             counter = counter + 1
             # try again
             continue
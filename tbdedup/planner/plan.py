@@ -43,7 +43,7 @@ class LimitPatternError(Exception):
     pass
 
 
-async def generate(output_directory, matched_files, file_mapping):
+async def generate(output_directory, matched_files, file_mapping, compact=False):
     file_counter = 1
     for filename in matched_files:
         link_file = f"{file_counter:06}.mbox"
@@ -77,7 +77,7 @@ async def generate(output_directory, matched_files, file_mapping):
     file_mapping[keys.plan_counter] = file_counter - 1
     file_mapping[keys.plan_map_file] = mapping_file
 
-    json.dump_to_file(mapping_file, file_mapping)
+    json.dump_to_file(mapping_file, file_mapping, compact=compact)
 
 
 async def planner(options, mboxfiles):
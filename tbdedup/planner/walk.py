@@ -82,6 +82,23 @@ class Preplanner(object):
             }
         }
 
+    def json_records(self):
+        # JSON Lines form of the preplanner; the first record describes the
+        # preplanner itself and each following record is one file set
+        yield {
+            "folder_pattern": self.folder_pattern,
+            "location": self.location,
+            "output_filename": self.output_filename,
+            "preplanner": {
+                keys.preplan_location: self.preplanner[keys.preplan_location],
+            },
+        }
+        for root_file, plan in self.plans():
+            yield {
+                keys.preplan_record_root: root_file,
+                keys.preplan_record_plan: plan,
+            }
+
     def has_file(self, root_file):
         return root_file in self.preplanner[keys.preplan_planning]
 
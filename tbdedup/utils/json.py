@@ -29,13 +29,56 @@ def _json_dumper(obj):
     return obj
 
 
-def dump_to_file(filename, data):
+def _get_encoder(compact):
+    return json.JSONEncoder(
+        indent=(
+            None
+            if compact
+            else 4
+        ),
+        separators=(
+            (',', ':')
+            if compact
+            else None
+        ),
+        sort_keys=False,
+        #default=lambda __o: __o.__json__() if hasattr(__o, "__json__") else __o
+        default=_json_dumper,
+    )
+
+
+def dump_to_file(filename, data, compact=False):
+    # the encoder yields the document in chunks which are written as they
+    # are produced so the full document is never held in memory
+    encoder = _get_encoder(compact)
+    with open(filename, "wt") as json_output:
+        json_output.writelines(encoder.iterencode(data))
+
+
+def dump_lines_to_file(filename, records):
+    # JSON Lines - one compact JSON document per line; each record is
+    # encoded on its own so only one record is in memory at a time
+    encoder = _get_encoder(True)
     with open(filename, "wt") as json_output:
-        json.dump(
-            data,
-            json_output,
-            indent=4,
-            sort_keys=False,
-            #default=lambda __o: __o.__json__() if hasattr(__o, "__json__") else __o
-            default=_json_dumper,
-        )
+        for record in records:
+            json_output.write(encoder.encode(record))
+            json_output.write('\n')
+
+
+def dumps_line(record):
+    # a single JSON Lines record, for files written one record at a time
+    return _get_encoder(True).encode(record)
+
+
+def load_from_file(filename):
+    with open(filename, "rt") as json_input:
+        return json.load(json_input)
+
+
+def load_lines_from_file(filename):
+    # lazily load a JSON Lines file one record at a time
+    with open(filename, "rt") as json_input:
+        for line in json_input:
+            if len(line.strip()) == 0:
+                continue
+            yield json.loads(line)
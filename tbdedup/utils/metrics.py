@@ -0,0 +1,157 @@
+"""
+Copyright 2023 Benjamen R. Meyer
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import datetime
+import logging
+import threading
+
+from tbdedup.utils import json
+
+LOG = logging.getLogger(__name__)
+
+# Counters reported by the processing stages
+bytes_read = "bytes_read"
+bytes_written = "bytes_written"
+db_rows_inserted = "db_rows_inserted"
+files_processed = "files_processed"
+file_sets_processed = "file_sets_processed"
+# suffixed with the method used, see `combinatory.mover`
+files_moved = "files_moved"
+hashes_computed = "hashes_computed"
+messages_content_hashed = "messages_content_hashed"
+messages_expunged = "messages_expunged"
+messages_from_summary = "messages_from_summary"
+messages_hashed_in_pool = "messages_hashed_in_pool"
+messages_parsed = "messages_parsed"
+messages_quarantined = "messages_quarantined"
+messages_skipped_expunged = "messages_skipped_expunged"
+messages_written = "messages_written"
+messages_unrecoverable = "messages_unrecoverable"
+parts_stored = "parts_stored"
+# times parsing waited on the read-ahead thread
+read_ahead_stalls = "read_ahead_stalls"
+shards_written = "shards_written"
+
+# Gauges
+hash_threads = "hash_threads"
+part_bytes_saved = "part_bytes_saved"
+
+metrics_format_json = 'json'
+metrics_format_prometheus = 'prometheus'
+metrics_format_choices = [
+    metrics_format_json,
+    metrics_format_prometheus,
+]
+
+# prefix for the Prometheus metric names
+prometheus_prefix = "tbdedup"
+
+
+def _prometheus_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsRegistry(object):
+    """
+    Collect counters, gauges, and phase durations for a run
+
+    Everything reporting into the registry may run on worker threads so all
+    updates are done under a lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = datetime.datetime.utcnow()
+            self.counters = {}
+            self.gauges = {}
+            self.phases = {}
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name, value):
+        with self._lock:
+            self.gauges[name] = value
+
+    def record_phase(self, name, seconds):
+        with self._lock:
+            phase = self.phases.get(name)
+            if phase is None:
+                phase = {
+                    "count": 0,
+                    "total_seconds": 0.0,
+                    "min_seconds": seconds,
+                    "max_seconds": seconds,
+                }
+                self.phases[name] = phase
+            phase["count"] = phase["count"] + 1
+            phase["total_seconds"] = phase["total_seconds"] + seconds
+            phase["min_seconds"] = min(phase["min_seconds"], seconds)
+            phase["max_seconds"] = max(phase["max_seconds"], seconds)
+
+    def get_counter(self, name):
+        with self._lock:
+            return self.counters.get(name, 0)
+
+    def __json__(self):
+        with self._lock:
+            elapsed = (datetime.datetime.utcnow() - self.started).total_seconds()
+            return {
+                "started": self.started.isoformat(),
+                "elapsed_seconds": elapsed,
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "phases": {
+                    name: dict(phase)
+                    for name, phase in self.phases.items()
+                },
+            }
+
+    def to_prometheus(self):
+        data = self.__json__()
+        lines = [
+            f"# TYPE {prometheus_prefix}_elapsed_seconds gauge",
+            f"{prometheus_prefix}_elapsed_seconds {data['elapsed_seconds']}",
+        ]
+        for name, value in sorted(data["counters"].items()):
+            lines.append(f"# TYPE {prometheus_prefix}_{name}_total counter")
+            lines.append(f"{prometheus_prefix}_{name}_total {value}")
+        for name, value in sorted(data["gauges"].items()):
+            lines.append(f"# TYPE {prometheus_prefix}_{name} gauge")
+            lines.append(f"{prometheus_prefix}_{name} {value}")
+        if len(data["phases"]):
+            lines.append(f"# TYPE {prometheus_prefix}_phase_duration_seconds summary")
+            for name, phase in data["phases"].items():
+                label = _prometheus_label(name)
+                lines.append(f"{prometheus_prefix}_phase_duration_seconds_sum{{phase=\"{label}\"}} {phase['total_seconds']}")
+                lines.append(f"{prometheus_prefix}_phase_duration_seconds_count{{phase=\"{label}\"}} {phase['count']}")
+        return '\n'.join(lines) + '\n'
+
+    def dump_to_file(self, filename, metrics_format=metrics_format_json):
+        LOG.info(f'Writing metrics to {filename}')
+        if metrics_format == metrics_format_prometheus:
+            with open(filename, "wt") as metrics_output:
+                metrics_output.write(self.to_prometheus())
+        else:
+            json.dump_to_file(filename, self)
+
+
+# shared registry that the processing stages report into
+REGISTRY = MetricsRegistry()
@@ -0,0 +1,195 @@
+"""
+Copyright 2023 Benjamen R. Meyer
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import cProfile
+import logging
+import os
+import os.path
+import re
+import tracemalloc
+
+LOG = logging.getLogger(__name__)
+
+profile_cpu = 'cpu'
+profile_memory = 'memory'
+profile_choices = [
+    profile_cpu,
+    profile_memory,
+]
+
+# number of allocation sites reported at each phase boundary
+memory_top_count = 10
+
+# profiler receiving the phase notifications from `time.TimeTracker`
+ACTIVE = None
+
+
+def _safe_name(name):
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', name).strip('_')
+
+
+class CpuProfiler(object):
+    """
+    Run cProfile separately for each phase
+
+    Phases nest (`Full Operation` contains `Planning`, etc) so the profile
+    of the enclosing phase is paused while an inner phase runs; each stats
+    file therefore only contains the time spent in that phase itself. Time
+    outside of any phase is recorded in the `run` stats file.
+    """
+
+    def __init__(self, output_directory):
+        self.output_directory = output_directory
+        self.stack = []
+        self.phase_counter = 0
+
+    def _dump(self, name, profile):
+        self.phase_counter = self.phase_counter + 1
+        stats_file = os.path.join(
+            self.output_directory,
+            f"tbdedup-{self.phase_counter:03}-{_safe_name(name)}.pstats",
+        )
+        profile.dump_stats(stats_file)
+        LOG.info(f'Wrote CPU profile for {name} to {stats_file}')
+
+    def start(self):
+        os.makedirs(self.output_directory, exist_ok=True)
+        profile = cProfile.Profile()
+        self.stack.append((None, "run", profile))
+        profile.enable()
+
+    def stop(self):
+        while len(self.stack):
+            _, name, profile = self.stack.pop()
+            profile.disable()
+            self._dump(name, profile)
+
+    def phase_started(self, tracker):
+        if len(self.stack):
+            self.stack[-1][2].disable()
+        profile = cProfile.Profile()
+        self.stack.append((tracker, tracker.name, profile))
+        profile.enable()
+
+    def phase_completed(self, tracker):
+        for index in range(len(self.stack) - 1, -1, -1):
+            if self.stack[index][0] is tracker:
+                break
+        else:
+            LOG.debug(f'No CPU profile for phase {tracker.name}')
+            return
+
+        is_active = index == len(self.stack) - 1
+        _, name, profile = self.stack.pop(index)
+        if is_active:
+            profile.disable()
+            if len(self.stack):
+                self.stack[-1][2].enable()
+        # phases from concurrent tasks may complete out of order; those were
+        # already paused when the later phase started
+        self._dump(name, profile)
+
+
+class MemoryProfiler(object):
+    """
+    Take tracemalloc snapshots at each phase boundary and report the
+    allocation sites that grew the most since the previous boundary
+
+    :param output_directory: where the report file is written
+    :param frames: number of stack frames recorded per allocation; keeping
+        this small keeps the overhead of tracemalloc low
+    """
+
+    def __init__(self, output_directory, frames=1):
+        self.output_directory = output_directory
+        self.frames = frames
+        self.previous_snapshot = None
+        self.report_file = os.path.join(
+            self.output_directory,
+            "tbdedup-memory.txt",
+        )
+
+    def start(self):
+        os.makedirs(self.output_directory, exist_ok=True)
+        with open(self.report_file, "wt") as report:
+            report.write(f"tracemalloc with {self.frames} frame(s)\n")
+        tracemalloc.start(self.frames)
+        self.previous_snapshot = tracemalloc.take_snapshot()
+
+    def stop(self):
+        self.boundary("end of run")
+        tracemalloc.stop()
+        self.previous_snapshot = None
+        LOG.info(f'Wrote memory profile to {self.report_file}')
+
+    def boundary(self, label):
+        if not tracemalloc.is_tracing():
+            return
+
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [
+                tracemalloc.Filter(False, tracemalloc.__file__),
+            ]
+        )
+        current, peak = tracemalloc.get_traced_memory()
+        top_stats = snapshot.compare_to(self.previous_snapshot, 'lineno')[:memory_top_count]
+        self.previous_snapshot = snapshot
+
+        lines = [
+            f"== {label}: current={current} bytes peak={peak} bytes",
+        ]
+        lines.extend(str(stat) for stat in top_stats)
+        LOG.info('\n'.join(lines))
+        with open(self.report_file, "at") as report:
+            report.write('\n'.join(lines))
+            report.write('\n')
+
+    def phase_started(self, tracker):
+        self.boundary(f"start of {tracker.name}")
+
+    def phase_completed(self, tracker):
+        self.boundary(f"end of {tracker.name}")
+
+
+def create(profile_mode, output_directory, frames=1):
+    if profile_mode == profile_cpu:
+        return CpuProfiler(output_directory)
+    elif profile_mode == profile_memory:
+        return MemoryProfiler(output_directory, frames=frames)
+    raise ValueError(f'Unknown profile mode {profile_mode}')
+
+
+def start(profiler):
+    global ACTIVE
+    ACTIVE = profiler
+    profiler.start()
+
+
+def stop():
+    global ACTIVE
+    profiler = ACTIVE
+    ACTIVE = None
+    if profiler is not None:
+        profiler.stop()
+
+
+def phase_started(tracker):
+    if ACTIVE is not None:
+        ACTIVE.phase_started(tracker)
+
+
+def phase_completed(tracker):
+    if ACTIVE is not None:
+        ACTIVE.phase_completed(tracker)
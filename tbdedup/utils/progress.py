@@ -0,0 +1,205 @@
+"""
+Copyright 2023 Benjamen R. Meyer
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import logging
+import threading
+import time
+
+from tbdedup.utils import metrics
+
+LOG = logging.getLogger(__name__)
+
+# seconds between progress reports sent to the listeners
+report_interval = 10.0
+# minimum seconds between throughput samples
+sample_interval = 1.0
+# weight of the newest throughput sample in the moving average
+smoothing = 0.3
+
+
+class ErrCancelled(Exception):
+    pass
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return "unknown"
+    seconds = int(seconds)
+    hours = seconds // 3600
+    minutes = (seconds - (hours * 3600)) // 60
+    seconds = seconds - (hours * 3600) - (minutes * 60)
+    return f"{hours}:{minutes:02}:{seconds:02}"
+
+
+class ProgressTracker(object):
+    """
+    Track progress by bytes processed
+
+    The total is the size of the files found during discovery and the
+    processed bytes come from the offsets reported by the parser, so
+    progress moves while a single large file is being parsed. The
+    throughput is an exponential moving average which is used for the ETA.
+
+    Listeners are called with the result of `snapshot()` at most once per
+    `report_interval` seconds while advancing, and whenever `report()` is
+    called directly.
+
+    Calling `cancel()` (from any thread) makes the next `advance()` raise
+    `ErrCancelled` so the work reporting into the tracker stops promptly.
+
+    :param name: name used when reporting the progress
+    :param report_interval: seconds between the reports while advancing
+    :param clock: monotonic time source; replaceable for testing
+    """
+
+    def __init__(self, name, total_bytes=0, report_interval=report_interval, clock=time.monotonic):
+        self._lock = threading.Lock()
+        self.name = name
+        self.report_interval = report_interval
+        self.clock = clock
+        self.total_bytes = total_bytes
+        self.completed_bytes = 0
+        self.bytes_per_second = None
+        self.listeners = []
+        self.cancelled = False
+        # filename -> [size, completed bytes, start time] of files in progress
+        self.active_files = {}
+        self.files_completed = 0
+
+        now = self.clock()
+        self._sample_time = now
+        self._sample_bytes = 0
+        self._report_time = now
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def add_total(self, byte_count):
+        with self._lock:
+            self.total_bytes = self.total_bytes + byte_count
+
+    def cancel(self):
+        self.cancelled = True
+
+    def start_file(self, filename, size):
+        with self._lock:
+            self.active_files[filename] = [size, 0, self.clock()]
+
+    def finish_file(self, filename):
+        with self._lock:
+            if self.active_files.pop(filename, None) is not None:
+                self.files_completed = self.files_completed + 1
+
+    def advance(self, byte_count, filename=None):
+        if self.cancelled:
+            raise ErrCancelled(f'{self.name} was cancelled')
+
+        with self._lock:
+            self.completed_bytes = self.completed_bytes + byte_count
+            now = self.clock()
+            if filename in self.active_files:
+                self.active_files[filename][1] = self.active_files[filename][1] + byte_count
+            elapsed = now - self._sample_time
+            if elapsed >= sample_interval:
+                rate = (self.completed_bytes - self._sample_bytes) / elapsed
+                self.bytes_per_second = (
+                    rate
+                    if self.bytes_per_second is None
+                    else (smoothing * rate) + ((1.0 - smoothing) * self.bytes_per_second)
+                )
+                self._sample_time = now
+                self._sample_bytes = self.completed_bytes
+            do_report = (now - self._report_time) >= self.report_interval
+
+        if do_report:
+            self.report()
+
+    @property
+    def percentage(self):
+        if self.total_bytes <= 0:
+            return 0.0
+        return min((self.completed_bytes / self.total_bytes) * 100.0, 100.0)
+
+    @property
+    def eta_seconds(self):
+        if not self.bytes_per_second:
+            return None
+        remaining = max(self.total_bytes - self.completed_bytes, 0)
+        return remaining / self.bytes_per_second
+
+    def snapshot(self):
+        with self._lock:
+            now = self.clock()
+            files = {
+                filename: {
+                    "total_bytes": size,
+                    "completed_bytes": completed,
+                    "mb_per_second": (
+                        (completed / (1024 * 1024)) / (now - started)
+                        if now > started
+                        else 0.0
+                    ),
+                }
+                for filename, (size, completed, started) in self.active_files.items()
+            }
+            return {
+                "name": self.name,
+                "total_bytes": self.total_bytes,
+                "completed_bytes": self.completed_bytes,
+                "percentage": self.percentage,
+                "mb_per_second": (
+                    self.bytes_per_second / (1024 * 1024)
+                    if self.bytes_per_second is not None
+                    else 0.0
+                ),
+                "eta_seconds": self.eta_seconds,
+                "files_completed": self.files_completed,
+                "files": files,
+            }
+
+    def report(self):
+        with self._lock:
+            self._report_time = self.clock()
+        snapshot = self.snapshot()
+        for listener in self.listeners:
+            try:
+                listener(snapshot)
+            except Exception:
+                LOG.exception(f'Progress listener failed for {self.name}')
+
+
+def log_listener(snapshot):
+    LOG.info(
+        f"[{snapshot['name']}] Progress Report: {snapshot['percentage']:03.02f}% "
+        f"({snapshot['completed_bytes'] / (1024 * 1024):0.02f} of {snapshot['total_bytes'] / (1024 * 1024):0.02f} MB) "
+        f"at {snapshot['mb_per_second']:0.02f} MB/s - ETA {format_duration(snapshot['eta_seconds'])}"
+    )
+
+
+def metrics_listener(snapshot):
+    metrics.REGISTRY.set_gauge("progress_total_bytes", snapshot["total_bytes"])
+    metrics.REGISTRY.set_gauge("progress_completed_bytes", snapshot["completed_bytes"])
+    metrics.REGISTRY.set_gauge("progress_percentage", snapshot["percentage"])
+    metrics.REGISTRY.set_gauge("progress_mb_per_second", snapshot["mb_per_second"])
+    if snapshot["eta_seconds"] is not None:
+        metrics.REGISTRY.set_gauge("progress_eta_seconds", snapshot["eta_seconds"])
+
+
+def create(name, total_bytes=0):
+    # tracker reporting to the CLI log and the metrics file
+    tracker = ProgressTracker(name, total_bytes=total_bytes)
+    tracker.add_listener(log_listener)
+    tracker.add_listener(metrics_listener)
+    return tracker
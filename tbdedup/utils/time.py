@@ -19,6 +19,11 @@ import logging
 import math
 import time
 
+from tbdedup.utils import (
+    metrics,
+    profiling,
+)
+
 LOG = logging.getLogger(__name__)
 
 def do_yield():
@@ -41,15 +46,18 @@ class TimeTracker(object):
     def __enter__(self):
         self.start = datetime.datetime.utcnow()
         LOG.info(f"Starting {self.name} at {self.start.isoformat()}")
+        profiling.phase_started(self)
 
     def __exit__(self, type, value, traceback):
         self.end = datetime.datetime.utcnow()
-        LOG.info(f"Completed {self.name} at {self.start.isoformat()}")
+        profiling.phase_completed(self)
+        LOG.info(f"Completed {self.name} at {self.end.isoformat()}")
         self.record_log()
 
     def record_log(self):
         self.duration = self.end - self.start
         total_seconds = self.duration.total_seconds()
+        metrics.REGISTRY.record_phase(self.name, total_seconds)
         # extract the seconds
         minutes_prime = total_seconds // 60
         seconds = total_seconds - (minutes_prime * 60)
@@ -413,3 +413,67 @@ class EmailGenerator(object):
                     eb,
                     0 == email_index,
                 )
+
+
+def generate_mbox(mbox_filename, messages, subject="test", has_status2=False):
+    """
+    Write an MBOX file of small Thunderbird style messages
+
+    :param mbox_filename: MBOX file to write
+    :param messages: list of tuples (Message-ID, body, X-Mozilla-Status);
+        a Message-ID or status of None leaves the header out, the body is
+        bytes ending in a newline
+    :param subject: Subject header of every message
+    :param has_status2: also write an X-Mozilla-Status2 header
+    :return: number of messages written
+    """
+    with open(mbox_filename, "wb") as mbox_output:
+        for index, (message_id, body, status) in enumerate(messages):
+            # the blank line separates records
+            if index:
+                mbox_output.write(b"\n")
+            mbox_output.write(b"From - Mon Jan 01 00:00:00 2024\n")
+            if status is not None:
+                mbox_output.write(b"X-Mozilla-Status: %04x\n" % status)
+            if has_status2:
+                mbox_output.write(b"X-Mozilla-Status2: 00000000\n")
+            if message_id is not None:
+                mbox_output.write(b"Message-ID: %s\n" % message_id.encode("latin1"))
+            mbox_output.write(b"Subject: %s\n\n" % subject.encode("latin1"))
+            mbox_output.write(body)
+    return len(messages)
+
+
+def generate_summary(mbox_filename, expunged_bytes=0, message_ids=None):
+    """
+    Write a Thunderbird summary (.msf) for an MBOX file
+
+    :param mbox_filename: MBOX file to summarize; its records are parsed
+        for their offsets, flags and Message-IDs
+    :param expunged_bytes: value of the folder's expungedBytes column
+    :param message_ids: Message-IDs to list instead of the parsed ones
+    :return: name of the summary file
+    """
+    records = list(mboxfile.Mailbox(None, mbox_filename).buildSummary())
+    if message_ids is None:
+        message_ids = [
+            record.getMessageIDKey() or f"md5:{record.getMsgId()}"
+            for record in records
+        ]
+
+    summary_filename = mbox_filename + ".msf"
+    with open(summary_filename, "w") as summary_output:
+        print('// <!-- <mdb:mork:z v="1.4"/> -->', file=summary_output)
+        print("< <(a=c)> // (f=iso-8859-1)", file=summary_output)
+        print("  (80=ns:msg:db:row:scope:msgs:all)(81=ns:msg:db:row:scope:dbfolderinfo:all)", file=summary_output)
+        print("  (B8=flags)(B9=message-id)(BA=storeToken)(BB=expungedBytes)>", file=summary_output)
+        print("{1:^80 {(k^BF:c)(s=9)}", file=summary_output)
+        for record, message_id in zip(records, message_ids):
+            print(
+                f"  [{record.getMsgId() + 1:x}(^B8={record.status or 0:x})"
+                f"(^B9={message_id})(^BA={record.start_offset})]",
+                file=summary_output,
+            )
+        print("}", file=summary_output)
+        print(f"[1:^81(^BB={expunged_bytes:x})]", file=summary_output)
+    return summary_filename
@@ -0,0 +1,110 @@
+"""
+Copyright 2023 Benjamen R. Meyer
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import ddt
+import os.path
+
+from tbdedup import (
+    bench,
+    mbox,
+)
+from tbdedup.bench import corpus
+from tbdedup.utils import json
+
+from tests import base
+
+
+@ddt.ddt
+class TestCorpusGenerator(base.TestCase):
+
+    @ddt.data(
+        (20, 1, 0.0, 0.0, corpus.mbox_format_o, mbox.Mailbox.MBOXO),
+        (20, 3, 0.5, 0.0, corpus.mbox_format_o, mbox.Mailbox.MBOXO),
+        (20, 3, 0.25, 0.5, corpus.mbox_format_cl2, mbox.Mailbox.MBOXCL2),
+        (5, 10, 0.0, 1.0, corpus.mbox_format_o, mbox.Mailbox.MBOXO),
+    )
+    @ddt.unpack
+    def test_generate(
+        self,
+        message_count, file_count, duplicate_ratio, attachment_ratio,
+        mbox_format, expected_format,
+    ):
+        with base.KeepLocalDirClean() as cwd:
+            generator = corpus.CorpusGenerator(
+                message_count,
+                file_count=file_count,
+                duplicate_ratio=duplicate_ratio,
+                attachment_ratio=attachment_ratio,
+                attachment_size=1024,
+                mbox_format=mbox_format,
+            )
+            mboxfiles = generator.generate(cwd.temp_dir.name)
+            self.assertEqual(len(mboxfiles), min(file_count, message_count))
+            self.assertEqual(
+                generator.unique_count,
+                message_count - int(message_count * duplicate_ratio),
+            )
+
+            parsed_count = 0
+            parsed_hashes = set()
+            for filename in mboxfiles:
+                self.assertEqual(
+                    mbox.Mailbox.detect_mbox_type(filename),
+                    expected_format,
+                )
+                for msg in mbox.Mailbox(None, filename).buildSummary():
+                    parsed_count = parsed_count + 1
+                    parsed_hashes.add(msg.getHash(diskHash=False))
+            self.assertEqual(parsed_count, message_count)
+            self.assertEqual(len(parsed_hashes), generator.unique_count)
+
+
+class TestBenchmark(base.AsyncioTestCase):
+
+    async def test_bench(self):
+        with base.KeepLocalDirClean() as cwd:
+            output_file = os.path.join(cwd.temp_dir.name, "results.json")
+            the_options = base.GenericOptions(
+                messages=40,
+                files=4,
+                duplicate_ratio=0.5,
+                attachment_ratio=0.25,
+                attachment_size=2048,
+                mbox_format=corpus.mbox_format_o,
+                msg_hash_source='parsed',
+                seed=1,
+                work_directory=cwd.temp_dir.name,
+                output=output_file,
+            )
+            await bench.asyncBench(the_options)
+
+            results = json.load_from_file(output_file)
+            self.assertEqual(results["version"], bench.results_version)
+            self.assertEqual(results["corpus"]["message_count"], 40)
+            self.assertEqual(results["corpus"]["unique_count"], 20)
+            self.assertEqual(
+                list(results["phases"].keys()),
+                [
+                    bench.phase_detect,
+                    bench.phase_detect_sampled,
+                    bench.phase_parse,
+                    bench.phase_hash,
+                    bench.phase_ingest,
+                    bench.phase_output,
+                ],
+            )
+            self.assertEqual(results["phases"][bench.phase_parse]["messages"], 40)
+            self.assertEqual(results["phases"][bench.phase_output]["messages"], 20)
+            self.assertGreater(results["phases"][bench.phase_output]["bytes"], 0)
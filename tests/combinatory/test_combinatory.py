@@ -0,0 +1,179 @@
+"""
+Copyright 2023 Benjamen R. Meyer
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import ddt
+import hashlib
+import os
+import os.path
+import signal
+
+from tbdedup import (
+    combinatory,
+)
+from tbdedup.planner import (
+    keys as planner_keys,
+)
+from tbdedup.utils import (
+    json,
+    progress,
+)
+
+from tests import base
+
+
+@ddt.ddt
+class TestCombinatoryResume(base.TestCase):
+
+    def test_get_file_digest(self):
+        with base.KeepLocalDirClean():
+            data = b"foo" * combinatory.digest_block_size
+            with open("data", "wb") as output:
+                output.write(data)
+            self.assertEqual(
+                combinatory.get_file_digest("data"),
+                hashlib.sha256(data).hexdigest(),
+            )
+
+    def generate_completed_set(self, cwd):
+        output_directory = os.path.join(cwd.temp_dir.name, "Inbox_Dedup")
+        os.makedirs(output_directory)
+        plan_files = [
+            os.path.join(cwd.temp_dir.name, "Inbox"),
+        ]
+        output_file = os.path.join(output_directory, "output.mbox")
+        with open(output_file, "wb") as output:
+            output.write(b"From - Mon Jan 01 00:00:00 2024\n\nfoo\n")
+
+        file_map = {
+            planner_keys.plan_file_map: {
+                "000001.mbox": plan_files[0],
+            },
+        }
+        json.dump_to_file(
+            os.path.join(output_directory, "mapping.json"),
+            file_map,
+        )
+        plan_combinatory = dict(file_map)
+        plan_combinatory[planner_keys.plan_location] = {
+            planner_keys.plan_mbox: output_file,
+            planner_keys.plan_mbox_size: os.path.getsize(output_file),
+            planner_keys.plan_mbox_hash: combinatory.get_file_digest(output_file),
+        }
+        json.dump_to_file(
+            os.path.join(output_directory, combinatory.plan_output_name),
+            {
+                "location": cwd.temp_dir.name,
+                "files": plan_files,
+                "combinatory": plan_combinatory,
+            },
+        )
+        return (output_directory, plan_files, output_file)
+
+    def test_load_completed_plan(self):
+        with base.KeepLocalDirClean() as cwd:
+            output_directory, plan_files, output_file = self.generate_completed_set(cwd)
+            result = combinatory.load_completed_plan(output_directory, plan_files)
+            self.assertIsNotNone(result)
+            self.assertEqual(
+                result[planner_keys.plan_location][planner_keys.plan_mbox],
+                output_file,
+            )
+
+    @ddt.data(
+        "missing_plan_output",
+        "bad_plan_output",
+        "files_changed",
+        "missing_output",
+        "truncated_output",
+        "modified_output",
+    )
+    def test_load_completed_plan_incomplete(self, failure):
+        with base.KeepLocalDirClean() as cwd:
+            output_directory, plan_files, output_file = self.generate_completed_set(cwd)
+            plan_output_file = os.path.join(output_directory, combinatory.plan_output_name)
+            if failure == "missing_plan_output":
+                os.remove(plan_output_file)
+            elif failure == "bad_plan_output":
+                with open(plan_output_file, "wt") as output:
+                    output.write("{ partial")
+            elif failure == "files_changed":
+                plan_files.append(os.path.join(cwd.temp_dir.name, "Inbox.sbd", "Inbox"))
+            elif failure == "missing_output":
+                os.remove(output_file)
+            elif failure == "truncated_output":
+                with open(output_file, "r+b") as output:
+                    output.truncate(10)
+            elif failure == "modified_output":
+                with open(output_file, "r+b") as output:
+                    output.seek(-4, 2)
+                    output.write(b"bar\n")
+
+            self.assertIsNone(
+                combinatory.load_completed_plan(output_directory, plan_files)
+            )
+
+    def test_interrupt_handler(self):
+        tracker = progress.ProgressTracker("foo")
+        original_handler = signal.getsignal(signal.SIGINT)
+        with combinatory.InterruptHandler(tracker) as interrupt:
+            self.assertEqual(signal.getsignal(signal.SIGINT), interrupt.handler)
+            interrupt.handler(signal.SIGINT, None)
+            self.assertTrue(interrupt.interrupted)
+            self.assertTrue(tracker.cancelled)
+            # a second interrupt is not handled gracefully
+            self.assertEqual(signal.getsignal(signal.SIGINT), signal.default_int_handler)
+        self.assertEqual(signal.getsignal(signal.SIGINT), original_handler)
+
+    def test_write_checkpoint(self):
+        with base.KeepLocalDirClean() as cwd:
+            output_directory, _, _ = self.generate_completed_set(cwd)
+            pending_directory = os.path.join(cwd.temp_dir.name, "Other_Dedup")
+            os.makedirs(pending_directory)
+
+            options = base.GenericOptions(location="foo")
+            combinatory.write_checkpoint(
+                cwd.temp_dir.name,
+                options,
+                [output_directory, pending_directory],
+            )
+            checkpoint = json.load_from_file(
+                os.path.join(cwd.temp_dir.name, combinatory.checkpoint_name)
+            )
+            self.assertEqual(checkpoint["completed"], [output_directory])
+            self.assertEqual(checkpoint["pending"], [pending_directory])
+
+
+class TestCombinatoryHashPool(base.AsyncioTestCase):
+
+    async def test_hash_pool_closed(self):
+        hash_pools = []
+
+        async def failing_combinatory(options, mboxfiles, tracker=None, hash_pool=None):
+            hash_pools.append(hash_pool)
+            raise RuntimeError("planning failed")
+
+        with base.KeepLocalDirClean() as cwd, \
+                base.ValueSwap(combinatory, "combinatory", failing_combinatory):
+            options = base.GenericOptions()
+            options.location = cwd.temp_dir.name
+            options.hash_threads = 2
+            with self.assertRaises(RuntimeError):
+                await combinatory.asyncCombinatory(options)
+
+        # the pool is closed however the run ends
+        self.assertEqual(len(hash_pools), 1)
+        self.assertEqual(hash_pools[0].thread_count, 2)
+        with self.assertRaises(RuntimeError):
+            hash_pools[0].executor.submit(print)
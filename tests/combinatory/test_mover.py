@@ -0,0 +1,139 @@
+"""
+Copyright 2023 Benjamen R. Meyer
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import ddt
+import errno
+import os
+import os.path
+from unittest import mock
+
+from tbdedup.combinatory import (
+    mover,
+)
+
+from tests import base
+
+
+def raise_os_error(error_number):
+    def raiser(*args, **kwargs):
+        raise OSError(error_number, os.strerror(error_number))
+    return raiser
+
+
+@ddt.ddt
+class TestCombinatoryMover(base.TestCase):
+
+    data = b"From - Mon Jan 01 00:00:00 2024\n\nfoo\n" * 1000
+
+    def generate_source(self):
+        with open("source", "wb") as output:
+            output.write(self.data)
+
+    def check_moved(self):
+        self.assertFalse(os.path.exists("source"))
+        with open("target", "rb") as moved:
+            self.assertEqual(moved.read(), self.data)
+
+    def test_move_file_link(self):
+        with base.KeepLocalDirClean():
+            self.generate_source()
+            self.assertEqual(
+                mover.move_file("source", "target"),
+                mover.move_method_link,
+            )
+            self.check_moved()
+
+    def test_move_file_rename(self):
+        with base.KeepLocalDirClean():
+            self.generate_source()
+            with mock.patch('tbdedup.combinatory.mover.os.link', side_effect=raise_os_error(errno.EPERM)):
+                self.assertEqual(
+                    mover.move_file("source", "target"),
+                    mover.move_method_rename,
+                )
+            self.check_moved()
+
+    @ddt.data(
+        True,
+        False,
+    )
+    def test_move_file_target_exists(self, link_supported):
+        with base.KeepLocalDirClean():
+            self.generate_source()
+            with open("target", "wb") as output:
+                output.write(b"existing")
+
+            with mock.patch(
+                'tbdedup.combinatory.mover.os.link',
+                side_effect=None if link_supported else raise_os_error(errno.EPERM),
+                wraps=os.link if link_supported else None,
+            ):
+                with self.assertRaises(mover.ErrTargetExists):
+                    mover.move_file("source", "target")
+
+            self.assertTrue(os.path.exists("source"))
+            with open("target", "rb") as target:
+                self.assertEqual(target.read(), b"existing")
+
+    @ddt.data(
+        (None, None, mover.move_method_reflink),
+        (errno.EOPNOTSUPP, None, mover.move_method_copy_file_range),
+        (errno.EXDEV, errno.ENOSYS, mover.move_method_copy),
+    )
+    @ddt.unpack
+    def test_move_file_between_filesystems(self, reflink_error, copy_file_range_error, expected_method):
+        with base.KeepLocalDirClean():
+            self.generate_source()
+
+            def reflink(source_fd, target_fd):
+                # stand in for the filesystem sharing the data
+                os.copy_file_range(source_fd, target_fd, len(self.data), 0, 0)
+
+            with mock.patch(
+                'tbdedup.combinatory.mover.os.link',
+                side_effect=raise_os_error(errno.EXDEV),
+            ), mock.patch(
+                'tbdedup.combinatory.mover._reflink',
+                side_effect=raise_os_error(reflink_error) if reflink_error is not None else reflink,
+            ), mock.patch(
+                'tbdedup.combinatory.mover._copy_file_range',
+                side_effect=(
+                    raise_os_error(copy_file_range_error)
+                    if copy_file_range_error is not None
+                    else mover._copy_file_range
+                ),
+            ):
+                self.assertEqual(
+                    mover.move_file("source", "target"),
+                    expected_method,
+                )
+            self.check_moved()
+
+    def test_move_file_copy_failure(self):
+        with base.KeepLocalDirClean():
+            self.generate_source()
+            with mock.patch(
+                'tbdedup.combinatory.mover.os.link',
+                side_effect=raise_os_error(errno.EXDEV),
+            ), mock.patch(
+                'tbdedup.combinatory.mover._reflink',
+                side_effect=raise_os_error(errno.EIO),
+            ):
+                with self.assertRaises(OSError):
+                    mover.move_file("source", "target")
+
+            # the source is kept and the partial target removed
+            self.assertTrue(os.path.exists("source"))
+            self.assertFalse(os.path.exists("target"))
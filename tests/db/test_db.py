@@ -0,0 +1,153 @@
+"""
+Copyright 2023 Benjamen R. Meyer
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import os.path
+import sqlite3
+
+from tbdedup import (
+    db,
+)
+
+from tests import base
+
+
+class TestMessageDatabase(base.TestCase):
+
+    def test_schema_version(self):
+        storage = db.MessageDatabase(None)
+        self.assertEqual(storage.get_schema_version(), db.SCHEMAS[-1]["version"])
+        storage.close()
+
+    def test_schema_upgrade(self):
+        with base.KeepLocalDirClean() as cwd:
+            location = os.path.join(cwd.temp_dir.name, "hashes.sqlite")
+            # databases from before the schema version was recorded
+            old_db = sqlite3.connect(location)
+            with old_db as cursor:
+                for change in db.SCHEMAS[0]["changes"]:
+                    cursor.execute(change)
+            old_db.close()
+
+            storage = db.MessageDatabase(location)
+            self.assertEqual(storage.get_schema_version(), db.SCHEMAS[-1]["version"])
+            storage.close()
+
+            # reopening does not apply anything again
+            storage = db.MessageDatabase(location)
+            self.assertEqual(storage.get_schema_version(), db.SCHEMAS[-1]["version"])
+            storage.close()
+
+    def add_message(self, storage, msg_id, message_id_header, start_offset):
+        storage.add_message(
+            None,
+            msg_id,
+            "Inbox",
+            message_id_header,
+            f"hash-{message_id_header}",
+            start_offset,
+            start_offset + 10,
+            None,
+            message_id_header,
+        )
+
+    def test_message_id_candidates(self):
+        storage = db.MessageDatabase(None)
+        self.add_message(storage, 0, "<a>", 30)
+        self.add_message(storage, 1, "<b>", 10)
+        self.add_message(storage, 2, "<a>", 0)
+        self.add_message(storage, 3, None, 20)
+        self.add_message(storage, 4, None, 40)
+
+        candidates = storage.get_message_id_candidates()
+        # shared and missing Message-IDs in file order
+        self.assertEqual(
+            [candidate["messageid"] for candidate in candidates],
+            ["2", "3", "0", "4"],
+        )
+
+        storage.set_message_hashes(
+            (
+                candidate["rowid"],
+                "same-content",
+                "same-disk-content",
+            )
+            for candidate in candidates
+        )
+        storage.set_message_id_hashes()
+        self.assertEqual(storage.get_message_id_candidates(), [])
+        self.assertEqual(storage.get_unique_message_count(), 2)
+        self.assertEqual(storage.get_unique_message_count(use_disk=True), 2)
+
+        messages = list(storage.get_messages_by_hash(db.MESSAGE_ID_HASH_PREFIX + "<b>"))
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(messages[0]["messageid"], "1")
+        self.assertIsNone(messages[0]["disk_hash"])
+
+        messages = list(storage.get_messages_by_hash("same-content"))
+        self.assertEqual(len(messages), 4)
+        self.assertEqual(messages[0]["disk_hash"], "same-disk-content")
+        storage.close()
+
+    def test_unique_messages(self):
+        storage = db.MessageDatabase(None)
+        for msg_hash, location, start_offset in (
+            ("b", "Inbox", 30),
+            ("a", "Sent", 0),
+            ("a", "Inbox", 20),
+            ("c", "Inbox", 0),
+            ("b", "Inbox", 10),
+        ):
+            storage.add_message(
+                msg_hash,
+                f"{location}-{start_offset}",
+                location,
+                None,
+                None,
+                start_offset,
+                start_offset + 10,
+                f"disk-{msg_hash}",
+            )
+
+        for use_disk, expected_hashes in (
+            (False, ["c", "b", "a"]),
+            (True, ["disk-c", "disk-b", "disk-a"]),
+        ):
+            # groups in the file order of their first message
+            self.assertEqual(
+                [
+                    (msg_hash, [msg["messageid"] for msg in msgs_for_hash])
+                    for msg_hash, msgs_for_hash in storage.get_unique_messages(use_disk=use_disk)
+                ],
+                list(zip(expected_hashes, [["Inbox-0"], ["Inbox-10", "Inbox-30"], ["Inbox-20", "Sent-0"]])),
+            )
+        storage.close()
+
+    def test_quarantine(self):
+        storage = db.MessageDatabase(None)
+        self.assertEqual(storage.get_quarantine_count(), 0)
+        storage.add_quarantine(3, "Inbox", 200, 300, "empty boundary")
+        storage.add_quarantine(1, "Inbox", 100, 200, "unterminated boundary")
+        self.assertEqual(storage.get_quarantine_count(), 2)
+        self.assertEqual(
+            [
+                (message["messageid"], message["start_offset"], message["reason"])
+                for message in storage.get_quarantine()
+            ],
+            [
+                ("1", 100, "unterminated boundary"),
+                ("3", 200, "empty boundary"),
+            ],
+        )
+        storage.close()
@@ -0,0 +1,107 @@
+"""
+Copyright 2023 Benjamen R. Meyer
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import ddt
+import os
+import os.path
+import queue
+import threading
+
+from tbdedup.dedup import (
+    background,
+)
+
+from tests import base
+
+
+@ddt.ddt
+class TestDedupBackground(base.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.progress_queue = queue.Queue()
+        self.cancel_event = threading.Event()
+        background.initialize(self.progress_queue, self.cancel_event)
+
+    def tearDown(self):
+        background.initialize(None, None)
+        super().tearDown()
+
+    def generate_location(self, cwd):
+        location = os.path.join(cwd.temp_dir.name, "profile")
+        os.makedirs(location)
+        for index in range(3):
+            base.EmailGenerator.GenerateMboxFile(
+                os.path.join(location, f"mbox_{index}"),
+                5,
+                "From",
+                False,
+                False,
+            )
+        return location
+
+    def get_snapshots(self):
+        snapshots = []
+        while not self.progress_queue.empty():
+            snapshots.append(self.progress_queue.get_nowait())
+        return snapshots
+
+    @ddt.data(
+        False,
+        True,
+    )
+    def test_run_job_dedup(self, cancel):
+        with base.KeepLocalDirClean() as cwd:
+            location = self.generate_location(cwd)
+            if cancel:
+                self.cancel_event.set()
+
+            completed = background.run_job(
+                background.job_dedup,
+                {
+                    "location": location,
+                    "hash_storage": None,
+                    "msg_hash_source": "parsed",
+                },
+            )
+            self.assertEqual(completed, not cancel)
+
+            outputs = [
+                filename
+                for filename in os.listdir(cwd.temp_dir.name)
+                if filename.endswith("_deduplicated.mbox")
+            ]
+            self.assertEqual(len(outputs), 0 if cancel else 1)
+
+            snapshots = self.get_snapshots()
+            self.assertGreater(len(snapshots), 0)
+            final = snapshots[-1]
+            self.assertEqual(final["name"], background.job_dedup)
+            self.assertEqual(
+                final["total_bytes"],
+                sum(
+                    os.path.getsize(os.path.join(location, filename))
+                    for filename in os.listdir(location)
+                ),
+            )
+            if cancel:
+                self.assertEqual(final["completed_bytes"], 0)
+            else:
+                self.assertEqual(final["percentage"], 100.0)
+                self.assertEqual(final["files_completed"], 3)
+
+    def test_run_job_unknown(self):
+        with self.assertRaises(ValueError):
+            background.run_job("foo", {})
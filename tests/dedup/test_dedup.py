@@ -28,6 +28,10 @@ from tbdedup.mbox import (
     mboxfile,
     mboxmessage,
 )
+from tbdedup.utils import (
+    metrics,
+    progress,
+)
 
 from tests import base
 
@@ -97,6 +101,43 @@ class TestDeduplicator(base.AsyncioTestCase):
             filename = 'foo'
             await dedup.processFile(filename, mock_storage, counter_update)
 
+    @ddt.data(
+        (1, b""),
+        (3, b""),
+        # trailing data the parser does not report as a message
+        (2, b"\n\n"),
+    )
+    @ddt.unpack
+    async def test_process_file_progress(self, msg_count, trailer):
+        with base.KeepLocalDirClean():
+            filename = 'progress.mbox'
+            with open(filename, "wb") as mbox_file:
+                for index in range(msg_count):
+                    if index:
+                        mbox_file.write(b"\n")
+                    mbox_file.write(b"From - Mon Jan 01 00:00:00 2024\n")
+                    mbox_file.write(f"Message-ID: <{index}@tbdedup.test>\n".encode('utf-8'))
+                    mbox_file.write(b"\n")
+                    mbox_file.write(f"body {index}\n".encode('utf-8'))
+                mbox_file.write(trailer)
+            file_size = os.path.getsize(filename)
+
+            tracker = progress.ProgressTracker("test", total_bytes=file_size)
+            mock_storage = mock.Mock()
+            await dedup.processFile(filename, mock_storage, tracker=tracker)
+            self.assertEqual(mock_storage.add_message.call_count, msg_count)
+            self.assertEqual(tracker.completed_bytes, file_size)
+            self.assertEqual(tracker.percentage, 100.0)
+
+    async def test_process_file_progress_missing_file(self):
+        tracker = progress.ProgressTracker("test")
+        with mock.patch(
+            'tbdedup.dedup.mbox.Mailbox.buildSummary',
+        ) as mock_mbox_mailbox:
+            mock_mbox_mailbox.return_value = []
+            await dedup.processFile('foo', mock.Mock(), tracker=tracker)
+        self.assertEqual(tracker.completed_bytes, 0)
+
     @ddt.data(
         (0, False, 5),
     )
@@ -144,3 +185,142 @@ class TestDeduplicator(base.AsyncioTestCase):
                 cwd,
             )
             # how to check the result?
+
+    def write_strategy_mbox(self, mbox_filename):
+        messages = []
+        for index in range(5):
+            # duplicated messages share their Message-ID
+            messages.append((f"<{index}@tbdedup.test>", f"body {index}"))
+            messages.append((f"<{index}@tbdedup.test>", f"body {index}"))
+        for index in range(5, 9):
+            messages.append((f"<{index}@tbdedup.test>", f"body {index}"))
+        # same Message-ID but different content
+        messages.append(("<0@tbdedup.test>", "other body 0"))
+        # no Message-ID at all
+        messages.append((None, "anonymous body"))
+        messages.append((None, "anonymous body"))
+
+        return base.generate_mbox(
+            mbox_filename,
+            [
+                (message_id, f"{body}\n".encode("latin1"), None)
+                for message_id, body in messages
+            ],
+            subject="strategy",
+        )
+
+    @ddt.data(
+        (dedup.strategy_content, 17),
+        (dedup.strategy_message_id, 13),
+    )
+    @ddt.unpack
+    async def test_strategy(self, strategy, expected_content_hashed):
+        with base.KeepLocalDirClean() as cwd, \
+                base.ValueSwap(metrics, "REGISTRY", metrics.MetricsRegistry()):
+            mbox_filename = os.path.join(cwd.temp_dir.name, "Inbox")
+            message_count = self.write_strategy_mbox(mbox_filename)
+
+            storage = db.MessageDatabase(None)
+            await dedup.processFile(mbox_filename, storage, strategy=strategy)
+            content_hashed = (
+                dedup.hashMessageIdCandidates(storage)
+                if strategy == dedup.strategy_message_id
+                else message_count
+            )
+            self.assertEqual(content_hashed, expected_content_hashed)
+
+            # both strategies find the same unique messages
+            self.assertEqual(storage.get_unique_message_count(), 11)
+
+            dedup.writeUniqueMessages(storage, "unique.mbox")
+            storage.close()
+            unique_records = list(mbox.Mailbox(None, "unique.mbox").buildSummary())
+            self.assertEqual(len(unique_records), 11)
+
+    @ddt.data(
+        (False, 0),
+        (True, 17),
+    )
+    @ddt.unpack
+    async def test_strategy_summary(self, summary_current, expected_from_summary):
+        with base.KeepLocalDirClean() as cwd, \
+                base.ValueSwap(metrics, "REGISTRY", metrics.MetricsRegistry()):
+            mbox_filename = os.path.join(cwd.temp_dir.name, "Inbox")
+            self.write_strategy_mbox(mbox_filename)
+            summary_filename = base.generate_summary(mbox_filename)
+            if not summary_current:
+                mbox_mtime = os.stat(mbox_filename).st_mtime
+                os.utime(summary_filename, (mbox_mtime - 10, mbox_mtime - 10))
+
+            storage = db.MessageDatabase(None)
+            await dedup.processFile(
+                mbox_filename,
+                storage,
+                strategy=dedup.strategy_message_id,
+                use_summary=True,
+            )
+            self.assertEqual(metrics.REGISTRY.get_counter(metrics.messages_from_summary), expected_from_summary)
+            self.assertEqual(metrics.REGISTRY.get_counter(metrics.messages_parsed), 17 - expected_from_summary)
+
+            # the same messages as parsing the file finds
+            self.assertEqual(dedup.hashMessageIdCandidates(storage), 13)
+            self.assertEqual(storage.get_unique_message_count(), 11)
+            storage.close()
+
+    async def test_process_file_quarantine(self):
+        with base.KeepLocalDirClean() as cwd, \
+                base.ValueSwap(metrics, "REGISTRY", metrics.MetricsRegistry()):
+            mbox_filename = os.path.join(cwd.temp_dir.name, "Inbox")
+            with open(mbox_filename, "wb") as mbox_output:
+                mbox_output.write(
+                    b"From - Mon Jan 01 00:00:00 2024\n"
+                    b"Content-Type: multipart/mixed; boundary=\n"
+                    b"Subject: malformed\n"
+                    b"\n"
+                    b"body\n"
+                    b"\n"
+                    b"From - Mon Jan 01 00:00:00 2024\n"
+                    b"Subject: plain\n"
+                    b"\n"
+                    b"body\n"
+                )
+
+            storage = db.MessageDatabase(None)
+            await dedup.processFile(mbox_filename, storage)
+            # the malformed message is still deduplicated
+            self.assertEqual(storage.get_unique_message_count(), 2)
+            quarantined = list(storage.get_quarantine())
+            storage.close()
+            self.assertEqual(len(quarantined), 1)
+            self.assertEqual(quarantined[0]["start_offset"], 0)
+            self.assertEqual(quarantined[0]["reason"], "empty boundary")
+            self.assertEqual(metrics.REGISTRY.get_counter(metrics.messages_quarantined), 1)
+
+    @ddt.data(
+        (True, 2, 1),
+        (False, 3, 0),
+    )
+    @ddt.unpack
+    async def test_process_file_expunged(self, skip_expunged, expected_stored, expected_skipped):
+        with base.KeepLocalDirClean() as cwd, \
+                base.ValueSwap(metrics, "REGISTRY", metrics.MetricsRegistry()):
+            mbox_filename = os.path.join(cwd.temp_dir.name, "Inbox")
+            with open(mbox_filename, "wb") as mbox_output:
+                for index, status in enumerate([b"0001", b"0009", b"0000"]):
+                    if index:
+                        mbox_output.write(b"\n")
+                    mbox_output.write(
+                        b"From - Mon Jan 01 00:00:00 2024\n"
+                        b"X-Mozilla-Status: " + status + b"\n"
+                        b"Subject: message %d\n"
+                        b"\n"
+                        b"body\n" % index
+                    )
+
+            storage = db.MessageDatabase(None)
+            await dedup.processFile(mbox_filename, storage, skip_expunged=skip_expunged)
+            self.assertEqual(storage.get_unique_message_count(), expected_stored)
+            storage.close()
+            self.assertEqual(metrics.REGISTRY.get_counter(metrics.messages_parsed), 3)
+            self.assertEqual(metrics.REGISTRY.get_counter(metrics.db_rows_inserted), expected_stored)
+            self.assertEqual(metrics.REGISTRY.get_counter(metrics.messages_skipped_expunged), expected_skipped)
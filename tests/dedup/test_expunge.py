@@ -0,0 +1,179 @@
+"""
+Copyright 2023 Benjamen R. Meyer
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import ddt
+import os
+import os.path
+
+from tbdedup import (
+    dedup,
+    mbox,
+)
+from tbdedup.dedup import (
+    expunge,
+)
+from tbdedup.utils import (
+    json,
+    metrics,
+)
+
+from tests import base
+
+
+def generate_mbox(mbox_filename):
+    # message 0 has two duplicates, message 1 one duplicate without a
+    # status header, message 2 is unique
+    records = [
+        (0, 0x0001),
+        (1, 0x0003),
+        (0, 0x00a1),
+        (2, 0x0001),
+        (1, None),
+        (0, 0x0000),
+    ]
+    base.generate_mbox(
+        mbox_filename,
+        [
+            (f"<{message}@tbdedup.test>", b"body %d\n" % message, status)
+            for message, status in records
+        ],
+        subject="expunge",
+        has_status2=True,
+    )
+
+
+def get_statuses(mbox_filename):
+    return [
+        (
+            expunge.find_status(
+                msg.getData("X-Mozilla-Status") or b""
+            )
+        )
+        for msg in mbox.Mailbox(None, mbox_filename).buildSummary()
+    ]
+
+
+@ddt.ddt
+class TestDedupExpunge(base.AsyncioTestCase):
+
+    @ddt.data(
+        (b"From - Mon\nX-Mozilla-Status: 0001\nSubject: a\n\nbody\n", (29, 0x0001)),
+        (b"From - Mon\r\nx-mozilla-status: 000A\r\n\r\nbody\r\n", (30, 0x000a)),
+        (b"From - Mon\nX-Mozilla-Status2: 00000000\nSubject: a\n\nbody\n", None),
+        (b"From - Mon\nSubject: a\n\nX-Mozilla-Status: 0001\n", None),
+    )
+    @ddt.unpack
+    def test_find_status(self, msg_data, expected_status):
+        self.assertEqual(expunge.find_status(msg_data), expected_status)
+
+    async def run_expunge(self, mbox_filename, expunger, skip_expunged=True):
+        return await dedup.dedupper(
+            [mbox_filename],
+            None,
+            expunger=expunger,
+            skip_expunged=skip_expunged,
+        )
+
+    async def test_expunge_and_undo(self):
+        with base.KeepLocalDirClean() as cwd, \
+                base.ValueSwap(metrics, "REGISTRY", metrics.MetricsRegistry()):
+            mbox_filename = os.path.join(cwd.temp_dir.name, "Inbox")
+            generate_mbox(mbox_filename)
+            with open(mbox_filename, "rb") as data_input:
+                original_data = data_input.read()
+
+            journal_filename = os.path.join(cwd.temp_dir.name, "journal.jsonl")
+            expunger = expunge.Expunger(journal_filename)
+            result = await self.run_expunge(mbox_filename, expunger)
+            self.assertEqual(result, journal_filename)
+            self.assertEqual(expunger.expunged, 2)
+            self.assertEqual(expunger.no_status, 1)
+            self.assertEqual(metrics.REGISTRY.get_counter(metrics.messages_expunged), 2)
+
+            with open(mbox_filename, "rb") as data_input:
+                expunged_data = data_input.read()
+            # only the status digits change
+            self.assertEqual(len(expunged_data), len(original_data))
+            self.assertEqual(
+                [
+                    index
+                    for index, (original, expunged) in enumerate(zip(original_data, expunged_data))
+                    if original != expunged
+                ],
+                [
+                    entry[expunge.journal_offset] + 3
+                    for entry in json.load_lines_from_file(journal_filename)
+                ],
+            )
+            self.assertEqual(
+                [
+                    status[1] if status is not None else None
+                    for status in get_statuses(mbox_filename)
+                ],
+                [0x0001, 0x0003, 0x00a9, 0x0001, None, 0x0008],
+            )
+
+            # a second run finds nothing left to do
+            expunger = expunge.Expunger(journal_filename)
+            await self.run_expunge(mbox_filename, expunger)
+            self.assertEqual(expunger.expunged, 0)
+            self.assertEqual(expunger.already_expunged, 0)
+            expunger = expunge.Expunger(journal_filename)
+            await self.run_expunge(mbox_filename, expunger, skip_expunged=False)
+            self.assertEqual(expunger.expunged, 0)
+            self.assertEqual(expunger.already_expunged, 2)
+
+            self.assertEqual(expunge.undo(journal_filename, dry_run=True), 2)
+            with open(mbox_filename, "rb") as data_input:
+                self.assertEqual(data_input.read(), expunged_data)
+
+            self.assertEqual(expunge.undo(journal_filename), 2)
+            with open(mbox_filename, "rb") as data_input:
+                self.assertEqual(data_input.read(), original_data)
+            # nothing left to restore
+            self.assertEqual(expunge.undo(journal_filename), 0)
+
+    async def test_expunge_dry_run(self):
+        with base.KeepLocalDirClean() as cwd:
+            mbox_filename = os.path.join(cwd.temp_dir.name, "Inbox")
+            generate_mbox(mbox_filename)
+            with open(mbox_filename, "rb") as data_input:
+                original_data = data_input.read()
+
+            journal_filename = os.path.join(cwd.temp_dir.name, "journal.jsonl")
+            expunger = expunge.Expunger(journal_filename, dry_run=True)
+            await self.run_expunge(mbox_filename, expunger)
+            self.assertEqual(expunger.expunged, 2)
+            self.assertFalse(os.path.exists(journal_filename))
+            with open(mbox_filename, "rb") as data_input:
+                self.assertEqual(data_input.read(), original_data)
+
+    async def test_undo_changed_file(self):
+        with base.KeepLocalDirClean() as cwd:
+            mbox_filename = os.path.join(cwd.temp_dir.name, "Inbox")
+            generate_mbox(mbox_filename)
+            journal_filename = os.path.join(cwd.temp_dir.name, "journal.jsonl")
+            await self.run_expunge(mbox_filename, expunge.Expunger(journal_filename))
+
+            entries = list(json.load_lines_from_file(journal_filename))
+            with open(mbox_filename, "r+b") as data_output:
+                data_output.seek(entries[0][expunge.journal_offset])
+                data_output.write(b"0101")
+
+            # the changed entry is left alone
+            self.assertEqual(expunge.undo(journal_filename), 1)
+            with open(mbox_filename, "rb") as data_input:
+                data_input.seek(entries[0][expunge.journal_offset])
+                self.assertEqual(data_input.read(4), b"0101")
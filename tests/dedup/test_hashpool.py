@@ -0,0 +1,163 @@
+"""
+Copyright 2023 Benjamen R. Meyer
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import ddt
+import os.path
+
+from tbdedup import (
+    db,
+    dedup,
+    mbox,
+)
+from tbdedup.dedup import (
+    hashpool,
+)
+from tbdedup.utils import (
+    metrics,
+)
+
+from tests import base
+
+
+def write_mbox(mbox_filename):
+    base.generate_mbox(
+        mbox_filename,
+        [
+            (
+                f"<{index % 5}@tbdedup.test>",
+                # every third message is large
+                b"body %d\n" % (index % 5) * (5000 if index % 3 == 0 else 1),
+                0x0001,
+            )
+            for index in range(12)
+        ],
+        subject="pooled",
+    )
+
+
+def get_rows(storage):
+    return sorted(
+        (
+            message["messageid"],
+            message["start_offset"],
+            message["end_offset"],
+            message["disk_hash"],
+            hashid,
+        )
+        for hashid in storage.get_message_hashes()
+        for message in storage.get_messages_by_hash(hashid)
+    )
+
+
+@ddt.ddt
+class TestHashPool(base.AsyncioTestCase):
+
+    def test_from_options(self):
+        self.assertIsNone(hashpool.HashPool.from_options(base.GenericOptions()))
+        options = base.GenericOptions()
+        options.hash_threads = 2
+        with base.ValueSwap(metrics, "REGISTRY", metrics.MetricsRegistry()):
+            hash_pool = hashpool.HashPool.from_options(options)
+            self.assertEqual(hash_pool.thread_count, 2)
+            self.assertEqual(metrics.REGISTRY.gauges[metrics.hash_threads], 2)
+            hash_pool.close()
+
+    @ddt.data(
+        (None, 0),
+        (30000, 4),
+        (0, 12),
+    )
+    @ddt.unpack
+    def test_hash_message(self, min_size, expected_pooled):
+        with base.KeepLocalDirClean() as cwd, \
+                base.ValueSwap(metrics, "REGISTRY", metrics.MetricsRegistry()):
+            mbox_filename = os.path.join(cwd.temp_dir.name, "Inbox")
+            write_mbox(mbox_filename)
+
+            hash_pool = hashpool.HashPool(2, min_size=min_size)
+            for mapped in (False, True):
+                for msg in mbox.Mailbox(None, mbox_filename).buildSummary(mapped=mapped):
+                    msg_hash, disk_hash = hash_pool.hash_message(msg)
+                    self.assertEqual(msg_hash.result(), msg.getHash(diskHash=False))
+                    self.assertEqual(disk_hash.result(), msg.getHash(diskHash=True))
+            hash_pool.close()
+            self.assertEqual(hash_pool.pooled, expected_pooled * 2)
+            self.assertEqual(
+                metrics.REGISTRY.get_counter(metrics.messages_hashed_in_pool) or 0,
+                expected_pooled * 2,
+            )
+
+    @ddt.data(
+        (dedup.strategy_content, False),
+        (dedup.strategy_content, True),
+        (dedup.strategy_message_id, False),
+    )
+    @ddt.unpack
+    async def test_process_file(self, strategy, mapped):
+        with base.KeepLocalDirClean() as cwd, \
+                base.ValueSwap(metrics, "REGISTRY", metrics.MetricsRegistry()):
+            mbox_filename = os.path.join(cwd.temp_dir.name, "Inbox")
+            write_mbox(mbox_filename)
+
+            async def ingest(hash_pool):
+                storage = db.MessageDatabase(None)
+                await dedup.processFile(
+                    mbox_filename,
+                    storage,
+                    strategy=strategy,
+                    mapped=mapped,
+                    hash_pool=hash_pool,
+                )
+                if strategy == dedup.strategy_message_id:
+                    dedup.hashMessageIdCandidates(storage, hash_pool)
+                rows = get_rows(storage)
+                unique_count = storage.get_unique_message_count()
+                storage.close()
+                return rows, unique_count
+
+            rows, unique_count = await ingest(None)
+            self.assertEqual(unique_count, 9)
+
+            # one message waiting at most so the order of the rows is kept
+            hash_pool = hashpool.HashPool(3, min_size=0, max_pending=1)
+            self.assertEqual(await ingest(hash_pool), (rows, unique_count))
+            hash_pool.close()
+            self.assertGreater(hash_pool.pooled, 0)
+
+    async def test_dedupper_shared_pool(self):
+        with base.KeepLocalDirClean() as cwd, \
+                base.ValueSwap(metrics, "REGISTRY", metrics.MetricsRegistry()):
+            mbox_filename = os.path.join(cwd.temp_dir.name, "Inbox")
+            write_mbox(mbox_filename)
+
+            async def run_dedup(name, hash_pool):
+                os.mkdir(os.path.join(cwd.temp_dir.name, name))
+                output_filename = await dedup.dedupper(
+                    [mbox_filename],
+                    os.path.join(cwd.temp_dir.name, f"{name}.sqlite"),
+                    output_base_path=os.path.join(cwd.temp_dir.name, name),
+                    hash_pool=hash_pool,
+                )
+                with open(output_filename, "rb") as output_file:
+                    return output_file.read()
+
+            expected_output = await run_dedup("plain", None)
+
+            # the caller closes the pool so every run can use it
+            hash_pool = hashpool.HashPool(2, min_size=0)
+            self.assertEqual(await run_dedup("first", hash_pool), expected_output)
+            self.assertEqual(await run_dedup("second", hash_pool), expected_output)
+            hash_pool.close()
+            self.assertEqual(hash_pool.pooled, 24)
@@ -0,0 +1,183 @@
+"""
+Copyright 2023 Benjamen R. Meyer
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import ddt
+import os
+import os.path
+
+from tbdedup import (
+    db,
+    dedup,
+)
+from tbdedup.dedup import (
+    output,
+)
+from tbdedup.mbox import (
+    mboxcompress,
+)
+
+from tests import base
+
+
+@ddt.ddt
+class TestDedupOutput(base.AsyncioTestCase):
+
+    @ddt.data(
+        {"compression": "zip"},
+        {"shard_max_bytes": 0},
+        {"shard_max_messages": -1},
+        {"workers": 0},
+    )
+    def test_output_format_invalid(self, kwargs):
+        with self.assertRaises(ValueError):
+            output.OutputFormat(**kwargs)
+
+    def test_output_format_from_options(self):
+        output_format = output.OutputFormat.from_options(
+            base.GenericOptions(
+                output_compression=output.output_compression_xz,
+                shard_max_mb=2,
+                shard_max_messages=None,
+                output_workers=3,
+            )
+        )
+        self.assertEqual(output_format.compression, output.output_compression_xz)
+        self.assertEqual(output_format.shard_max_bytes, 2 * 1024 * 1024)
+        self.assertIsNone(output_format.shard_max_messages)
+        self.assertEqual(output_format.workers, 3)
+        self.assertTrue(output_format.sharded)
+
+        # options from callers that do not know about the output format
+        output_format = output.OutputFormat.from_options(base.GenericOptions())
+        self.assertEqual(output_format.compression, output.output_compression_none)
+        self.assertEqual(output_format.workers, output.default_workers)
+        self.assertFalse(output_format.sharded)
+
+    @ddt.data(
+        (output.output_compression_none, None, "out.mbox"),
+        (output.output_compression_gzip, None, "out.mbox.gz"),
+        (output.output_compression_xz, 2, "out_0002.mbox.xz"),
+        (output.output_compression_bz2, 10, "out_0010.mbox.bz2"),
+    )
+    @ddt.unpack
+    def test_output_format_filename(self, compression, shard_number, expected_result):
+        output_format = output.OutputFormat(compression=compression)
+        self.assertEqual(
+            output_format.filename("out.mbox", shard_number),
+            expected_result,
+        )
+
+    @ddt.data(
+        (None, None, 100, 100, False),
+        (10, None, 11, 1, True),
+        (10, None, 10, 1, False),
+        (None, 1024, 1, 1025, True),
+        (None, 1024, 1, 1024, False),
+    )
+    @ddt.unpack
+    def test_output_format_is_shard_full(self, shard_max_messages, shard_max_bytes, message_count, byte_count, expected_result):
+        output_format = output.OutputFormat(
+            shard_max_messages=shard_max_messages,
+            shard_max_bytes=shard_max_bytes,
+        )
+        self.assertEqual(
+            output_format.is_shard_full(message_count, byte_count),
+            expected_result,
+        )
+
+    async def generate_storage(self, cwd):
+        mbox_files = []
+        for index in range(2):
+            mbox_file = os.path.join(cwd.temp_dir.name, f"mbox_{index}")
+            base.EmailGenerator.GenerateMboxFile(mbox_file, 25, "From", True, True)
+            mbox_files.append(mbox_file)
+        # duplicate one of the files
+        with open(mbox_files[0], "rb") as data_input:
+            data = data_input.read()
+        with open(os.path.join(cwd.temp_dir.name, "mbox_copy"), "wb") as data_output:
+            data_output.write(data)
+        mbox_files.append(os.path.join(cwd.temp_dir.name, "mbox_copy"))
+
+        storage = db.MessageDatabase(None)
+        for mbox_file in mbox_files:
+            await dedup.processFile(mbox_file, storage)
+        return storage
+
+    def read_data(self, filename):
+        with mboxcompress.open_mbox(filename) as data_input:
+            return data_input.read()
+
+    @ddt.data(
+        (output.output_compression_none, 7, None, 8),
+        (output.output_compression_gzip, 7, None, 8),
+        (output.output_compression_xz, None, 4096, None),
+        (output.output_compression_bz2, 1000, None, 1),
+    )
+    @ddt.unpack
+    async def test_write_sharded_messages(self, compression, shard_max_messages, shard_max_bytes, expected_shards):
+        with base.KeepLocalDirClean() as cwd:
+            storage = await self.generate_storage(cwd)
+            unique_count = storage.get_unique_message_count()
+
+            self.assertEqual(
+                dedup.writeUniqueMessages(storage, "single.mbox"),
+                unique_count,
+            )
+
+            output_format = output.OutputFormat(
+                compression=compression,
+                shard_max_messages=shard_max_messages,
+                shard_max_bytes=shard_max_bytes,
+                workers=2,
+            )
+            wcounter, shard_filenames = dedup.writeShardedMessages(
+                storage,
+                "sharded.mbox",
+                False,
+                output_format,
+            )
+            self.assertEqual(wcounter, unique_count)
+            if expected_shards is not None:
+                self.assertEqual(len(shard_filenames), expected_shards)
+            else:
+                self.assertGreater(len(shard_filenames), 1)
+
+            sharded_data = []
+            for shard_number, shard_filename in enumerate(shard_filenames, start=1):
+                self.assertEqual(
+                    shard_filename,
+                    output_format.filename("sharded.mbox", shard_number),
+                )
+                if compression != output.output_compression_none:
+                    self.assertIsNotNone(mboxcompress.detect_compression(shard_filename))
+                sharded_data.append(self.read_data(shard_filename))
+
+            # the same messages in the same order
+            self.assertEqual(b''.join(sharded_data), self.read_data("single.mbox"))
+            storage.close()
+
+    def test_write_sharded_messages_empty(self):
+        with base.KeepLocalDirClean():
+            storage = db.MessageDatabase(None)
+            wcounter, shard_filenames = dedup.writeShardedMessages(
+                storage,
+                "sharded.mbox",
+                False,
+                output.OutputFormat(shard_max_messages=10),
+            )
+            self.assertEqual(wcounter, 0)
+            self.assertEqual(shard_filenames, ["sharded_0001.mbox"])
+            self.assertEqual(os.path.getsize("sharded_0001.mbox"), 0)
+            storage.close()
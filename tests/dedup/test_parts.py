@@ -0,0 +1,200 @@
+"""
+Copyright 2023 Benjamen R. Meyer
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import base64
+import ddt
+import io
+import os
+import os.path
+
+from tbdedup import (
+    db,
+    dedup,
+)
+from tbdedup.dedup import (
+    output,
+    parts,
+)
+from tbdedup.utils import (
+    metrics,
+)
+
+from tests import base
+
+attachment = base64.encodebytes(bytes(range(256)) * 64)
+
+
+def generate_message(index, attachment_data, newline=b"\n"):
+    boundary = b"=====boundary-%04d=====" % index
+    lines = [
+        b"From - Mon Jan 01 00:00:00 2024",
+        b"Message-ID: <%d@tbdedup.test>" % index,
+        b"Subject: message %d" % index,
+        b"Content-Type: multipart/mixed;",
+        b"    boundary=\"" + boundary + b"\"",
+        b"",
+        b"This is a multi-part message in MIME format.",
+        b"--" + boundary,
+        b"Content-Type: text/plain; charset=us-ascii",
+        b"",
+        b"body of message %d" % index,
+        b"",
+        b"--" + boundary,
+        b"Content-Type: application/octet-stream; name=\"report.bin\"",
+        b"Content-Transfer-Encoding: base64",
+        b"",
+    ]
+    return (
+        newline.join(lines) + newline +
+        attachment_data.replace(b"\n", newline) +
+        b"--" + boundary + b"--" + newline +
+        newline
+    )
+
+
+@ddt.ddt
+class TestDedupParts(base.TestCase):
+
+    @ddt.data(
+        b"\n",
+        b"\r\n",
+    )
+    def test_find_parts(self, newline):
+        msg_data = generate_message(1, attachment, newline)
+        found_parts = parts.find_parts(msg_data)
+        self.assertEqual(len(found_parts), 2)
+        text_start, text_end = found_parts[0]
+        self.assertTrue(msg_data[text_start:text_end].startswith(b"Content-Type: text/plain"))
+        attachment_start, attachment_end = found_parts[1]
+        self.assertTrue(msg_data[attachment_end:].startswith(b"--=====boundary-0001=====--"))
+        self.assertTrue(
+            msg_data[attachment_start:attachment_end].endswith(
+                attachment.replace(b"\n", newline)
+            )
+        )
+
+    @ddt.data(
+        b"From - Mon Jan 01 00:00:00 2024\nSubject: plain\n\nbody\n",
+        b"From - Mon Jan 01 00:00:00 2024\nContent-Type: text/plain\n\nbody\n",
+        b"From - Mon Jan 01 00:00:00 2024\nSubject: no body",
+    )
+    def test_find_parts_none(self, msg_data):
+        self.assertEqual(parts.find_parts(msg_data), [])
+
+    def test_externalize_and_reassemble(self):
+        with base.KeepLocalDirClean() as cwd, \
+                base.ValueSwap(metrics, "REGISTRY", metrics.MetricsRegistry()):
+            store = parts.PartStore(
+                os.path.join(cwd.temp_dir.name, "parts"),
+                min_part_size=1024,
+            )
+            messages = [
+                generate_message(index, attachment)
+                for index in range(3)
+            ]
+            externalized = [
+                store.externalize(msg_data)
+                for msg_data in messages
+            ]
+            for msg_data, stub_data in zip(messages, externalized):
+                self.assertLess(len(stub_data), len(msg_data))
+                self.assertIn(b"X-TBDedup-Part-Ref: sha256=", stub_data)
+
+            # the attachment is stored once; the text parts are too small
+            self.assertEqual(store.parts_referenced, 3)
+            self.assertEqual(store.parts_stored, 1)
+            attachment_size = store.bytes_stored
+            self.assertEqual(store.bytes_referenced, 3 * attachment_size)
+            self.assertEqual(
+                store.bytes_saved,
+                2 * attachment_size - store.reference_bytes,
+            )
+            store.report()
+            self.assertEqual(metrics.REGISTRY.get_counter(metrics.parts_stored), 1)
+            self.assertEqual(
+                metrics.REGISTRY.__json__()["gauges"][metrics.part_bytes_saved],
+                store.bytes_saved,
+            )
+
+            rebuilt = io.BytesIO()
+            part_count = store.reassemble(io.BytesIO(b"".join(externalized)), rebuilt)
+            self.assertEqual(part_count, 3)
+            self.assertEqual(rebuilt.getvalue(), b"".join(messages))
+
+            # a new store over the same directory reuses the stored parts
+            other_store = parts.PartStore(store.directory, min_part_size=1024)
+            self.assertEqual(other_store.externalize(messages[0]), externalized[0])
+            self.assertEqual(other_store.parts_stored, 0)
+
+    def test_reassemble_missing_part(self):
+        with base.KeepLocalDirClean() as cwd:
+            store = parts.PartStore(os.path.join(cwd.temp_dir.name, "parts"), min_part_size=1024)
+            stub_data = store.externalize(generate_message(1, attachment))
+            with self.assertRaises(parts.ErrMissingPart):
+                parts.PartStore(
+                    os.path.join(cwd.temp_dir.name, "other"),
+                ).reassemble(io.BytesIO(stub_data), io.BytesIO())
+
+
+@ddt.ddt
+class TestDedupPartsOutput(base.AsyncioTestCase):
+
+    @ddt.data(
+        None,
+        10,
+    )
+    async def test_write_with_part_store(self, shard_max_messages):
+        with base.KeepLocalDirClean() as cwd:
+            mbox_file = os.path.join(cwd.temp_dir.name, "Inbox")
+            with open(mbox_file, "wb") as data_output:
+                for index in range(20):
+                    data_output.write(generate_message(index, attachment))
+            storage = db.MessageDatabase(None)
+            await dedup.processFile(mbox_file, storage)
+            dedup.writeUniqueMessages(storage, "plain.mbox")
+
+            output_format = output.OutputFormat.from_options(
+                base.GenericOptions(
+                    shard_max_messages=shard_max_messages,
+                    part_store=os.path.join(cwd.temp_dir.name, "parts"),
+                    part_min_kb=1,
+                )
+            )
+            if output_format.sharded:
+                _, output_filenames = dedup.writeShardedMessages(storage, "stub.mbox", False, output_format)
+            else:
+                output_filenames = ["stub.mbox"]
+                dedup.writeUniqueMessages(storage, "stub.mbox", output_format=output_format)
+            storage.close()
+
+            self.assertEqual(output_format.part_store.parts_stored, 1)
+            self.assertLess(
+                sum(os.path.getsize(filename) for filename in output_filenames),
+                os.path.getsize("plain.mbox") // 2,
+            )
+
+            rebuilt = []
+            for output_filename in output_filenames:
+                await parts.asyncReassemble(
+                    base.GenericOptions(
+                        part_store=output_format.part_store.directory,
+                        input=output_filename,
+                        output="rebuilt.mbox",
+                    )
+                )
+                with open("rebuilt.mbox", "rb") as data_input:
+                    rebuilt.append(data_input.read())
+            with open("plain.mbox", "rb") as data_input:
+                self.assertEqual(b"".join(rebuilt), data_input.read())
@@ -0,0 +1,58 @@
+"""
+Copyright 2023 Benjamen R. Meyer
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import os.path
+import unittest
+
+try:
+    from tbdedup.gui import jobs
+except ImportError:
+    jobs = None
+
+from tbdedup import (
+    cmd,
+)
+from tbdedup.dedup import (
+    background,
+)
+
+from tests import base
+
+
+@unittest.skipIf(jobs is None, "PyQt5 is not installed")
+class TestGuiJobs(base.TestCase):
+
+    def test_dedup_options(self):
+        options = jobs.get_job_options(background.job_dedup, "profile", "output")
+        expected_options = vars(
+            cmd.get_argument_parser().parse_args([background.job_dedup, "--location", "profile"])
+        )
+        expected_options["hash_storage"] = os.path.join("output", "tbdedup-hash.sqlite")
+        expected_options["output_directory"] = "output"
+        self.assertEqual(options, expected_options)
+
+    def test_combinatory_options(self):
+        options = jobs.get_job_options(background.job_combinatory, "profile", "output")
+        self.assertEqual(options["location"], "profile")
+        self.assertEqual(options["storage_location"], "output")
+        # the rest comes from the command-line defaults
+        self.assertEqual(
+            options,
+            vars(
+                cmd.get_argument_parser().parse_args(
+                    [background.job_combinatory, "--location", "profile", "--storage-location", "output"]
+                )
+            ),
+        )
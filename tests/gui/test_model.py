@@ -0,0 +1,114 @@
+"""
+Copyright 2023 Benjamen R. Meyer
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import os.path
+import unittest
+
+import ddt
+
+try:
+    from PyQt5.QtCore import QModelIndex
+    from tbdedup.gui import model
+except ImportError:
+    model = None
+
+from tests import base
+
+
+@ddt.ddt
+@unittest.skipIf(model is None, "PyQt5 is not installed")
+class TestGuiSearchResultModel(base.TestCase):
+
+    location = os.path.abspath("profile")
+
+    def get_model(self, names):
+        return model.SearchResultModel(
+            self.location,
+            [
+                os.path.join(self.location, name)
+                for name in names
+            ],
+        )
+
+    def fetch_all(self, result_model, parent):
+        fetches = 0
+        while result_model.canFetchMore(parent):
+            result_model.fetchMore(parent)
+            fetches = fetches + 1
+        return fetches
+
+    def test_row_count(self):
+        result_model = self.get_model(["Inbox", "Archives/2023", "Sent"])
+        root = QModelIndex()
+
+        # nothing is created until the view asks for it
+        self.assertEqual(result_model.rowCount(root), 0)
+        self.assertTrue(result_model.hasChildren(root))
+        self.assertTrue(result_model.canFetchMore(root))
+
+        result_model.fetchMore(root)
+        self.assertEqual(result_model.rowCount(root), 3)
+        # folders first, then files, each sorted by name
+        self.assertEqual(
+            [
+                result_model.data(result_model.index(row, model.column_name, root))
+                for row in range(result_model.rowCount(root))
+            ],
+            ["Archives", "Inbox", "Sent"],
+        )
+
+        archives = result_model.index(0, model.column_name, root)
+        self.assertEqual(result_model.rowCount(archives), 0)
+        result_model.fetchMore(archives)
+        self.assertEqual(result_model.rowCount(archives), 1)
+        self.assertEqual(result_model.parent(result_model.index(0, 0, archives)), archives)
+
+        # files never have rows
+        inbox = result_model.index(1, model.column_name, root)
+        self.assertFalse(result_model.hasChildren(inbox))
+        self.assertFalse(result_model.canFetchMore(inbox))
+
+    def test_can_fetch_more_at_end(self):
+        result_model = self.get_model(["Inbox", "Sent"])
+        root = QModelIndex()
+
+        self.assertEqual(self.fetch_all(result_model, root), 1)
+        self.assertFalse(result_model.canFetchMore(root))
+
+        # fetching past the end adds nothing
+        result_model.fetchMore(root)
+        self.assertEqual(result_model.rowCount(root), 2)
+        self.assertFalse(result_model.canFetchMore(root))
+
+    @ddt.data(
+        (1, 1, 1),
+        (3, 3, 1),
+        (7, 3, 3),
+        (9, 3, 3),
+    )
+    @ddt.unpack
+    def test_fetch_batch_size(self, file_count, batch_size, expected_fetches):
+        result_model = self.get_model([
+            f"mbox{index:02d}"
+            for index in range(file_count)
+        ])
+        root = QModelIndex()
+
+        with base.ValueSwap(model, "fetch_batch_size", batch_size):
+            result_model.fetchMore(root)
+            self.assertEqual(result_model.rowCount(root), min(file_count, batch_size))
+
+            self.assertEqual(self.fetch_all(result_model, root), expected_fetches - 1)
+            self.assertEqual(result_model.rowCount(root), file_count)
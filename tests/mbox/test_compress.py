@@ -0,0 +1,268 @@
+"""
+Copyright 2023 Benjamen R. Meyer
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import bz2
+import ddt
+import gzip
+import lzma
+import os
+import os.path
+import random
+
+from tbdedup import (
+    db,
+)
+from tbdedup.mbox import (
+    mboxcompress,
+    mboxfile,
+)
+
+from tests import base
+
+compressors = {
+    mboxcompress.compression_gzip: gzip.compress,
+    mboxcompress.compression_xz: lzma.compress,
+    mboxcompress.compression_bz2: bz2.compress,
+}
+
+
+def generate_data(line_count):
+    rng = random.Random(line_count)
+    return b''.join(
+        b'line %d %s\n' % (index, bytes(rng.choice(b'abcdefgh') for _ in range(40)))
+        for index in range(line_count)
+    )
+
+
+def write_compressed(filename, compression, data, stream_count=1):
+    # several streams one after another, like `cat a.gz b.gz` or `pbzip2`
+    step = len(data) // stream_count
+    with open(filename, "wb") as data_output:
+        for stream_index in range(stream_count):
+            end = (
+                len(data)
+                if stream_index == stream_count - 1
+                else (stream_index + 1) * step
+            )
+            data_output.write(compressors[compression](data[stream_index * step:end]))
+
+
+@ddt.ddt
+class TestMboxCompress(base.TestCase):
+
+    def tearDown(self):
+        super().tearDown()
+        mboxcompress.INDEXES.clear()
+
+    @ddt.data(
+        (b"\x1f\x8b\x08", mboxcompress.compression_gzip),
+        (b"\xfd7zXZ\x00\x00", mboxcompress.compression_xz),
+        (b"BZh91AY", mboxcompress.compression_bz2),
+        (b"From - Mon Jan 01 00:00:00 2024\n", None),
+        (b"", None),
+    )
+    @ddt.unpack
+    def test_detect_compression_data(self, data, expected_result):
+        self.assertEqual(mboxcompress.detect_compression_data(data), expected_result)
+
+    def test_new_decompressor_unknown(self):
+        with self.assertRaises(ValueError):
+            mboxcompress.new_decompressor("zip")
+
+    def test_checkpoint_index(self):
+        index = mboxcompress.CheckpointIndex(mboxcompress.compression_gzip)
+        index.add(mboxcompress.Checkpoint(10, 100))
+        index.add(mboxcompress.Checkpoint(20, 200))
+        # points behind the end of the index are ignored
+        index.add(mboxcompress.Checkpoint(15, 150))
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index.last_offset, 200)
+        self.assertEqual(index.find(0).decompressed_offset, 0)
+        self.assertEqual(index.find(199).decompressed_offset, 100)
+        self.assertEqual(index.find(200).decompressed_offset, 200)
+        self.assertEqual(index.find(10000).decompressed_offset, 200)
+
+    @ddt.data(
+        (mboxcompress.compression_gzip, 1),
+        (mboxcompress.compression_gzip, 3),
+        (mboxcompress.compression_xz, 1),
+        (mboxcompress.compression_xz, 3),
+        (mboxcompress.compression_bz2, 1),
+        (mboxcompress.compression_bz2, 3),
+    )
+    @ddt.unpack
+    def test_read_and_seek(self, compression, stream_count):
+        with base.KeepLocalDirClean(), \
+                base.ValueSwap(mboxcompress, "checkpoint_interval", 64 * 1024), \
+                base.ValueSwap(mboxcompress, "read_size", 16 * 1024):
+            data = generate_data(8000)
+            write_compressed("archive", compression, data, stream_count)
+
+            with mboxcompress.open_mbox("archive") as data_input:
+                self.assertEqual(b''.join(data_input), data)
+                self.assertEqual(data_input.tell(), len(data))
+                self.assertEqual(
+                    data_input.raw.compressed_position,
+                    os.path.getsize("archive"),
+                )
+                index = data_input.raw.index
+
+            # every stream starts with a seek point; gzip has more within
+            if compression == mboxcompress.compression_gzip:
+                self.assertGreater(len(index), stream_count)
+            else:
+                self.assertEqual(len(index), stream_count)
+
+            # the index is shared with later readers of the same file
+            rng = random.Random(stream_count)
+            with mboxcompress.open_mbox("archive") as data_input:
+                self.assertIs(data_input.raw.index, index)
+                for _ in range(25):
+                    offset = rng.randrange(len(data))
+                    length = rng.randrange(4096)
+                    self.assertEqual(data_input.seek(offset), offset)
+                    self.assertEqual(data_input.read(length), data[offset:offset + length])
+
+            mboxcompress.release_index("archive")
+            self.assertEqual(mboxcompress.INDEXES, {})
+
+    def test_open_mbox_uncompressed(self):
+        with base.KeepLocalDirClean():
+            with open("plain", "wb") as data_output:
+                data_output.write(b"foo")
+            with mboxcompress.open_mbox("plain") as data_input:
+                self.assertNotIsInstance(data_input.raw, mboxcompress.CompressedReader)
+                self.assertEqual(data_input.read(), b"foo")
+
+    def test_index_changed_file(self):
+        with base.KeepLocalDirClean():
+            write_compressed("archive", mboxcompress.compression_gzip, b"foo")
+            index = mboxcompress.get_index("archive", mboxcompress.compression_gzip)
+            self.assertIs(
+                mboxcompress.get_index("archive", mboxcompress.compression_gzip),
+                index,
+            )
+            write_compressed("archive", mboxcompress.compression_gzip, b"foobar")
+            self.assertIsNot(
+                mboxcompress.get_index("archive", mboxcompress.compression_gzip),
+                index,
+            )
+
+    def test_truncated(self):
+        with base.KeepLocalDirClean():
+            data = generate_data(1000)
+            with open("archive", "wb") as data_output:
+                data_output.write(gzip.compress(data)[:-100])
+            with self.assertRaises(EOFError):
+                with mboxcompress.open_mbox("archive") as data_input:
+                    data_input.read()
+            self.assertEqual(mboxcompress.read_head("archive", 10), data[:10])
+
+    @ddt.data(
+        mboxcompress.compression_gzip,
+        mboxcompress.compression_xz,
+        mboxcompress.compression_bz2,
+    )
+    def test_mailbox(self, compression):
+        with base.KeepLocalDirClean() as cwd:
+            mbox_file = os.path.join(cwd.temp_dir.name, "plain.mbox")
+            base.EmailGenerator.GenerateMboxFile(mbox_file, 20, "From", True, True)
+            with open(mbox_file, "rb") as data_input:
+                data = data_input.read()
+            compressed_file = os.path.join(cwd.temp_dir.name, "archive.mbox.compressed")
+            write_compressed(compressed_file, compression, data, 2)
+
+            plain_msgs = list(mboxfile.Mailbox(None, mbox_file).buildSummary())
+            box = mboxfile.Mailbox(None, compressed_file)
+            storage = db.MessageDatabase(None)
+            compressed_msgs = []
+            for msg in box.buildSummary():
+                compressed_msgs.append(msg)
+                storage.add_message(
+                    msg.getHash(diskHash=False),
+                    msg.getMsgId(),
+                    compressed_file,
+                    msg.getMessageIDHeader(),
+                    msg.getMessageIDHeaderHash(),
+                    msg.start_offset,
+                    msg.end_offset,
+                    msg.getHash(diskHash=True),
+                )
+            # progress is reported against the file on disk
+            self.assertEqual(box.input_offset, os.path.getsize(compressed_file))
+
+            self.assertEqual(
+                [(msg.start_offset, msg.end_offset) for msg in compressed_msgs],
+                [(msg.start_offset, msg.end_offset) for msg in plain_msgs],
+            )
+            self.assertEqual(
+                mboxfile.Mailbox.count_messages(compressed_file),
+                len(plain_msgs),
+            )
+            self.assertEqual(
+                mboxfile.Mailbox.detect_mbox_type_sampled(compressed_file)[0],
+                mboxfile.Mailbox.detect_mbox_type_sampled(mbox_file)[0],
+            )
+
+            for unique_hashid in storage.get_message_hashes(use_disk=True):
+                for msg_for_hash in storage.get_messages_by_hash(unique_hashid, use_disk=True):
+                    self.assertEqual(
+                        mboxfile.Mailbox.getMessageFromFile(msg_for_hash),
+                        data[msg_for_hash['start_offset']:msg_for_hash['end_offset']],
+                    )
+            storage.close()
+
+    @ddt.data(
+        mboxcompress.compression_gzip,
+        mboxcompress.compression_xz,
+        mboxcompress.compression_bz2,
+    )
+    def test_message_reader(self, compression):
+        with base.KeepLocalDirClean() as cwd:
+            mbox_file = os.path.join(cwd.temp_dir.name, "plain.mbox")
+            base.EmailGenerator.GenerateMboxFile(mbox_file, 20, "From", True, True)
+            with open(mbox_file, "rb") as data_input:
+                data = data_input.read()
+            compressed_file = os.path.join(cwd.temp_dir.name, "archive.mbox.compressed")
+            write_compressed(compressed_file, compression, data)
+            msgs = list(mboxfile.Mailbox(None, mbox_file).buildSummary())
+
+            restarts = []
+            restart = mboxcompress.CompressedReader._restart
+
+            def count_restart(reader, checkpoint):
+                restarts.append(checkpoint.decompressed_offset)
+                restart(reader, checkpoint)
+
+            with base.ValueSwap(mboxcompress.CompressedReader, "_restart", count_restart), \
+                    mboxfile.MessageReader(max_open=1) as message_reader:
+                for location in (compressed_file, mbox_file, compressed_file):
+                    for msg in msgs:
+                        self.assertEqual(
+                            mboxfile.Mailbox.getMessageFromFile(
+                                {
+                                    "location": location,
+                                    "messageid": msg.getMsgId(),
+                                    "start_offset": msg.start_offset,
+                                    "end_offset": msg.end_offset,
+                                },
+                                message_reader,
+                            ),
+                            data[msg.start_offset:msg.end_offset],
+                        )
+                    self.assertEqual(list(message_reader.readers), [location])
+            self.assertEqual(message_reader.readers, {})
+            # opened twice, and only ever read forward
+            self.assertEqual(restarts, [0, 0])
@@ -15,6 +15,7 @@ limitations under the License.
 """
 import datetime
 import ddt
+import logging
 import os
 import os.path
 
@@ -76,6 +77,84 @@ class TestMboxMailbox(base.TestCase):
             detected_format = mboxfile.Mailbox.detect_mbox_type(mbox_file)
             self.assertEqual(detected_format, expected_format)
 
+    @ddt.data(
+        ("> From", False, 10, False, mboxfile.Mailbox.MBOXRD),  # MBOXRD
+        ("From", False, 10, False, mboxfile.Mailbox.MBOXO),  # MBOXO
+        ("> From", True, 10, False, mboxfile.Mailbox.MBOXCL),  # MBOXCL
+        ("From", True, 10, False, mboxfile.Mailbox.MBOXCL2),  # MBOXCL2
+        ("> From", False, 10, True, mboxfile.Mailbox.MBOXRD),  # MBOXRD + Boundaries
+        ("From", False, 10, True, mboxfile.Mailbox.MBOXO),  # MBOXO + Boundaries
+        ("> From", True, 10, True, mboxfile.Mailbox.MBOXCL),  # MBOXCL + Boundaries
+        ("From", True, 10, True, mboxfile.Mailbox.MBOXCL2),  # MBOXCL2 + Boundaries
+        ("From", True, 1005, True, mboxfile.Mailbox.MBOXCL2),  # MBOXCL2 + Boundaries
+        ("> From", False, 5000, False, mboxfile.Mailbox.MBOXRD),  # MBOXRD spanning many windows
+    )
+    @ddt.unpack
+    def test_detect_mbox_type_sampled(
+        self,
+        from_line_format, has_content_length,
+        email_count, use_content_boundary,
+        expected_format,
+    ):
+        with base.KeepLocalDirClean() as cwd:
+            mbox_file = os.path.join(
+                cwd.temp_dir.name,
+                base.generate_mbox_filename(expected_format, use_content_boundary),
+            )
+            base.EmailGenerator.GenerateMboxFile(
+                mbox_file,
+                email_count,
+                from_line_format,
+                has_content_length,
+                use_content_boundary,
+            )
+
+            detected_format, confidence = mboxfile.Mailbox.detect_mbox_type_sampled(mbox_file)
+            self.assertEqual(detected_format, expected_format)
+            self.assertEqual(detected_format, mboxfile.Mailbox.detect_mbox_type(mbox_file))
+            self.assertEqual(confidence, 1.0)
+
+    def test_detect_mbox_type_sampled_large_message(self):
+        with base.KeepLocalDirClean() as cwd:
+            mbox_file = os.path.join(cwd.temp_dir.name, "large_message")
+            with open(mbox_file, "wb") as mbox_output:
+                mbox_output.write(b"From - Mon Jan 01 00:00:00 2024\n")
+                mbox_output.write(b"Content-Length: 10\n\n")
+                # a large attachment where most windows see no MBOX markers
+                for _ in range(20000):
+                    mbox_output.write(b"QUJDREVGR0hJSktMTU5PUFFSU1RVVldYWVo=\n")
+
+            detected_format, confidence = mboxfile.Mailbox.detect_mbox_type_sampled(
+                mbox_file,
+                sample_count=4,
+                sample_window=4096,
+            )
+            self.assertEqual(detected_format, mboxfile.Mailbox.MBOXCL2)
+            self.assertEqual(confidence, 0.2)
+
+    def test_detect_mbox_type_sampled_empty(self):
+        with base.KeepLocalDirClean() as cwd:
+            mbox_file = os.path.join(cwd.temp_dir.name, "empty")
+            with open(mbox_file, "wb") as mbox_output:
+                pass
+
+            self.assertEqual(
+                mboxfile.Mailbox.detect_mbox_type_sampled(mbox_file),
+                (mboxfile.Mailbox.MBOXO, 0.0),
+            )
+
+    @ddt.data(
+        (100, 8, 1024, [0]),
+        (9000, 8, 1000, [0, 1000, 2000, 3000, 4000, 5000, 6000, 7000, 8000]),
+        (3000, 8, 1000, [0, 1000, 2000]),
+    )
+    @ddt.unpack
+    def test_get_sample_offsets(self, file_length, sample_count, sample_window, expected_offsets):
+        self.assertEqual(
+            mboxfile.Mailbox.get_sample_offsets(file_length, sample_count, sample_window),
+            expected_offsets,
+        )
+
     @ddt.data(
         (0, "FROM", 0, False),
         (0, "FROM", 0, True),
@@ -130,6 +209,149 @@ class TestMboxMailbox(base.TestCase):
             result = mb.parseBoundaryMarker(currentRecord, 'Content-Type')
             self.assertEqual(result, expected_boundary)
 
+    @ddt.data(
+        ("From", False, 10, False),
+        ("From", True, 10, False),
+        ("From", False, 10, True),
+        ("From", True, 10, True),
+    )
+    @ddt.unpack
+    def test_buildSummary_mapped(
+        self,
+        from_line_format, has_content_length,
+        email_count, use_content_boundary,
+    ):
+        with base.KeepLocalDirClean() as cwd:
+            mbox_file = os.path.join(
+                cwd.temp_dir.name,
+                base.generate_mbox_filename(mboxfile.Mailbox.MBOXO, use_content_boundary),
+            )
+            base.EmailGenerator.GenerateMboxFile(
+                mbox_file,
+                email_count,
+                from_line_format,
+                has_content_length,
+                use_content_boundary,
+            )
+
+            def summarize(mapped):
+                # mapped messages are only valid while the file is parsed
+                return [
+                    (
+                        type(msg),
+                        msg.start_offset,
+                        msg.end_offset,
+                        msg.getHash(diskHash=False),
+                        msg.getHash(diskHash=True),
+                        msg.getMessageIDHeader(),
+                        msg.getData("Content-Type"),
+                    )
+                    for msg in mboxfile.Mailbox(None, mbox_file).buildSummary(mapped=mapped)
+                ]
+
+            records = summarize(False)
+            mapped_records = summarize(True)
+            self.assertEqual(len(mapped_records), email_count)
+            for record, mapped_record in zip(records, mapped_records):
+                self.assertIs(record[0], mboxmessage.Message)
+                self.assertIs(mapped_record[0], mboxmessage.MappedMessage)
+                self.assertEqual(record[1:], mapped_record[1:])
+
+    def test_buildSummary_mapped_empty(self):
+        with base.KeepLocalDirClean() as cwd:
+            mbox_file = os.path.join(cwd.temp_dir.name, "Inbox")
+            open(mbox_file, "wb").close()
+            with self.assertRaises(mboxfile.ErrEmptyFile):
+                list(mboxfile.Mailbox(None, mbox_file).buildSummary(mapped=True))
+
+    @ddt.data(
+        (b'Content-Type: multipart/mixed; boundary="abc"', "--abc"),
+        (b'Content-Type: multipart/mixed;\n    boundary="a:b=c"\n', "--a:b=c"),
+        (b'Content-Type: multipart/mixed; BOUNDARY = xyz ; charset=us-ascii', "--xyz"),
+        (b'Content-Type: text/plain; charset=us-ascii', ""),
+        (b'Content-Type: multipart/mixed; xboundary="abc"', ""),
+    )
+    @ddt.unpack
+    def test_boundaryMarkerFromHeader(self, header_value_data, expected_marker):
+        self.assertEqual(
+            mboxfile.Mailbox.boundaryMarkerFromHeader(header_value_data),
+            expected_marker,
+        )
+
+    @ddt.data(
+        b'Content-Type: multipart/mixed; boundary="abc',
+        b'Content-Type: multipart/mixed; boundary=',
+        b'Content-Type: multipart/mixed; boundary=""',
+        b'Content-Type: multipart/mixed; boundary="a\n b"',
+    )
+    def test_boundaryMarkerFromHeader_malformed(self, header_value_data):
+        with self.assertRaises(mboxfile.ErrMalformedBoundary):
+            mboxfile.Mailbox.boundaryMarkerFromHeader(header_value_data)
+
+    def test_buildSummary_malformed_boundary(self):
+        with base.KeepLocalDirClean() as cwd:
+            mbox_file = os.path.join(cwd.temp_dir.name, "Inbox")
+            with open(mbox_file, "wb") as data_output:
+                for index in range(3):
+                    boundary = (
+                        b'"unterminated'
+                        if index == 1
+                        else b'"boundary-%d"' % index
+                    )
+                    data_output.write(
+                        b"From - Mon Jan 01 00:00:00 2024\n"
+                        b"Content-Type: multipart/mixed; boundary=" + boundary + b"\n"
+                        b"Subject: message %d\n"
+                        b"\n"
+                        b"body %d\n"
+                        b"\n" % (index, index)
+                    )
+
+            records = list(mboxfile.Mailbox(None, mbox_file).buildSummary())
+            self.assertEqual(len(records), 3)
+            self.assertEqual(
+                [record.malformed is not None for record in records],
+                [False, True, False],
+            )
+
+    @ddt.data(
+        (False, logging.DEBUG, False),
+        (True, logging.INFO, False),
+        (True, logging.DEBUG, True),
+    )
+    @ddt.unpack
+    def test_buildSummary_trace(self, trace_enabled, log_level, expect_trace):
+        with base.KeepLocalDirClean() as cwd:
+            mbox_file = os.path.join(
+                cwd.temp_dir.name,
+                base.generate_mbox_filename(mboxfile.Mailbox.MBOXO, False),
+            )
+            base.EmailGenerator.GenerateMboxFile(
+                mbox_file,
+                5,
+                "From",
+                False,
+                False,
+            )
+            mb = mboxfile.Mailbox(None, mbox_file)
+            mb.trace_enabled = trace_enabled
+
+            with self.assertLogs(mboxfile.LOG, level=logging.DEBUG) as captured:
+                mboxfile.LOG.setLevel(log_level)
+                try:
+                    mboxfile.LOG.info('start')
+                    msgs = list(mb.buildSummary())
+                finally:
+                    mboxfile.LOG.setLevel(logging.NOTSET)
+
+            self.assertEqual(len(msgs), 5)
+            traced = [
+                line
+                for line in captured.output
+                if 'Found start of file' in line
+            ]
+            self.assertEqual(len(traced), 1 if expect_trace else 0)
+
     @ddt.data(
         ("From", False, 10, False, mboxfile.Mailbox.MBOXRD, False),  # MBOXRD
         ("From", False, 10, False, mboxfile.Mailbox.MBOXO, False),  # MBOXO
@@ -170,6 +392,87 @@ class TestMboxMailbox(base.TestCase):
 
             self.assertEqual(len(msgs), email_count)
 
+    @ddt.data(
+        ("From", False, 10, False),
+        ("From", True, 10, False),
+        ("From", False, 10, True),
+        ("From", True, 10, True),
+    )
+    @ddt.unpack
+    def test_parseRecord(
+        self,
+        from_line_format, has_content_length,
+        email_count, use_content_boundary,
+    ):
+        with base.KeepLocalDirClean() as cwd:
+            mbox_file = os.path.join(
+                cwd.temp_dir.name,
+                base.generate_mbox_filename(mboxfile.Mailbox.MBOXO, use_content_boundary),
+            )
+            base.EmailGenerator.GenerateMboxFile(
+                mbox_file,
+                email_count,
+                from_line_format,
+                has_content_length,
+                use_content_boundary,
+            )
+            records = list(mboxfile.Mailbox(None, mbox_file).buildSummary())
+            for msg in records:
+                record_data = mboxfile.Mailbox.getMessageFromFile({
+                    "location": mbox_file,
+                    "messageid": msg.getMsgId(),
+                    "start_offset": msg.start_offset,
+                    "end_offset": msg.end_offset,
+                })
+                record = mboxfile.Mailbox.parseRecord(record_data, msg is records[-1])
+                # the same hashes as parsing the whole file
+                self.assertEqual(record.getHash(diskHash=False), msg.getHash(diskHash=False))
+                self.assertEqual(record.getHash(diskHash=True), msg.getHash(diskHash=True))
+                self.assertEqual(record.getMessageIDHeader(), msg.getMessageIDHeader())
+
+    @ddt.data(
+        ("From", False, 1, False),
+        ("From", False, 10, False),
+        ("From", True, 10, False),
+        ("From", False, 10, True),
+        ("From", True, 10, True),
+    )
+    @ddt.unpack
+    def test_count_messages(
+        self,
+        from_line_format, has_content_length,
+        email_count, use_content_boundary,
+    ):
+        with base.KeepLocalDirClean() as cwd:
+            mbox_file = os.path.join(
+                cwd.temp_dir.name,
+                base.generate_mbox_filename(mboxfile.Mailbox.MBOXO, use_content_boundary),
+            )
+            base.EmailGenerator.GenerateMboxFile(
+                mbox_file,
+                email_count,
+                from_line_format,
+                has_content_length,
+                use_content_boundary,
+            )
+            msgs = list(mboxfile.Mailbox(None, mbox_file).buildSummary())
+            self.assertEqual(len(msgs), email_count)
+            self.assertEqual(
+                mboxfile.Mailbox.count_messages(mbox_file),
+                email_count,
+            )
+
+    @ddt.data(
+        b"",
+        b"not an mbox file\n\nFrom - Mon Jan 01 00:00:00 2024\n",
+    )
+    def test_count_messages_not_mbox(self, file_data):
+        with base.KeepLocalDirClean() as cwd:
+            mbox_file = os.path.join(cwd.temp_dir.name, "not_mbox")
+            with open(mbox_file, "wb") as output:
+                output.write(file_data)
+            self.assertEqual(mboxfile.Mailbox.count_messages(mbox_file), 0)
+
     @ddt.data(
         ("From", False, 10, False, mboxfile.Mailbox.MBOXRD, False),  # MBOXRD
         ("From", False, 10, False, mboxfile.Mailbox.MBOXO, False),  # MBOXO
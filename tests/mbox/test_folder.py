@@ -58,6 +58,8 @@ class TestMboxFolder(base.AsyncioTestCase):
                             else f"{index:030}.{index:2}",
                         )
                         with open(fname, "wt") as foutput:
+                            if not with_period:
+                                foutput.write("From - Mon Jan 01 00:00:00 2024\n")
                             foutput.write(f"data for {index:030}")
                         if not with_period:
                             generated_files.append(fname)
@@ -96,6 +98,10 @@ class TestMboxFolder(base.AsyncioTestCase):
             # put the remaining in the main folder
             populate_folder(the_cwd, file_count)
             populate_folder(the_cwd, 10, with_period=True)
+            # extension-less files that are not MBOX files must be skipped
+            for index in range(5):
+                with open(os.path.join(the_cwd, f"not_mbox_{index}"), "wt") as foutput:
+                    foutput.write(f"data for {index:030}")
 
             mf = mboxfolder.MailboxFolder(the_cwd)
             allfiles = await mf.getMboxFiles()
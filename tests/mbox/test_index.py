@@ -0,0 +1,265 @@
+"""
+Copyright 2023 Benjamen R. Meyer
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import ddt
+import mmap
+import os.path
+import random
+import unittest
+
+from tbdedup.mbox import (
+    mboxfile,
+    mboxindex,
+)
+
+from tests import base
+
+# records the parser splits the same with and without the index
+TRICKY_MBOX = (
+    b"From - Mon Jan 01 00:00:00 2024\n"
+    b"Message-ID: <0@tbdedup.test>\n"
+    b"Subject: plain\n"
+    b"\n"
+    b"body 0\n"
+    # not right after a blank line but the parser still splits here
+    b"From - in the body\n"
+    b"\n"
+    b"more body\n"
+    b"From - Mon Jan 01 00:00:00 2024\n"
+    b"Message-ID: <1@tbdedup.test>\n"
+    b"\n"
+    b"body 1\n"
+    b"\n"
+    b">From - escaped\n"
+    b"\n"
+    # trailing whitespace only, not a FROM line
+    b"From -  \n"
+    b"\n"
+    b"  From - Mon Jan 01 00:00:00 2024 indented\n"
+    b"Message-ID: <2@tbdedup.test>\n"
+    b"Content-Type: multipart/mixed; boundary=\"abc\"\n"
+    b"Subject: parts\n"
+    b"\n"
+    b"--abc\n"
+    b"Content-Type: text/plain\n"
+    b"\n"
+    b"part From - inline\n"
+    b"--abc--\n"
+    b"\r\n"
+    b"\n"
+    b"From - Mon Jan 01 00:00:00 2024\n"
+    b"Message-ID: <3@tbdedup.test>\n"
+    b"\n"
+    b"last body without a newline"
+)
+
+
+def describe(msg):
+    return (
+        msg.start_offset,
+        msg.end_offset,
+        msg.getHash(diskHash=False),
+        msg.getHash(diskHash=True),
+        msg.getMessageIDHeader(),
+        msg.getData("body"),
+    )
+
+
+def summarize(mbox_file, use_index):
+    box = mboxfile.Mailbox(None, mbox_file)
+    with open(mbox_file, "rb") as data_input:
+        with mmap.mmap(data_input.fileno(), 0, access=mmap.ACCESS_READ) as data_map:
+            record_index = (
+                mboxindex.RecordIndex.build(data_map)
+                if use_index
+                else None
+            )
+            records = [
+                describe(msg)
+                for msg in box.parseRecords(data_map, record_index=record_index)
+            ]
+            del record_index
+    return records
+
+
+@ddt.ddt
+class TestRecordIndex(base.TestCase):
+
+    def test_build_without_numpy(self):
+        with base.ValueSwap(mboxindex, "numpy", None):
+            self.assertIsNone(mboxindex.RecordIndex.build(b"From - Mon\n"))
+
+    @unittest.skipIf(mboxindex.numpy is None, "NumPy is not installed")
+    @ddt.data(1, 3, 1024)
+    def test_find_all(self, chunk_size):
+        data = b"From - a\nFrom - b\n\nxFrom - c From -"
+        self.assertEqual(
+            mboxindex.find_all(data, b"From - ", chunk_size=chunk_size).tolist(),
+            [0, 9, 20],
+        )
+        self.assertEqual(mboxindex.find_all(b"From", b"From - ").tolist(), [])
+
+    @unittest.skipIf(mboxindex.numpy is None, "NumPy is not installed")
+    def test_record_offsets(self):
+        record_index = mboxindex.RecordIndex(
+            TRICKY_MBOX,
+            mboxindex.find_all(TRICKY_MBOX, mboxindex.from_marker),
+        )
+        self.assertEqual(
+            record_index.record_offsets.tolist(),
+            [
+                0,
+                TRICKY_MBOX.index(b"  From - Mon") + 2,
+                TRICKY_MBOX.index(b"From - Mon", TRICKY_MBOX.index(b"\r\n")),
+            ],
+        )
+        # a FROM line the parser has to look at itself
+        self.assertIsNone(record_index.body_end(TRICKY_MBOX.index(b"more body")))
+        self.assertIsNone(record_index.body_end(TRICKY_MBOX.index(b"part From")))
+        self.assertEqual(
+            record_index.body_end(TRICKY_MBOX.index(b"--abc--")),
+            TRICKY_MBOX.index(b"\r\n\n") + 2,
+        )
+        self.assertEqual(
+            record_index.body_end(TRICKY_MBOX.index(b"last body")),
+            len(TRICKY_MBOX),
+        )
+
+    @unittest.skipIf(mboxindex.numpy is None, "NumPy is not installed")
+    @ddt.data(
+        TRICKY_MBOX,
+        b"From - a\n",
+        b"\nFrom - a\n",
+        b"x\n\nFrom - ",
+        b"x\n\nFrom - \t\n",
+        b"x\n\nFrom - \t b\n",
+        b"x\n \r\nFrom - a\n",
+        b"x\n\xa0\nFrom - a\n",
+        b"x\nbody \nFrom - a\n",
+        b"x\n\n \tFrom - a\n",
+        b"x\n\n\x0cFrom - a\n",
+        b"x\n\n From - From - a\n",
+        b"x\n\nFrom - \nFrom - a\n",
+        # no newline at all
+        b"From - Mon Jan 01 00:00:00 2024",
+        b"  From - a",
+        b"x From - a From - b",
+    )
+    def test_blank_lines(self, data):
+        self.assert_blank_lines(data)
+
+    @unittest.skipIf(mboxindex.numpy is None, "NumPy is not installed")
+    def test_blank_lines_random(self):
+        rng = random.Random(48)
+        pieces = [b"From - ", b"From - a", b"\n", b"\r\n", b" ", b"\t", b"x", b"\xa0"]
+        for _ in range(500):
+            self.assert_blank_lines(
+                b"".join(
+                    rng.choice(pieces)
+                    for _ in range(rng.randrange(1, 16))
+                )
+            )
+
+    def assert_blank_lines(self, data):
+        # the vectorized check must agree with the line by line one
+        record_index = mboxindex.RecordIndex(
+            data,
+            mboxindex.find_all(data, mboxindex.from_marker),
+        )
+        self.assertEqual(
+            record_index.blank_lines.tolist(),
+            [
+                -1 if blank_line is None else blank_line
+                for blank_line in (
+                    record_index.get_blank_line(position)
+                    for position in record_index.from_positions.tolist()
+                )
+            ],
+            data,
+        )
+
+    def test_parse_tricky_without_numpy(self):
+        with base.KeepLocalDirClean() as cwd:
+            mbox_file = os.path.join(cwd.temp_dir.name, "Inbox")
+            with open(mbox_file, "wb") as data_output:
+                data_output.write(TRICKY_MBOX)
+
+            records = summarize(mbox_file, False)
+            with base.ValueSwap(mboxindex, "numpy", None):
+                box = mboxfile.Mailbox(None, mbox_file)
+                self.assertEqual(
+                    [
+                        describe(msg)
+                        for msg in box.buildSummary(mapped=True)
+                    ],
+                    records,
+                )
+
+    @unittest.skipIf(mboxindex.numpy is None, "NumPy is not installed")
+    def test_parse_single_line(self):
+        with base.KeepLocalDirClean() as cwd:
+            mbox_file = os.path.join(cwd.temp_dir.name, "Inbox")
+            with open(mbox_file, "wb") as data_output:
+                data_output.write(b"From - Mon Jan 01 00:00:00 2024")
+
+            records = summarize(mbox_file, False)
+            self.assertEqual(len(records), 1)
+            self.assertEqual(summarize(mbox_file, True), records)
+            self.assertEqual(
+                [
+                    describe(msg)
+                    for msg in mboxfile.Mailbox(None, mbox_file).buildSummary(mapped=True)
+                ],
+                records,
+            )
+
+    @unittest.skipIf(mboxindex.numpy is None, "NumPy is not installed")
+    def test_parse_tricky(self):
+        with base.KeepLocalDirClean() as cwd:
+            mbox_file = os.path.join(cwd.temp_dir.name, "Inbox")
+            with open(mbox_file, "wb") as data_output:
+                data_output.write(TRICKY_MBOX)
+
+            records = summarize(mbox_file, False)
+            self.assertEqual(len(records), 5)
+            self.assertEqual(summarize(mbox_file, True), records)
+
+    @unittest.skipIf(mboxindex.numpy is None, "NumPy is not installed")
+    @ddt.data(
+        ("From", False, 10, False),
+        ("From", True, 10, False),
+        ("From", False, 10, True),
+    )
+    @ddt.unpack
+    def test_parse_generated(
+        self,
+        from_line_format, has_content_length,
+        email_count, use_content_boundary,
+    ):
+        with base.KeepLocalDirClean() as cwd:
+            mbox_file = os.path.join(
+                cwd.temp_dir.name,
+                base.generate_mbox_filename(mboxfile.Mailbox.MBOXO, use_content_boundary),
+            )
+            base.EmailGenerator.GenerateMboxFile(
+                mbox_file,
+                email_count,
+                from_line_format,
+                has_content_length,
+                use_content_boundary,
+            )
+            records = summarize(mbox_file, False)
+            self.assertEqual(len(records), email_count)
+            self.assertEqual(summarize(mbox_file, True), records)
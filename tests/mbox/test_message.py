@@ -175,6 +175,20 @@ class TestMboxMessage(base.TestCase):
 
         self.assertEqual(result, m.hexdigest())
 
+    @ddt.data(
+        (" 0001 ", 0x0001, False),
+        ("0009", 0x0009, True),
+        ("00A8", 0x00a8, True),
+        ("zzzz", None, False),
+    )
+    @ddt.unpack
+    def test_set_status(self, raw_status, expected_status, expected_expunged):
+        msg = mboxmessage.Message(0, "FROM Jan 2024", 0)
+        self.assertFalse(msg.isExpunged())
+        msg.setStatus(raw_status)
+        self.assertEqual(msg.status, expected_status)
+        self.assertEqual(msg.isExpunged(), expected_expunged)
+
     def test_get_hash(self):
         rawLines = ["FROM Jan 2024",]
         msg = mboxmessage.Message(0, rawLines[0], 0)
@@ -227,3 +241,85 @@ class TestMboxMessage(base.TestCase):
 
         self.assertEqual(disk_hash_value, disk_hash.hexdigest())
         self.assertEqual(non_disk_hash_value, non_disk_hash.hexdigest())
+
+
+@ddt.ddt
+class TestMboxMappedMessage(base.TestCase):
+
+    def build_messages(self, lines):
+        data_map = b"".join(line for _, line in lines)
+        msg = mboxmessage.Message(0, lines[0][1], 0)
+        mapped_msg = mboxmessage.MappedMessage(0, lines[0][1], 0, data_map)
+        offset = len(lines[0][1])
+        for key, line in lines[1:]:
+            msg.addData(key, line, offset)
+            mapped_msg.addData(key, line, offset)
+            offset = offset + len(line)
+        msg.end_offset = offset
+        mapped_msg.end_offset = offset
+        return msg, mapped_msg
+
+    @ddt.data(
+        False,
+        True,
+    )
+    def test_matches_message(self, drop_last_line):
+        msg, mapped_msg = self.build_messages([
+            (None, b"From - Mon Jan 01 00:00:00 2024\n"),
+            ("X-Mozilla-Status", b"X-Mozilla-Status: 0001\n"),
+            ("Received", b"Received: from a\n"),
+            ("Received", b"    by b\n"),
+            ("Message-ID", b"Message-ID: <1@tbdedup.test>\n"),
+            ("Received", b"Received: from c\n"),
+            ("Subject", b"Subject: mapped\n"),
+            ("Subject", b"\n"),
+            ("body", b"line 1\n"),
+            ("body", b"line 2\n"),
+            ("body", b"\n"),
+        ])
+        # lines are merged into ranges
+        data_map = mapped_msg.data_map
+        first_received = data_map.index(b"Received: from a")
+        second_received = data_map.index(b"Received: from c")
+        self.assertEqual(
+            mapped_msg.headerRanges["Received"],
+            [
+                [first_received, data_map.index(b"Message-ID")],
+                [second_received, data_map.index(b"Subject")],
+            ],
+        )
+        self.assertEqual(len(mapped_msg.bodyRanges), 1)
+
+        if drop_last_line:
+            msg.dropLastBodyLine()
+            mapped_msg.dropLastBodyLine()
+            msg.end_offset = msg.end_offset - 1
+            mapped_msg.end_offset = mapped_msg.end_offset - 1
+
+        self.assertEqual(mapped_msg.getData("body"), msg.getData("body"))
+        self.assertEqual(mapped_msg.getData("Received"), msg.getData("Received"))
+        self.assertIsNone(mapped_msg.getData("Content-Type"))
+        self.assertEqual(mapped_msg.getMessageIDHeader(), msg.getMessageIDHeader())
+        self.assertEqual(mapped_msg.getMessageIDHeaderHash(), msg.getMessageIDHeaderHash())
+        self.assertEqual(mapped_msg.getHash(diskHash=False), msg.getHash(diskHash=False))
+        if not drop_last_line:
+            # the disk hash covers the whole record range
+            self.assertEqual(mapped_msg.getHash(diskHash=True), msg.getHash(diskHash=True))
+
+        # the copies hash the same as the messages
+        for message in (msg, mapped_msg):
+            for diskHash in (False, True):
+                self.assertEqual(
+                    hashlib.sha256(b"".join(message.getHashData(diskHash=diskHash))).hexdigest(),
+                    message.getHash(diskHash=diskHash),
+                )
+
+    def test_drop_only_body_line(self):
+        _, mapped_msg = self.build_messages([
+            (None, b"From - Mon Jan 01 00:00:00 2024\n"),
+            ("Subject", b"Subject: mapped\n"),
+            ("body", b"\n"),
+        ])
+        mapped_msg.dropLastBodyLine()
+        self.assertEqual(mapped_msg.bodyRanges, [])
+        self.assertEqual(mapped_msg.getData("body"), b"")
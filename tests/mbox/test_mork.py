@@ -0,0 +1,101 @@
+"""
+Copyright 2023 Benjamen R. Meyer
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import ddt
+
+from tbdedup.mbox import mork
+
+from tests import base
+
+MESSAGE_SCOPE = "ns:msg:db:row:scope:msgs:all"
+FOLDER_SCOPE = "ns:msg:db:row:scope:dbfolderinfo:all"
+
+SAMPLE_MORK = r"""// <!-- <mdb:mork:z v="1.4"/> -->
+< <(a=c)> // (f=iso-8859-1)
+  (80=ns:msg:db:row:scope:msgs:all)(81=ns:msg:db:row:scope:dbfolderinfo:all)
+  (B8=flags)(B9=message-id)(BA=storeToken)(BB=subject)(BC=expungedBytes)>
+
+<(90=0)(91=1@tbdedup.test)(92=2@tbdedup.test)(93=a \) b$C3$A9)>
+{1:^80 {(k^BF:c)(s=9)}
+  [1(^B8=1)(^B9^91)(^BA^90)(^BB^93)]
+  [2(^B8=0)(^B9^92)(^BA=120)(^BB=line \
+continued)]}
+[1:^81(^BC=0)]
+@$${2{@
+{1:^80 {(k^BF:c)(s=9)}
+  [2(^B8=9)]}
+[-3:^80(^BA=240)]
+@$$}2}@
+@$${3{@
+{1:^80 {(k^BF:c)(s=9)}
+  [-1(^B9^92)]}
+@$$}3}@
+"""
+
+
+@ddt.ddt
+class TestMork(base.TestCase):
+
+    @ddt.data(
+        ("plain", "plain"),
+        (r"a \) b", "a ) b"),
+        (r"a \\ b", "a \\ b"),
+        ("$41$42", "AB"),
+        ("line \\\ncontinued", "line continued"),
+    )
+    @ddt.unpack
+    def test_unescape(self, value, expected_value):
+        self.assertEqual(mork.unescape(value), expected_value)
+
+    def test_parse(self):
+        rows = mork.MorkReader().parse(SAMPLE_MORK)
+        self.assertEqual(
+            rows,
+            {
+                # cut and refilled by the last group
+                (MESSAGE_SCOPE, "1"): {
+                    "message-id": "2@tbdedup.test",
+                },
+                # updated by a group
+                (MESSAGE_SCOPE, "2"): {
+                    "flags": "9",
+                    "message-id": "2@tbdedup.test",
+                    "storeToken": "120",
+                    "subject": "line continued",
+                },
+                # added by a group outside the table
+                (MESSAGE_SCOPE, "3"): {
+                    "storeToken": "240",
+                },
+                (FOLDER_SCOPE, "1"): {
+                    "expungedBytes": "0",
+                },
+            },
+        )
+
+    def test_parse_atoms(self):
+        reader = mork.MorkReader()
+        reader.parse(SAMPLE_MORK)
+        self.assertEqual(reader.columns["B9"], "message-id")
+        self.assertEqual(reader.atoms["93"], "a ) b\xc3\xa9")
+
+    @ddt.data(
+        "<(80=a)",
+        "]",
+        "{1:^80 [1(^80=a)]}}",
+    )
+    def test_parse_invalid(self, data):
+        with self.assertRaises(mork.ErrInvalidMork):
+            mork.MorkReader().parse(data)
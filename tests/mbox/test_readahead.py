@@ -0,0 +1,132 @@
+"""
+Copyright 2023 Benjamen R. Meyer
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import ddt
+import itertools
+import mmap
+import os
+import os.path
+
+from tbdedup.mbox import (
+    mboxfile,
+    mboxreadahead,
+)
+from tbdedup.utils import metrics
+
+from tests import base
+
+
+class AdviceRecorder(object):
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, fd, offset, length, advice):
+        self.calls.append((offset, length, advice))
+
+
+@ddt.ddt
+class TestReadAhead(base.TestCase):
+
+    def write_data(self, filename, length):
+        data = b''.join(
+            b'line %d\n' % index
+            for index in range(length)
+        )
+        with open(filename, "wb") as data_output:
+            data_output.write(data)
+        return data
+
+    @ddt.data(
+        # buffers smaller than a page are rounded up to one
+        (1, 0),
+        (1, 10000),
+        (mmap.PAGESIZE * 3, 10000),
+    )
+    @ddt.unpack
+    def test_read(self, buffer_size, line_count):
+        with base.KeepLocalDirClean() as cwd, \
+                base.ValueSwap(metrics, "REGISTRY", metrics.MetricsRegistry()):
+            filename = os.path.join(cwd.temp_dir.name, "data")
+            data = self.write_data(filename, line_count)
+
+            with mboxreadahead.open_read_ahead(filename, buffer_size) as data_input:
+                lines = []
+                offsets = []
+                for line in iter(data_input.readline, b''):
+                    lines.append(line)
+                    offsets.append(data_input.tell())
+                self.assertEqual(data_input.peek(1), b'')
+
+            self.assertEqual(b''.join(lines), data)
+            self.assertEqual(offsets, list(itertools.accumulate(len(line) for line in lines)))
+            self.assertIsNotNone(metrics.REGISTRY.get_counter(metrics.read_ahead_stalls))
+
+    def test_advice(self):
+        if not hasattr(os, 'posix_fadvise'):
+            self.skipTest('posix_fadvise is not available')
+        with base.KeepLocalDirClean() as cwd:
+            filename = os.path.join(cwd.temp_dir.name, "data")
+            data = self.write_data(filename, 10000)
+
+            recorder = AdviceRecorder()
+            with base.ValueSwap(os, "posix_fadvise", recorder):
+                with mboxreadahead.open_read_ahead(filename, mmap.PAGESIZE) as data_input:
+                    self.assertEqual(data_input.read(), data)
+
+            self.assertEqual(recorder.calls[0], (0, 0, os.POSIX_FADV_SEQUENTIAL))
+            # every buffer is dropped once it has been read
+            dropped = [
+                (offset, length)
+                for offset, length, advice in recorder.calls
+                if advice == os.POSIX_FADV_DONTNEED
+            ]
+            self.assertEqual(dropped[0], (0, mmap.PAGESIZE))
+            self.assertEqual(sum(length for _, length in dropped), len(data))
+
+    def test_close_early(self):
+        with base.KeepLocalDirClean() as cwd:
+            filename = os.path.join(cwd.temp_dir.name, "data")
+            self.write_data(filename, 100000)
+
+            data_input = mboxreadahead.open_read_ahead(filename, mmap.PAGESIZE)
+            self.assertEqual(data_input.readline(), b'line 0\n')
+            data_input.close()
+            self.assertTrue(data_input.raw.closed)
+            self.assertFalse(data_input.raw._thread.is_alive())
+
+    @ddt.data(False, True)
+    def test_buildSummary(self, use_content_boundary):
+        with base.KeepLocalDirClean() as cwd:
+            mbox_file = os.path.join(
+                cwd.temp_dir.name,
+                base.generate_mbox_filename(mboxfile.Mailbox.MBOXO, use_content_boundary),
+            )
+            base.EmailGenerator.GenerateMboxFile(mbox_file, 20, "From", False, use_content_boundary)
+
+            def summarize(read_ahead):
+                return [
+                    (
+                        msg.start_offset,
+                        msg.end_offset,
+                        msg.getHash(diskHash=False),
+                        msg.getHash(diskHash=True),
+                    )
+                    for msg in mboxfile.Mailbox(None, mbox_file).buildSummary(read_ahead=read_ahead)
+                ]
+
+            records = summarize(None)
+            self.assertEqual(len(records), 20)
+            self.assertEqual(summarize(mmap.PAGESIZE), records)
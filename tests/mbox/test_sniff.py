@@ -0,0 +1,127 @@
+"""
+Copyright 2023 Benjamen R. Meyer
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import bz2
+import ddt
+import gzip
+import lzma
+import os
+import os.path
+
+from tbdedup.mbox import mboxsniff
+
+from tests import base
+
+
+@ddt.ddt
+class TestMailboxSniffer(base.TestCase):
+
+    @ddt.data(
+        (b"From - Mon Jan 01 00:00:00 2024\nTo: foo@bar.com\n", True),
+        (b"From - Mon Jan 01 00:00:00 2024", True),
+        (b"  From - Mon Jan 01 00:00:00 2024\n", True),
+        (b"> From - Mon Jan 01 00:00:00 2024\n", False),
+        (b"From: foo@bar.com\n", False),
+        (b"version=\"9\"\nlogging=\"no\"\n", False),
+        (b"From - \0\0\0\0\n", False),
+        (b"From - " + (b"x" * mboxsniff.sniff_length), False),
+    )
+    @ddt.unpack
+    def test_sniff_data(self, input_data, expected_result):
+        self.assertEqual(
+            mboxsniff.MailboxSniffer.sniff_data(input_data),
+            expected_result,
+        )
+
+    @ddt.data(
+        ("Inbox", b"From - Mon Jan 01 00:00:00 2024\n", True),
+        ("Inbox.msf", b"From - Mon Jan 01 00:00:00 2024\n", False),
+        ("Inbox.mbox", b"From - Mon Jan 01 00:00:00 2024\n", True),
+        ("msgFilterRules", b"version=\"9\"\n", False),
+        ("empty", b"", False),
+    )
+    @ddt.unpack
+    def test_is_mbox(self, filename, file_data, expected_result):
+        with base.KeepLocalDirClean() as cwd:
+            the_file = os.path.join(cwd.temp_dir.name, filename)
+            with open(the_file, "wb") as data_output:
+                data_output.write(file_data)
+
+            sniffer = mboxsniff.MailboxSniffer()
+            self.assertEqual(sniffer.is_mbox(the_file), expected_result)
+
+    @ddt.data(
+        (gzip.compress, b"From - Mon Jan 01 00:00:00 2024\n", True),
+        (lzma.compress, b"From - Mon Jan 01 00:00:00 2024\n", True),
+        (bz2.compress, b"From - Mon Jan 01 00:00:00 2024\n", True),
+        (gzip.compress, b"version=\"9\"\n", False),
+        # truncated compressed data
+        (lambda data: gzip.compress(data)[:4], b"From - Mon Jan 01 00:00:00 2024\n", False),
+    )
+    @ddt.unpack
+    def test_is_mbox_compressed(self, compressor, file_data, expected_result):
+        with base.KeepLocalDirClean() as cwd:
+            the_file = os.path.join(cwd.temp_dir.name, "Archive.mbox.z")
+            with open(the_file, "wb") as data_output:
+                data_output.write(compressor(file_data))
+
+            sniffer = mboxsniff.MailboxSniffer()
+            self.assertEqual(sniffer.is_mbox(the_file), expected_result)
+
+    def test_is_mbox_missing_file(self):
+        with base.KeepLocalDirClean() as cwd:
+            sniffer = mboxsniff.MailboxSniffer()
+            self.assertFalse(
+                sniffer.is_mbox(os.path.join(cwd.temp_dir.name, "missing"))
+            )
+
+    def test_cache(self):
+        with base.KeepLocalDirClean() as cwd:
+            the_file = os.path.join(cwd.temp_dir.name, "Inbox")
+            with open(the_file, "wb") as data_output:
+                data_output.write(b"From - Mon Jan 01 00:00:00 2024\n")
+
+            sniffer = mboxsniff.MailboxSniffer()
+            self.assertTrue(sniffer.is_mbox(the_file))
+            self.assertTrue(sniffer.is_mbox(the_file))
+            self.assertEqual(sniffer.cache_misses, 1)
+            self.assertEqual(sniffer.cache_hits, 1)
+
+            # changing the file invalidates the cached verdict
+            with open(the_file, "wb") as data_output:
+                data_output.write(b"not an mbox file at all\n")
+            self.assertFalse(sniffer.is_mbox(the_file))
+            self.assertEqual(sniffer.cache_misses, 2)
+
+            # the cache survives a round trip to disk
+            cache_file = os.path.join(cwd.temp_dir.name, "sniff.json")
+            sniffer.save(cache_file)
+            loaded_sniffer = mboxsniff.MailboxSniffer()
+            loaded_sniffer.load(cache_file)
+            self.assertFalse(loaded_sniffer.is_mbox(the_file))
+            self.assertEqual(loaded_sniffer.cache_hits, 1)
+            self.assertEqual(loaded_sniffer.cache_misses, 0)
+
+    def test_load_missing_or_invalid_cache(self):
+        with base.KeepLocalDirClean() as cwd:
+            sniffer = mboxsniff.MailboxSniffer()
+            sniffer.load(os.path.join(cwd.temp_dir.name, "missing.json"))
+            self.assertEqual(sniffer.cache, {})
+
+            bad_cache = os.path.join(cwd.temp_dir.name, "bad.json")
+            with open(bad_cache, "wt") as data_output:
+                data_output.write("{not json")
+            sniffer.load(bad_cache)
+            self.assertEqual(sniffer.cache, {})
@@ -0,0 +1,129 @@
+"""
+Copyright 2023 Benjamen R. Meyer
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import ddt
+import os
+import os.path
+
+from tbdedup.mbox import (
+    mboxmessage,
+    mboxsummary,
+)
+
+from tests import base
+
+
+def write_mbox(mbox_filename, statuses):
+    base.generate_mbox(
+        mbox_filename,
+        [
+            (f"<{index}@tbdedup.test>", b"body %d\n" % index, status)
+            for index, status in enumerate(statuses)
+        ],
+        subject="summary",
+    )
+
+
+def set_mtime_before(summary_filename, mbox_filename):
+    mbox_mtime = os.stat(mbox_filename).st_mtime
+    os.utime(summary_filename, (mbox_mtime - 10, mbox_mtime - 10))
+
+
+@ddt.ddt
+class TestMailboxSummary(base.TestCase):
+
+    def test_summary_filename(self):
+        with base.KeepLocalDirClean() as cwd:
+            mbox_filename = os.path.join(cwd.temp_dir.name, "Inbox")
+            write_mbox(mbox_filename, [0x0001])
+            link_filename = os.path.join(cwd.temp_dir.name, "plan_Inbox")
+            os.symlink(mbox_filename, link_filename)
+            # the summary is next to the file, not the link
+            self.assertEqual(
+                mboxsummary.summary_filename(link_filename),
+                os.path.realpath(mbox_filename) + ".msf",
+            )
+
+    def test_read_summary(self):
+        with base.KeepLocalDirClean() as cwd:
+            mbox_filename = os.path.join(cwd.temp_dir.name, "Inbox")
+            write_mbox(mbox_filename, [0x0001, 0x0009, 0x0001])
+            self.assertIsNone(mboxsummary.read_summary(mbox_filename))
+
+            base.generate_summary(mbox_filename)
+            messages = mboxsummary.read_summary(mbox_filename)
+            records = list(mboxsummary.mboxfile.Mailbox(None, mbox_filename).buildSummary())
+            self.assertEqual(
+                [
+                    (msg.start_offset, msg.end_offset, msg.getMessageIDKey(), msg.isExpunged())
+                    for msg in messages
+                ],
+                [
+                    (record.start_offset, record.end_offset, record.getMessageIDKey(), record.isExpunged())
+                    for record in records
+                ],
+            )
+            self.assertTrue(mboxsummary.validate_summary(mbox_filename, messages))
+
+            with self.assertRaises(mboxmessage.ErrNotParsed):
+                messages[0].getHash()
+            with self.assertRaises(mboxmessage.ErrNotParsed):
+                messages[0].getHashData()
+
+    def test_read_summary_generated_message_id(self):
+        with base.KeepLocalDirClean() as cwd:
+            mbox_filename = os.path.join(cwd.temp_dir.name, "Inbox")
+            with open(mbox_filename, "wb") as mbox_output:
+                mbox_output.write(
+                    b"From - Mon Jan 01 00:00:00 2024\n"
+                    b"Subject: anonymous\n"
+                    b"\n"
+                    b"body\n"
+                )
+            base.generate_summary(mbox_filename)
+            messages = mboxsummary.load_summary(mbox_filename)
+            # Thunderbird's made up ID is not a Message-ID
+            self.assertIsNone(messages[0].getMessageIDKey())
+
+    @ddt.data(
+        # stale summary
+        ({"stale": True}),
+        # deleted messages still in the file
+        ({"expunged_bytes": 120}),
+        # summary of another file
+        ({"message_ids": ["0@tbdedup.test", "2@tbdedup.test", "1@tbdedup.test"]}),
+        # missing a message so the one before runs into it
+        ({"message_ids": ["0@tbdedup.test", "1@tbdedup.test"]}),
+    )
+    def test_load_summary_unusable(self, case):
+        with base.KeepLocalDirClean() as cwd:
+            mbox_filename = os.path.join(cwd.temp_dir.name, "Inbox")
+            write_mbox(mbox_filename, [0x0001, 0x0001, 0x0001])
+            summary_filename = base.generate_summary(
+                mbox_filename,
+                expunged_bytes=case.get("expunged_bytes", 0),
+                message_ids=case.get("message_ids"),
+            )
+            if case.get("stale"):
+                set_mtime_before(summary_filename, mbox_filename)
+
+            self.assertIsNone(mboxsummary.load_summary(mbox_filename))
+
+    def test_summary_message(self):
+        msg = mboxmessage.SummaryMessage(3, 100, 200, "a@b", 0x10009)
+        self.assertEqual(msg.getMsgId(), 3)
+        self.assertEqual(msg.getMessageIDKey(), "a@b")
+        self.assertEqual(msg.status, 0x0009)
+        self.assertTrue(msg.isExpunged())
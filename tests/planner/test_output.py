@@ -15,6 +15,8 @@ limitations under the License.
 """
 import ddt
 import datetime
+import os
+import os.path
 from unittest import mock
 
 from tbdedup.planner import output
@@ -69,28 +71,84 @@ class TestPlannerOutput(base.TestCase):
         )
         self.assertEqual(result, expected_result)
 
+    @ddt.data(
+        (
+            [],
+            "",
+            0,
+        ),
+        (
+            ["20111104_000523_foo"],
+            "",
+            1,
+        ),
+        (
+            ["20111104_000523_foo", "20111104_000523_001_foo", "20111104_000523_002_foo"],
+            "",
+            3,
+        ),
+        (
+            ["20111104_000523_017_foo", "20111104_000523_1234_foo"],
+            "",
+            1235,
+        ),
+        (
+            # different timestamps, names, and extensions are ignored
+            ["20111104_000522_005_foo", "20111104_000523_005_barfoo", "20111104_000523_005_foo.json"],
+            "",
+            0,
+        ),
+        (
+            ["20111104_000523_foo.json", "20111104_000523_003_foo.json", "20111104_000523_009_foo"],
+            "json",
+            4,
+        ),
+    )
+    @ddt.unpack
+    def test_next_counter(self, existing_names, input_ext, expected_counter):
+        with base.KeepLocalDirClean() as cwd:
+            for existing_name in existing_names:
+                with open(existing_name, "wt") as data_output:
+                    data_output.write("existing")
+
+            result = output.next_counter(
+                datetime.datetime.fromisoformat('2011-11-04 00:05:23.283+00:00'),  # 20111104_000523
+                "foo",
+                input_ext,
+                cwd.temp_dir.name,
+            )
+            self.assertEqual(result, expected_counter)
+
     @ddt.data(
         (
             10000,
             datetime.datetime.fromisoformat('2011-11-04 00:05:23.283+00:00'),  # 20111104_000523
-            [False,],
+            [],
+            0,
             "20111104_000523_dedup_preplanner.json",
             False,
         ),
         (
             10000,
             datetime.datetime.fromisoformat('2011-11-04 00:05:23.283+00:00'),  # 20111104_000523
-            [True, False, ],
+            ["20111104_000523_dedup_preplanner.json"],
+            0,
+            "20111104_000523_001_dedup_preplanner.json",
+            False,
+        ),
+        (
+            10000,
+            datetime.datetime.fromisoformat('2011-11-04 00:05:23.283+00:00'),  # 20111104_000523
+            [],
+            1,
             "20111104_000523_001_dedup_preplanner.json",
             False,
         ),
         (
             3,
             datetime.datetime.fromisoformat('2011-11-04 00:05:23.283+00:00'),  # 20111104_000523
-            [
-                True
-                for _ in range(30)
-            ],
+            [],
+            30,
             "20111104_000523_001_dedup_preplanner.json",
             True,
         )
@@ -98,36 +156,56 @@ class TestPlannerOutput(base.TestCase):
     @ddt.unpack
     def test_get_filename(
         self,
-        input_max_counter, input_time, input_path_exists,
+        input_max_counter, input_time, input_existing, input_races,
         expected_output, expected_exception
     ):
-        with mock.patch(
-            "tbdedup.planner.output.utcnow"
-        ) as mock_time:
-            mock_time.return_value = input_time
+        with base.KeepLocalDirClean():
+            for existing_name in input_existing:
+                with open(existing_name, "wt") as data_output:
+                    data_output.write("existing")
+
+            real_open = os.open
+            races = {
+                "remaining": input_races,
+            }
+
+            def racing_open(*args, **kwargs):
+                # simulate another run claiming the name after the
+                # directory was listed
+                if races["remaining"] > 0:
+                    races["remaining"] = races["remaining"] - 1
+                    raise FileExistsError("claimed by another run")
+                return real_open(*args, **kwargs)
+
             with mock.patch(
-                "os.path.exists",
-            ) as mock_path_exists:
-                mock_path_exists.side_effect = input_path_exists
-                with base.ValueSwap(
-                    output,
-                    "max_looping",
-                    input_max_counter,
-                ):
-                    try:
-                        result = output.get_filename()
-                    except Exception as ex:
-                        if expected_exception:
-                            self.assertIsInstance(ex, output.ExcessiveLoopError)
+                "tbdedup.planner.output.utcnow"
+            ) as mock_time:
+                mock_time.return_value = input_time
+                with mock.patch(
+                    "os.open",
+                ) as mock_open:
+                    mock_open.side_effect = racing_open
+                    with base.ValueSwap(
+                        output,
+                        "max_looping",
+                        input_max_counter,
+                    ):
+                        try:
+                            result = output.get_filename()
+                        except Exception as ex:
+                            if expected_exception:
+                                self.assertIsInstance(ex, output.ExcessiveLoopError)
+                            else:
+                                self.assertTrue(False, msg=f"Unexpected exception received - {ex}")
                         else:
-                            self.assertTrue(False, msg="Unexpected exception received")
-                    else:
-                        self.assertEqual(result, expected_output)
+                            self.assertEqual(result, expected_output)
+                            self.assertTrue(os.path.isfile(result))
 
     @ddt.data(
         (
             10000,
             datetime.datetime.fromisoformat('2011-11-04 00:05:23.283+00:00'),  # 20111104_000523
+            [],
             [None, ],
             "20111104_000523_dedup_planner",
             False,
@@ -135,13 +213,23 @@ class TestPlannerOutput(base.TestCase):
         (
             10000,
             datetime.datetime.fromisoformat('2011-11-04 00:05:23.283+00:00'),  # 20111104_000523
+            [],
             [FileExistsError, None, ],
             "20111104_000523_001_dedup_planner",
             False,
         ),
+        (
+            10000,
+            datetime.datetime.fromisoformat('2011-11-04 00:05:23.283+00:00'),  # 20111104_000523
+            ["20111104_000523_dedup_planner", "20111104_000523_001_dedup_planner"],
+            [None, ],
+            "20111104_000523_002_dedup_planner",
+            False,
+        ),
         (
             3,
             datetime.datetime.fromisoformat('2011-11-04 00:05:23.283+00:00'),  # 20111104_000523
+            [],
             [
                 FileExistsError
                 for _ in range(30)
@@ -153,28 +241,32 @@ class TestPlannerOutput(base.TestCase):
     @ddt.unpack
     def test_get_directory(
         self,
-        input_max_counter, input_time, input_dir_exists,
+        input_max_counter, input_time, input_existing, input_dir_exists,
         expected_output, expected_exception
     ):
-        with mock.patch(
-            "tbdedup.planner.output.utcnow"
-        ) as mock_time:
-            mock_time.return_value = input_time
+        with base.KeepLocalDirClean():
+            for existing_name in input_existing:
+                os.mkdir(existing_name)
+
             with mock.patch(
-                "os.mkdir",
-            ) as mock_dir_exists:
-                mock_dir_exists.side_effect = input_dir_exists
-                with base.ValueSwap(
-                    output,
-                    "max_looping",
-                    input_max_counter,
-                ):
-                    try:
-                        result = output.get_directory()
-                    except Exception as ex:
-                        if expected_exception:
-                            self.assertIsInstance(ex, output.ExcessiveLoopError)
+                "tbdedup.planner.output.utcnow"
+            ) as mock_time:
+                mock_time.return_value = input_time
+                with mock.patch(
+                    "os.mkdir",
+                ) as mock_dir_exists:
+                    mock_dir_exists.side_effect = input_dir_exists
+                    with base.ValueSwap(
+                        output,
+                        "max_looping",
+                        input_max_counter,
+                    ):
+                        try:
+                            result = output.get_directory()
+                        except Exception as ex:
+                            if expected_exception:
+                                self.assertIsInstance(ex, output.ExcessiveLoopError)
+                            else:
+                                self.assertTrue(False, msg=f"Unexpected exception received - {ex}")
                         else:
-                            self.assertTrue(False, msg=f"Unexpected exception received - {ex}")
-                    else:
-                        self.assertEqual(result, expected_output)
+                            self.assertEqual(result, expected_output)
@@ -250,6 +250,37 @@ class TestPreplanner(base.AsyncioTestCase):
                     plan.files
                 )
 
+    def test_json_records(self):
+        with tempfile.TemporaryDirectory() as location:
+            the_options = base.GenericOptions(
+                location=location,
+                folder_pattern="Inbox.sbd",
+            )
+
+            p = walk.Preplanner(the_options)
+            plan_set = {
+                f"root_{i:03}": f"abs_{i:03}"
+                for i in range(1, 10)
+            }
+            for k, v in plan_set.items():
+                p.init_file(k, location, os.path.join(location, v))
+
+            records = list(p.json_records())
+            self.assertEqual(len(records), len(plan_set) + 1)
+            self.assertEqual(records[0]["folder_pattern"], "Inbox.sbd")
+            self.assertEqual(records[0]["location"], location)
+            self.assertEqual(
+                records[0]["preplanner"][keys.preplan_location],
+                location,
+            )
+            for record in records[1:]:
+                root_file = record[keys.preplan_record_root]
+                self.assertIn(root_file, plan_set)
+                self.assertEqual(
+                    record[keys.preplan_record_plan].files,
+                    [os.path.join(location, plan_set[root_file])],
+                )
+
     @ddt.data(
         (0, 0,),
         (5, 0,),
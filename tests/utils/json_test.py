@@ -0,0 +1,113 @@
+"""
+Copyright 2023 Benjamen R. Meyer
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import ddt
+import json as pyjson
+import os.path
+import types
+
+from tbdedup.utils import json
+
+from tests import base
+
+
+class JsonObject(object):
+
+    def __init__(self, value):
+        self.value = value
+
+    def __json__(self):
+        return {
+            "value": self.value,
+        }
+
+
+@ddt.ddt
+class TestUtilsJson(base.TestCase):
+
+    @ddt.data(
+        (False, ),
+        (True, ),
+    )
+    @ddt.unpack
+    def test_dump_to_file(self, compact):
+        data = {
+            "alpha": [1, 2, 3],
+            "beta": JsonObject("gamma"),
+        }
+        expected_data = {
+            "alpha": [1, 2, 3],
+            "beta": {
+                "value": "gamma",
+            },
+        }
+        with base.KeepLocalDirClean() as cwd:
+            json_file = os.path.join(cwd.temp_dir.name, "data.json")
+            json.dump_to_file(json_file, data, compact=compact)
+
+            with open(json_file, "rt") as json_input:
+                json_string = json_input.read()
+
+            self.assertEqual(
+                json_string,
+                pyjson.dumps(
+                    expected_data,
+                    indent=None if compact else 4,
+                    separators=(',', ':') if compact else None,
+                )
+            )
+            self.assertEqual(json.load_from_file(json_file), expected_data)
+
+    def test_dump_file_object(self):
+        with base.KeepLocalDirClean() as cwd:
+            json_file = os.path.join(cwd.temp_dir.name, "data.json")
+            with open(os.path.join(cwd.temp_dir.name, "other"), "wt") as other:
+                json.dump_to_file(json_file, {"file": other})
+                expected_name = other.name
+            self.assertEqual(
+                json.load_from_file(json_file),
+                {"file": expected_name},
+            )
+
+    def test_lines(self):
+        records = [
+            {"index": index, "object": JsonObject(index)}
+            for index in range(10)
+        ]
+        with base.KeepLocalDirClean() as cwd:
+            json_file = os.path.join(cwd.temp_dir.name, "data.jsonl")
+            # records may be generated lazily
+            json.dump_lines_to_file(json_file, (r for r in records))
+
+            with open(json_file, "rt") as json_input:
+                self.assertEqual(len(json_input.readlines()), len(records))
+
+            loaded = json.load_lines_from_file(json_file)
+            self.assertIsInstance(loaded, types.GeneratorType)
+            self.assertEqual(
+                list(loaded),
+                [
+                    {"index": index, "object": {"value": index}}
+                    for index in range(10)
+                ]
+            )
+
+    def test_dumps_line(self):
+        line = json.dumps_line({"alpha": [1, 2], "beta": JsonObject("gamma")})
+        self.assertNotIn("\n", line)
+        self.assertEqual(
+            pyjson.loads(line),
+            {"alpha": [1, 2], "beta": {"value": "gamma"}},
+        )
@@ -0,0 +1,90 @@
+"""
+Copyright 2023 Benjamen R. Meyer
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import ddt
+import os.path
+
+from tbdedup.utils import (
+    json,
+    metrics,
+)
+
+from tests import base
+
+
+@ddt.ddt
+class TestUtilsMetricsRegistry(base.TestCase):
+
+    def test_counters(self):
+        registry = metrics.MetricsRegistry()
+        self.assertEqual(registry.get_counter(metrics.bytes_read), 0)
+        registry.increment(metrics.bytes_read, 100)
+        registry.increment(metrics.bytes_read, 50)
+        registry.increment(metrics.messages_parsed)
+        self.assertEqual(registry.get_counter(metrics.bytes_read), 150)
+        self.assertEqual(registry.get_counter(metrics.messages_parsed), 1)
+
+        registry.reset()
+        self.assertEqual(registry.get_counter(metrics.bytes_read), 0)
+
+    def test_phases(self):
+        registry = metrics.MetricsRegistry()
+        registry.record_phase("foo", 2.0)
+        registry.record_phase("foo", 1.0)
+        registry.record_phase("bar", 5.0)
+        data = registry.__json__()
+        self.assertEqual(
+            data["phases"]["foo"],
+            {
+                "count": 2,
+                "total_seconds": 3.0,
+                "min_seconds": 1.0,
+                "max_seconds": 2.0,
+            }
+        )
+        self.assertEqual(data["phases"]["bar"]["count"], 1)
+
+    def test_prometheus(self):
+        registry = metrics.MetricsRegistry()
+        registry.increment(metrics.bytes_written, 42)
+        registry.set_gauge("exit_code", 0)
+        registry.record_phase("Say \"hi\"", 1.5)
+        text = registry.to_prometheus()
+        self.assertIn("# TYPE tbdedup_bytes_written_total counter\n", text)
+        self.assertIn("tbdedup_bytes_written_total 42\n", text)
+        self.assertIn("tbdedup_exit_code 0\n", text)
+        self.assertIn('tbdedup_phase_duration_seconds_sum{phase="Say \\"hi\\""} 1.5\n', text)
+        self.assertIn('tbdedup_phase_duration_seconds_count{phase="Say \\"hi\\""} 1\n', text)
+
+    @ddt.data(
+        (metrics.metrics_format_json, ),
+        (metrics.metrics_format_prometheus, ),
+    )
+    @ddt.unpack
+    def test_dump_to_file(self, metrics_format):
+        registry = metrics.MetricsRegistry()
+        registry.increment(metrics.messages_written, 7)
+        with base.KeepLocalDirClean() as cwd:
+            metrics_file = os.path.join(cwd.temp_dir.name, "metrics.out")
+            registry.dump_to_file(metrics_file, metrics_format)
+            if metrics_format == metrics.metrics_format_json:
+                data = json.load_from_file(metrics_file)
+                self.assertEqual(data["counters"][metrics.messages_written], 7)
+            else:
+                with open(metrics_file, "rt") as metrics_input:
+                    self.assertIn(
+                        "tbdedup_messages_written_total 7\n",
+                        metrics_input.read(),
+                    )
@@ -0,0 +1,96 @@
+"""
+Copyright 2023 Benjamen R. Meyer
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import os
+import pstats
+import tracemalloc
+
+from tbdedup.utils import (
+    profiling,
+    time,
+)
+
+from tests import base
+
+
+class TestUtilsProfiling(base.TestCase):
+
+    def tearDown(self):
+        profiling.stop()
+        super(TestUtilsProfiling, self).tearDown()
+
+    def test_no_profiler(self):
+        self.assertIsNone(profiling.ACTIVE)
+        with time.TimeTracker("no-profiler"):
+            pass
+
+    def test_create(self):
+        self.assertIsInstance(
+            profiling.create(profiling.profile_cpu, "."),
+            profiling.CpuProfiler,
+        )
+        self.assertIsInstance(
+            profiling.create(profiling.profile_memory, "."),
+            profiling.MemoryProfiler,
+        )
+        with self.assertRaises(ValueError):
+            profiling.create("foo", ".")
+
+    def test_cpu(self):
+        with base.KeepLocalDirClean() as cwd:
+            output_directory = os.path.join(cwd.temp_dir.name, "profiles")
+            profiling.start(profiling.create(profiling.profile_cpu, output_directory))
+            with time.TimeTracker("Full Operation"):
+                with time.TimeTracker("Inner/Phase"):
+                    sum(range(1000))
+                # concurrent phases completing out of order
+                first = time.TimeTracker("Concurrent")
+                second = time.TimeTracker("Concurrent")
+                first.__enter__()
+                second.__enter__()
+                first.__exit__(None, None, None)
+                second.__exit__(None, None, None)
+            profiling.stop()
+            self.assertIsNone(profiling.ACTIVE)
+
+            stats_files = sorted(os.listdir(output_directory))
+            self.assertEqual(
+                stats_files,
+                [
+                    "tbdedup-001-Inner_Phase.pstats",
+                    "tbdedup-002-Concurrent.pstats",
+                    "tbdedup-003-Concurrent.pstats",
+                    "tbdedup-004-Full_Operation.pstats",
+                    "tbdedup-005-run.pstats",
+                ],
+            )
+            for stats_file in stats_files:
+                pstats.Stats(os.path.join(output_directory, stats_file))
+
+    def test_memory(self):
+        with base.KeepLocalDirClean() as cwd:
+            output_directory = os.path.join(cwd.temp_dir.name, "profiles")
+            profiling.start(profiling.create(profiling.profile_memory, output_directory))
+            self.assertTrue(tracemalloc.is_tracing())
+            with time.TimeTracker("Allocator"):
+                data = [bytes(1024) for _ in range(100)]
+            profiling.stop()
+            self.assertFalse(tracemalloc.is_tracing())
+
+            with open(os.path.join(output_directory, "tbdedup-memory.txt"), "rt") as report:
+                report_data = report.read()
+            self.assertIn("== start of Allocator", report_data)
+            self.assertIn("== end of Allocator", report_data)
+            self.assertIn("== end of run", report_data)
@@ -0,0 +1,145 @@
+"""
+Copyright 2023 Benjamen R. Meyer
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import ddt
+
+from tbdedup.utils import (
+    metrics,
+    progress,
+)
+
+from tests import base
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@ddt.ddt
+class TestUtilsProgress(base.TestCase):
+
+    @ddt.data(
+        (None, "unknown"),
+        (0, "0:00:00"),
+        (59.9, "0:00:59"),
+        (3725, "1:02:05"),
+    )
+    @ddt.unpack
+    def test_format_duration(self, seconds, expected_result):
+        self.assertEqual(progress.format_duration(seconds), expected_result)
+
+    def test_percentage(self):
+        clock = FakeClock()
+        tracker = progress.ProgressTracker("foo", clock=clock)
+        self.assertEqual(tracker.percentage, 0.0)
+
+        tracker.add_total(200)
+        tracker.add_total(200)
+        tracker.advance(100)
+        self.assertEqual(tracker.percentage, 25.0)
+
+        # never report more than complete
+        tracker.advance(1000)
+        self.assertEqual(tracker.percentage, 100.0)
+
+    def test_throughput_and_eta(self):
+        clock = FakeClock()
+        tracker = progress.ProgressTracker("foo", total_bytes=10000, clock=clock)
+        tracker.advance(100)
+        # not enough time passed for a sample
+        self.assertIsNone(tracker.bytes_per_second)
+        self.assertIsNone(tracker.eta_seconds)
+
+        clock.now = 1.0
+        tracker.advance(900)
+        self.assertEqual(tracker.bytes_per_second, 1000.0)
+        self.assertEqual(tracker.eta_seconds, 9.0)
+
+        # moving average weighs in the new sample
+        clock.now = 2.0
+        tracker.advance(2000)
+        expected_rate = (progress.smoothing * 2000.0) + ((1.0 - progress.smoothing) * 1000.0)
+        self.assertAlmostEqual(tracker.bytes_per_second, expected_rate)
+        self.assertAlmostEqual(tracker.eta_seconds, 7000.0 / expected_rate)
+
+    def test_listeners(self):
+        clock = FakeClock()
+        tracker = progress.ProgressTracker("foo", total_bytes=1000, clock=clock)
+        snapshots = []
+        tracker.add_listener(snapshots.append)
+
+        def bad_listener(snapshot):
+            raise RuntimeError("listener failure")
+        tracker.add_listener(bad_listener)
+
+        tracker.advance(100)
+        self.assertEqual(len(snapshots), 0)
+
+        # reports are limited to the interval
+        clock.now = progress.report_interval
+        tracker.advance(100)
+        self.assertEqual(len(snapshots), 1)
+        self.assertEqual(snapshots[0]["name"], "foo")
+        self.assertEqual(snapshots[0]["completed_bytes"], 200)
+        self.assertEqual(snapshots[0]["percentage"], 20.0)
+
+        tracker.advance(100)
+        self.assertEqual(len(snapshots), 1)
+
+        tracker.report()
+        self.assertEqual(len(snapshots), 2)
+        self.assertEqual(snapshots[1]["completed_bytes"], 300)
+
+    def test_create(self):
+        with base.ValueSwap(metrics, "REGISTRY", metrics.MetricsRegistry()):
+            tracker = progress.create("foo", total_bytes=100)
+            tracker.advance(50)
+            tracker.report()
+            gauges = metrics.REGISTRY.__json__()["gauges"]
+            self.assertEqual(gauges["progress_total_bytes"], 100)
+            self.assertEqual(gauges["progress_completed_bytes"], 50)
+            self.assertEqual(gauges["progress_percentage"], 50.0)
+            self.assertNotIn("progress_eta_seconds", gauges)
+
+    def test_cancel(self):
+        tracker = progress.ProgressTracker("foo", total_bytes=100)
+        tracker.advance(10)
+        tracker.cancel()
+        with self.assertRaises(progress.ErrCancelled):
+            tracker.advance(10)
+        self.assertEqual(tracker.completed_bytes, 10)
+
+    def test_files(self):
+        clock = FakeClock()
+        tracker = progress.ProgressTracker("foo", total_bytes=3 * 1024 * 1024, clock=clock)
+        tracker.start_file("a", 2 * 1024 * 1024)
+        tracker.start_file("b", 1024 * 1024)
+        clock.now = 2.0
+        tracker.advance(2 * 1024 * 1024, filename="a")
+        tracker.advance(1024 * 1024, filename="b")
+        tracker.finish_file("b")
+        # finishing a file that was never started is ignored
+        tracker.finish_file("c")
+
+        snapshot = tracker.snapshot()
+        self.assertEqual(snapshot["files_completed"], 1)
+        self.assertEqual(list(snapshot["files"].keys()), ["a"])
+        self.assertEqual(snapshot["files"]["a"]["completed_bytes"], 2 * 1024 * 1024)
+        self.assertEqual(snapshot["files"]["a"]["mb_per_second"], 1.0)
@@ -16,7 +16,10 @@ limitations under the License.
 import datetime
 import time as pytime
 
-from tbdedup.utils import time
+from tbdedup.utils import (
+    metrics,
+    time,
+)
 
 from tests import base
 
@@ -43,6 +46,17 @@ class TestUtilsTimeTracker(base.TestCase):
             time_tracker.duration.total_seconds(),
         )
 
+    def test_record_metrics(self):
+        with base.ValueSwap(metrics, "REGISTRY", metrics.MetricsRegistry()):
+            time_tracker = time.TimeTracker("test-record-metrics")
+            time_tracker.start = datetime.datetime.utcnow()
+            time_tracker.end = time_tracker.start + datetime.timedelta(seconds=20)
+            time_tracker.record_log()
+            self.assertEqual(
+                metrics.REGISTRY.phases["test-record-metrics"]["total_seconds"],
+                20,
+            )
+
     def test_with(self):
         expected_duration = 1
         time_tracker = time.TimeTracker("test-with")